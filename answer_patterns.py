@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from question_dedup import normalize_question
+
+# Records between trims of the table down to max_patterns
+PRUNE_EVERY = 1000
+
+
+def answer_pattern(answers: Dict, question_traits: Dict, question_texts: Dict) -> Tuple[str, ...]:
+    """Canonical (question, answer) features of a game's yes/no answers
+
+    Engine questions are named by trait key and other questions by their
+    normalised text, so the same answers to differently numbered or slightly
+    reworded questions give the same pattern.
+    """
+    features = set()
+    for question_id, answer in answers.items():
+        if answer is None:
+            continue
+        if question_id in question_traits:
+            feature = question_traits[question_id]
+        elif question_texts.get(question_id):
+            feature = 'q:' + ' '.join(normalize_question(question_texts[question_id]))
+        else:
+            continue
+        features.add(f"{feature}={'y' if answer else 'n'}")
+    return tuple(sorted(features))
+
+
+def pattern_signature(pattern: Iterable[str]) -> bytes:
+    return hashlib.blake2b('\n'.join(pattern).encode('utf-8'), digest_size=16).digest()
+
+
+class AnswerPatternIndex:
+    """Confirmed identifications of past games, keyed by their answer pattern
+
+    Each row counts how often a person was confirmed (hits) or rejected
+    (misses) after a given pattern. A lookup returns a person when enough
+    confirmed games ended with them and they dominate everything else seen
+    for that pattern. Stored in SQLite so every worker process shares it.
+    """
+
+    def __init__(self, path: str, min_answers: int = 4, min_support: int = 3, min_share: float = 0.8,
+                 max_patterns: int = 100000):
+        self.path = path
+        self.min_answers = min_answers
+        self.min_support = min_support
+        self.min_share = min_share
+        self.max_patterns = max_patterns
+        self.lookups = 0
+        self.matches = 0
+        self._writes = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS patterns ('
+            'signature BLOB NOT NULL, person TEXT NOT NULL, info TEXT NOT NULL, '
+            'hits INTEGER NOT NULL DEFAULT 0, misses INTEGER NOT NULL DEFAULT 0, last_seen REAL NOT NULL, '
+            'PRIMARY KEY (signature, person)) WITHOUT ROWID'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS patterns_last_seen ON patterns (last_seen)')
+
+    @classmethod
+    def from_env(cls) -> Optional['AnswerPatternIndex']:
+        """Build an index from ANSWER_PATTERNS_* environment variables, or None if disabled"""
+        if os.getenv('ANSWER_PATTERNS_ENABLED', 'true').lower() != 'true':
+            return None
+        return cls(
+            os.getenv('ANSWER_PATTERNS_PATH', 'answer_patterns.db'),
+            min_answers=int(os.getenv('ANSWER_PATTERNS_MIN_ANSWERS', '4')),
+            min_support=int(os.getenv('ANSWER_PATTERNS_MIN_SUPPORT', '3')),
+            min_share=float(os.getenv('ANSWER_PATTERNS_MIN_SHARE', '0.8')),
+            max_patterns=int(os.getenv('ANSWER_PATTERNS_MAX', '100000')),
+        )
+
+    def lookup(self, pattern: Tuple[str, ...]) -> Optional[Dict]:
+        """Person confirmed often enough after this pattern, with the share as confidence"""
+        if len(pattern) < self.min_answers:
+            return None
+        with self._lock:
+            self.lookups += 1
+            rows = self._conn.execute(
+                'SELECT person, info, hits, misses FROM patterns WHERE signature = ?', (pattern_signature(pattern),)
+            ).fetchall()
+        if not rows:
+            return None
+
+        _, info, hits, misses = max(rows, key=lambda row: row[2] - row[3])
+        share = hits / (sum(row[2] for row in rows) + misses)
+        if hits < self.min_support or share < self.min_share:
+            return None
+        with self._lock:
+            self.matches += 1
+        return dict(json.loads(info), confidence=round(share, 3))
+
+    def record(self, pattern: Tuple[str, ...], person: Dict, correct: bool):
+        """Count a guess of person after pattern as confirmed or rejected by the player"""
+        if len(pattern) < self.min_answers or not person or not person.get('name'):
+            return
+        info = json.dumps({key: person.get(key, '') for key in ('name', 'description', 'image')},
+                          separators=(',', ':'))
+        column = 'hits' if correct else 'misses'
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f'INSERT INTO patterns (signature, person, info, {column}, last_seen) VALUES (?, ?, ?, 1, ?) '
+                f'ON CONFLICT (signature, person) DO UPDATE SET {column} = {column} + 1, last_seen = excluded.last_seen',
+                (pattern_signature(pattern), person['name'], info, now)
+            )
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                self._prune()
+
+    def _prune(self):
+        # Keep the most recently confirmed patterns up to the cap
+        self._conn.execute(
+            'DELETE FROM patterns WHERE last_seen <= ('
+            'SELECT last_seen FROM patterns ORDER BY last_seen DESC LIMIT 1 OFFSET ?)',
+            (self.max_patterns,)
+        )
+
+    def stats(self) -> Dict:
+        with self._lock:
+            count, confirmed = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM patterns'
+            ).fetchone()
+            return {
+                'patterns': count,
+                'confirmed_games': confirmed,
+                'lookups': self.lookups,
+                'matches': self.matches,
+            }
@@ -1,28 +1,32 @@
 import logging
-from datetime import datetime
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('akinator_game.log'),
-        logging.StreamHandler()
-    ]
-)
+from dotenv import load_dotenv
+from game_logging import LLM, STATE, bind_log_context, setup_logging, update_log_context
+
+# Logging is configured from the environment, so read .env first
+load_dotenv()
+
+# Set up logging (queue-backed background writer, see game_logging.py)
+setup_logging()
 logger = logging.getLogger(__name__)
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 import json
 import os
 import random
-from datetime import datetime
-import requests
-from dotenv import load_dotenv
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from llm_integration import LLMIntegration
-
-load_dotenv()
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, DUPLICATE_QUESTIONS, FALLBACK_QUESTIONS, GAME_QUESTIONS, REGISTRY,
+    record_http_request, timed_stage
+)
+from opening_tree import OpeningTree
+from answer_patterns import AnswerPatternIndex, answer_pattern
+from question_dedup import QuestionIndex
+from bayesian_engine import BayesianEngine
+from session_store import MemorySessionStore, create_session_store, new_game_id
 
 app = Flask(__name__)
 CORS(app)
@@ -30,27 +34,122 @@ CORS(app)
 # Initialize LLM integration
 llm_integration = LLMIntegration()
 
+# Precomputed opening questions, built offline with `python opening_tree.py`
+opening_tree = OpeningTree.load(os.getenv('OPENING_TREE_PATH', 'opening_tree.bin'))
+
+# Local person x trait model used for questions and guesses when no LLM answers
+bayesian_engine = BayesianEngine.load(os.getenv('PEOPLE_TRAITS_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'people_traits.json')))
+
+# Near-duplicate detector for generated questions; a repeat is regenerated up to
+# QUESTION_DEDUP_RETRIES times before falling back to the local engine
+question_index = QuestionIndex.from_env()
+QUESTION_DEDUP_RETRIES = int(os.getenv('QUESTION_DEDUP_RETRIES', '1'))
+
+# Confirmed identifications of earlier games, used to guess without the LLM when the answers repeat
+answer_patterns = AnswerPatternIndex.from_env()
+
+# Worker threads for running the guess check and next-question generation concurrently
+PARALLEL_TURN = os.getenv('PARALLEL_TURN', 'true').lower() == 'true'
+turn_executor = ThreadPoolExecutor(max_workers=int(os.getenv('TURN_WORKERS', '16')), thread_name_prefix='turn')
+
 class AkinatorGame:
     def __init__(self):
         self.asked_questions = set()
         self.answers = {}
+        self.question_traits = {}
+        # Text of every question asked, so prompts and the duplicate check can see it
+        self.question_texts = {}
         self.people_considered = []
         self.current_confidence = 0.0
         self.best_match = None
+        # (task, model) behind the LLM's current best match, for guess feedback
+        self.guess_source = None
+        # Session key for per-game LLM state; set when the game is stored
+        self.game_id = None
     
+    @timed_stage('next_question')
     def get_next_question(self):
         """Get the most informative question to ask next using LLM intelligence"""
-        logger.info(f"Getting next question - asked_questions: {self.asked_questions}")
-        logger.info(f"Current answers: {self.answers}")
+        logger.info("Getting next question - asked_questions: %s", self.asked_questions, extra=STATE)
+        logger.info("Current answers: %s", self.answers, extra=STATE)
+        
+        opening_question = self.get_opening_question()
+        if opening_question:
+            return opening_question
         
         # Use LLM to generate the next best question
         if llm_integration.current_llm != 'none':
-            question = llm_integration.generate_smart_question(self.answers, self.asked_questions)
-            if question:
-                logger.info(f"LLM generated question: {question}")
-                return {"id": len(self.asked_questions) + 1, "text": question, "trait": "llm_generated"}
+            rejected = []
+            for _ in range(1 + QUESTION_DEDUP_RETRIES):
+                question = llm_integration.generate_smart_question(
+                    self.answers, self.asked_questions, session_id=self.game_id,
+                    question_texts=self.question_texts, avoid=rejected
+                )
+                if not question:
+                    break
+                if not self.repeats_asked(question, 'llm'):
+                    logger.info("LLM generated question: %s", question, extra=LLM)
+                    return self.llm_question(question)
+                rejected.append(question)
         
-        # Fallback questions if LLM is not available
+        return self.get_fallback_question()
+    
+    @timed_stage('next_question')
+    async def aget_next_question(self):
+        """Async variant of get_next_question"""
+        opening_question = self.get_opening_question()
+        if opening_question:
+            return opening_question
+        
+        if llm_integration.current_llm != 'none':
+            rejected = []
+            for _ in range(1 + QUESTION_DEDUP_RETRIES):
+                question = await llm_integration.agenerate_smart_question(
+                    self.answers, self.asked_questions, session_id=self.game_id,
+                    question_texts=self.question_texts, avoid=rejected
+                )
+                if not question:
+                    break
+                if not self.repeats_asked(question, 'llm'):
+                    logger.info("LLM generated question: %s", question, extra=LLM)
+                    return self.llm_question(question)
+                rejected.append(question)
+        
+        return self.get_fallback_question()
+    
+    def llm_question(self, text):
+        """Question dict for LLM-generated text"""
+        return {"id": len(self.asked_questions) + 1, "text": text, "trait": "llm_generated"}
+    
+    def repeats_asked(self, text, source):
+        """Whether a generated question is a near-duplicate of one already asked in this game"""
+        if question_index is None or not question_index.is_duplicate(text, self.question_texts.values()):
+            return False
+        logger.info("Rejected repeated question (%s): %s", source, text, extra=LLM)
+        DUPLICATE_QUESTIONS.inc(source=source)
+        return True
+    
+    def _repeated_traits(self):
+        """Engine traits whose question was already asked in other words"""
+        if question_index is None or not self.question_texts:
+            return []
+        texts = [trait['question'] for trait in bayesian_engine.traits]
+        repeated = question_index.duplicates(texts, self.question_texts.values())
+        return [trait['key'] for trait, flag in zip(bayesian_engine.traits, repeated) if flag]
+    
+    def get_fallback_question(self):
+        """Get the next question without using the LLM"""
+        # Local Bayesian engine if LLM is not available
+        if bayesian_engine:
+            asked_traits = list(self.question_traits.values()) + self._repeated_traits()
+            trait = bayesian_engine.select_question(self._posterior(), asked_traits)
+            if trait:
+                logger.info("Bayesian engine question: %s", trait['question'])
+                FALLBACK_QUESTIONS.inc(source='bayesian_engine')
+                return {"id": len(self.asked_questions) + 1, "text": trait['question'], "trait": trait['key']}
+            return None
+        
+        # Fallback questions if the engine data is not available either
         fallback_questions = [
             "Is this person a scientist or researcher?",
             "Is this person from history (no longer alive)?",
@@ -70,29 +169,78 @@ class AkinatorGame:
         ]
         
         available_questions = [q for i, q in enumerate(fallback_questions) if i not in self.asked_questions]
+        if question_index is not None and available_questions:
+            repeated = question_index.duplicates(available_questions, self.question_texts.values())
+            available_questions = [q for q, flag in zip(available_questions, repeated) if not flag]
         if available_questions:
             selected_question = random.choice(available_questions)
-            logger.info(f"Fallback question: {selected_question}")
+            logger.info("Fallback question: %s", selected_question)
+            FALLBACK_QUESTIONS.inc(source='static_list')
             return {"id": len(self.asked_questions) + 1, "text": selected_question, "trait": "fallback"}
         
         return None
     
+    def _posterior(self):
+        """Bayesian engine posterior for the answers to engine-selected questions"""
+        return bayesian_engine.posterior(
+            (trait, self.answers.get(question_id)) for question_id, trait in self.question_traits.items()
+            if question_id in self.answers
+        )
+    
+    def record_question(self, question):
+        """Remember a question's text and which engine trait it asks about"""
+        if not question:
+            return
+        self.question_texts[question['id']] = question['text']
+        if bayesian_engine and question['trait'] in bayesian_engine.trait_index:
+            self.question_traits[question['id']] = question['trait']
+    
+    def get_opening_question(self):
+        """Get the next question from the precomputed opening tree while still inside it"""
+        if opening_tree is None:
+            return None
+        
+        question = opening_tree.lookup(self.answers)
+        if question:
+            logger.info("Opening tree question: %s", question)
+            return {"id": len(self.asked_questions) + 1, "text": question, "trait": "opening_tree"}
+        return None
+    
+    def to_state(self):
+        """Compact, JSON-serializable game state"""
+        return {
+            "a": [[question_id, answer] for question_id, answer in self.answers.items()],
+            "t": [[question_id, trait] for question_id, trait in self.question_traits.items()],
+            "q": [[question_id, text] for question_id, text in self.question_texts.items()]
+        }
+    
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a game from to_state() output"""
+        game = cls()
+        game.answers = {question_id: answer for question_id, answer in state.get("a", [])}
+        game.asked_questions = set(game.answers)
+        game.question_traits = {question_id: trait for question_id, trait in state.get("t", [])}
+        game.question_texts = {question_id: text for question_id, text in state.get("q", [])}
+        return game
+    
     def add_answer(self, question_id, answer):
         """Add an answer to the game state"""
-        logger.info(f"Adding answer - Question ID: {question_id}, Answer: {answer}")
+        logger.info("Adding answer - Question ID: %s, Answer: %s", question_id, answer)
         self.asked_questions.add(question_id)
         
         # Handle special answer types
         if answer == 'unsure' or answer == 'dont_know':
             # For unsure/don't know, we'll skip this question in scoring
             self.answers[question_id] = None
-            logger.info(f"Special answer '{answer}' - skipping in scoring")
+            logger.info("Special answer '%s' - skipping in scoring", answer)
         else:
             self.answers[question_id] = answer
             
-        logger.info(f"Updated asked_questions: {self.asked_questions}")
-        logger.info(f"Updated answers: {self.answers}")
+        logger.info("Updated asked_questions: %s", self.asked_questions, extra=STATE)
+        logger.info("Updated answers: %s", self.answers, extra=STATE)
     
+    @timed_stage('best_match')
     def get_best_match(self):
         """Use LLM to find the best match based on current answers"""
         if not self.answers or len([a for a in self.answers.values() if a is not None]) < 2:
@@ -102,15 +250,131 @@ class AkinatorGame:
         
         if llm_integration.current_llm != 'none':
             # Use LLM to identify the person
-            person_info = llm_integration.identify_person(self.answers)
+            person_info, source = llm_integration.identify_person(self.answers, session_id=self.game_id,
+                                                                  question_texts=self.question_texts)
             if person_info:
-                logger.info(f"LLM identified: {person_info}")
+                logger.info("LLM identified: %s", person_info, extra=LLM)
+                self._credit('identification', source)
                 return person_info
         
-        # Fallback: return None if LLM can't identify
+        return self._local_best_match()
+    
+    @timed_stage('best_match')
+    async def aget_best_match(self):
+        """Async variant of get_best_match"""
+        if not self.answers or len([a for a in self.answers.values() if a is not None]) < 2:
+            return None
+        
+        if llm_integration.current_llm != 'none':
+            person_info, source = await llm_integration.aidentify_person(self.answers, session_id=self.game_id,
+                                                                          question_texts=self.question_texts)
+            if person_info:
+                logger.info("LLM identified: %s", person_info, extra=LLM)
+                self._credit('identification', source)
+                return person_info
+        
+        return self._local_best_match()
+    
+    def _credit(self, task, source):
+        """Remember which model made the guess, so feedback reaches it; None for cached answers"""
+        self.guess_source = (task, source[1]) if source else None
+    
+    def answer_pattern(self):
+        """This game's answers in the form the answer-pattern index stores"""
+        return answer_pattern(self.answers, self.question_traits, self.question_texts)
+    
+    def learned_guess(self):
+        """Person confirmed by earlier games that ended with the same answers
+        
+        Checked before any LLM call of a turn, under the same guards as an LLM guess.
+        """
+        if answer_patterns is None or len(self.asked_questions) < 3:
+            return None
+        if len([a for a in self.answers.values() if a is not None]) < 2:
+            return None
+        person_info = answer_patterns.lookup(self.answer_pattern())
+        if person_info:
+            logger.info("Answer-pattern match: %s", person_info)
+            self.guess_source = None
+        return person_info
+    
+    def _local_best_match(self):
+        # Fallback: most probable person under the local Bayesian engine
+        if bayesian_engine and self.question_traits:
+            person_info = bayesian_engine.best_match(self._posterior())
+            logger.info("Bayesian engine best match: %s", person_info)
+            self.guess_source = None
+            return person_info
+        
         logger.info("LLM could not identify the person")
         return None
     
+    @timed_stage('plan_turn')
+    def plan_turn(self):
+        """Get the guess decision, best match and next question from one fused LLM call"""
+        if llm_integration.current_llm == 'none':
+            return None
+        
+        return self._turn_decision(*llm_integration.analyze_turn(
+            self.answers, self.asked_questions, session_id=self.game_id, question_texts=self.question_texts
+        ))
+    
+    @timed_stage('plan_turn')
+    async def aplan_turn(self):
+        """Async variant of plan_turn"""
+        if llm_integration.current_llm == 'none':
+            return None
+        
+        return self._turn_decision(*await llm_integration.aanalyze_turn(
+            self.answers, self.asked_questions, session_id=self.game_id, question_texts=self.question_texts
+        ))
+    
+    def _turn_decision(self, turn, source):
+        """Apply the game's guessing guards to a fused turn result and its (backend, model) source"""
+        if not turn:
+            return None
+        logger.info("LLM fused turn: %s", turn, extra=LLM)
+        
+        # Same guards as should_make_guess/get_best_match on the serial path
+        enough_answers = len([a for a in self.answers.values() if a is not None]) >= 2
+        should_guess = (
+            turn['should_guess']
+            and turn['confidence'] > 0.7
+            and len(self.asked_questions) >= 3
+            and enough_answers
+        )
+        
+        question = turn['question']
+        question = self.llm_question(question) if question and not self.repeats_asked(question, 'turn') else None
+        # Only a turn that guesses is credited; a later fallback guess is not this model's
+        self._credit('turn', source if should_guess else None)
+        
+        return {
+            "should_guess": should_guess,
+            "person": turn['person'] if enough_answers else None,
+            "question": question
+        }
+    
+    def stream_question_text(self):
+        """Yield the next LLM-generated question text as it is produced"""
+        if llm_integration.current_llm == 'none':
+            return iter(())
+        return llm_integration.stream_smart_question(self.answers, self.asked_questions, session_id=self.game_id,
+                                                     question_texts=self.question_texts)
+    
+    def find_guess(self):
+        """Return the best match if we should guess now, otherwise None"""
+        if self.should_make_guess():
+            return self.get_best_match()
+        return None
+    
+    async def afind_guess(self):
+        """Async variant of find_guess"""
+        if await self.ashould_make_guess():
+            return await self.aget_best_match()
+        return None
+    
+    @timed_stage('guess_check')
     def should_make_guess(self):
         """Determine if we should make a guess based on confidence and questions asked"""
         if len(self.asked_questions) < 3:
@@ -118,98 +382,336 @@ class AkinatorGame:
         
         if llm_integration.current_llm != 'none':
             # Use LLM to determine if we should guess
-            confidence = llm_integration.analyze_confidence_for_guess(self.answers)
-            logger.info(f"LLM confidence for guessing: {confidence}")
+            confidence = llm_integration.analyze_confidence_for_guess(self.answers, session_id=self.game_id,
+                                                                       question_texts=self.question_texts)
+            logger.info("LLM confidence for guessing: %s", confidence, extra=LLM)
             return confidence > 0.7
+        return self._local_guess_decision()
+    
+    @timed_stage('guess_check')
+    async def ashould_make_guess(self):
+        """Async variant of should_make_guess"""
+        if len(self.asked_questions) < 3:
+            return False
+        
+        if llm_integration.current_llm != 'none':
+            confidence = await llm_integration.aanalyze_confidence_for_guess(self.answers, session_id=self.game_id,
+                                                                               question_texts=self.question_texts)
+            logger.info("LLM confidence for guessing: %s", confidence, extra=LLM)
+            return confidence > 0.7
+        return self._local_guess_decision()
+    
+    def _local_guess_decision(self):
+        if bayesian_engine:
+            # Guess once the posterior concentrates on one person, or when out of questions
+            posterior = self._posterior()
+            return (bayesian_engine.should_guess(posterior)
+                    or bayesian_engine.select_question(posterior, self.question_traits.values()) is None)
         else:
             # Fallback: guess after 7 questions
             return len(self.asked_questions) >= 7
 
+# Server-side game sessions (SESSION_BACKEND=memory or sqlite)
+session_store = create_session_store(AkinatorGame.to_state, AkinatorGame.from_state)
+
+# Model behind each recent guess (None if not an LLM guess), the answer pattern and the person
+# guessed, kept until the player says whether it was right
+recent_guesses = MemorySessionStore(max_sessions=10000, idle_ttl=3600.0)
+
+# Values read from existing stats at scrape time
+REGISTRY.gauge_callback('akinator_active_sessions', 'Games with server-side state',
+                        lambda: session_store.stats()['active_sessions'])
+REGISTRY.counter_callback('akinator_llm_cache_hits_total', 'LLM response cache hits',
+                          lambda: (llm_integration.get_cache_stats() or {}).get('hits'))
+REGISTRY.counter_callback('akinator_llm_cache_misses_total', 'LLM response cache misses',
+                          lambda: (llm_integration.get_cache_stats() or {}).get('misses'))
+REGISTRY.counter_callback('akinator_answer_pattern_matches_total', 'Guesses taken from the answer-pattern index',
+                          lambda: answer_patterns.matches if answer_patterns else None)
+REGISTRY.counter_callback('akinator_llm_similarity_cache_hits_total', 'Identifications served by the approximate-match cache',
+                          lambda: (llm_integration.get_similarity_cache_stats() or {}).get('hits'))
+REGISTRY.gauge_callback('akinator_llm_cache_entries', 'LLM response cache entries',
+                        lambda: (llm_integration.get_cache_stats() or {}).get('entries'))
+REGISTRY.gauge_callback('akinator_llm_circuits_open', 'LLM backend/model circuits currently failing fast',
+                        lambda: llm_integration.circuits.open_count() if llm_integration.circuits else None)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # Streaming responses are timed until their body is fully sent
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    method, status, started = request.method, response.status_code, g.request_started
+    response.call_on_close(lambda: record_http_request(route, method, status, time.perf_counter() - started))
+    return response
+
+def new_game_payload(game, question):
+    """Save a new game and build the response for its first question"""
+    game.record_question(question)
+    game_id = new_game_id()
+    game.game_id = game_id
+    update_log_context(game_id=game_id)
+    session_store.put(game_id, game)
+    return {
+        "game_id": game_id,
+        "question": question,
+        "progress": 0,
+        "game_state": {"game_id": game_id}
+    }
+
 @app.route('/api/start', methods=['POST'])
 def start_game():
     """Start a new game"""
+    bind_log_context(stage='start')
     logger.info("=== Starting new game ===")
     game = AkinatorGame()
     question = game.get_next_question()
     
-    logger.info(f"First question: {question}")
-    return jsonify({
-        "game_id": datetime.now().strftime("%Y%m%d%H%M%S"),
-        "question": question,
-        "progress": 0
-    })
+    logger.info("First question: %s", question)
+    return jsonify(new_game_payload(game, question))
 
-@app.route('/api/answer', methods=['POST'])
-def answer_question():
-    """Submit an answer and get the next question or result"""
-    data = request.json
+def load_answered_game(data):
+    """Load the game for an answer request and apply the answer; returns (game, game_id)"""
     question_id = data.get('question_id')
     answer = data.get('answer')  # True/False/unsure/dont_know
     game_state = data.get('game_state', {})
+    game_id = data.get('game_id') or game_state.get('game_id')
     
-    logger.info(f"=== Answer received ===")
-    logger.info(f"Question ID: {question_id}, Answer: {answer}")
-    logger.info(f"Game state: {game_state}")
+    bind_log_context(stage='answer', game_id=game_id)
+    logger.info("=== Answer received ===")
+    logger.info("Question ID: %s, Answer: %s", question_id, answer)
     
-    # Reconstruct game state
-    game = AkinatorGame()
-    game.asked_questions = set(game_state.get('asked_questions', []))
-    # Convert answer keys to integers to ensure consistent types
-    answers = game_state.get('answers', {})
-    game.answers = {int(k): v for k, v in answers.items()}
+    game = session_store.get(game_id) if game_id else None
+    if game is None:
+        if game_id and 'answers' not in game_state:
+            return None, game_id
+        
+        # Reconstruct game state posted by clients without a server-side session
+        logger.info("Game state: %s", game_state, extra=STATE)
+        game = AkinatorGame()
+        game.asked_questions = set(game_state.get('asked_questions', []))
+        # Convert answer keys to integers to ensure consistent types
+        answers = game_state.get('answers', {})
+        game.answers = {int(k): v for k, v in answers.items()}
+        game.question_traits = {int(k): v for k, v in game_state.get('question_traits', {}).items()}
+        game.question_texts = {int(k): v for k, v in game_state.get('question_texts', {}).items()}
+        game_id = game_id or new_game_id()
+        update_log_context(game_id=game_id)
+        
+        logger.info("Reconstructed asked_questions: %s", game.asked_questions, extra=STATE)
+        logger.info("Reconstructed answers: %s", game.answers, extra=STATE)
     
-    logger.info(f"Reconstructed asked_questions: {game.asked_questions}")
-    logger.info(f"Reconstructed answers: {game.answers}")
+    game.game_id = game_id
     
     # Add the new answer
     game.add_answer(question_id, answer)
     
-    logger.info(f"After adding answer - asked_questions: {game.asked_questions}")
-    logger.info(f"After adding answer - answers: {game.answers}")
+    logger.info("After adding answer - asked_questions: %s", game.asked_questions, extra=STATE)
+    logger.info("After adding answer - answers: %s", game.answers, extra=STATE)
+    return game, game_id
+
+def question_payload(game, game_id, next_question):
+    """Save the game and build the response for the next question"""
+    game.record_question(next_question)
+    session_store.put(game_id, game)
+    progress = len(game.asked_questions) / 15 * 100  # Assume max 15 questions
+    return {
+        "type": "question",
+        "question": next_question,
+        "progress": progress,
+        "game_state": {"game_id": game_id}
+    }
+
+def result_payload(game, game_id, person, confidence):
+    """End the game and build the response for a guess"""
+    session_store.delete(game_id)
+    llm_integration.end_session(game_id)
+    GAME_QUESTIONS.observe(len(game.asked_questions))
+    if person:
+        recent_guesses.put(game_id, (game.guess_source, game.answer_pattern(), person))
+    return {
+        "type": "result",
+        "person": person,
+        "confidence": confidence,
+        "questions_asked": len(game.asked_questions)
+    }
+
+@timed_stage('confidence')
+def guess_confidence(game, best_match):
+    """Confidence reported with a guess from the serial path"""
+    if llm_integration.current_llm != 'none':
+        return llm_integration.analyze_confidence(best_match, game.answers)
+    return best_match.get('confidence', 0.8)
+
+@app.route('/api/answer', methods=['POST'])
+def answer_question():
+    """Submit an answer and get the next question or result"""
+    game, game_id = load_answered_game(request.json)
+    if game is None:
+        return jsonify({"error": "Unknown or expired game"}), 404
     
-    # Check if we should make a guess
-    if game.should_make_guess():
-        best_match = game.get_best_match()
-        if best_match:
-            confidence = llm_integration.analyze_confidence(best_match, game.answers) if llm_integration.current_llm != 'none' else 0.8
-            return jsonify({
-                "type": "result",
-                "person": best_match,
-                "confidence": confidence,
-                "questions_asked": len(game.asked_questions)
-            })
+    # Early turns are served from the precomputed opening tree without any LLM call;
+    # no guess is made while the game is still inside it
+    next_question = game.get_opening_question()
+    if next_question:
+        return jsonify(question_payload(game, game_id, next_question))
     
-    # Get next question
-    next_question = game.get_next_question()
+    # A pattern confirmed by earlier games is guessed without asking the LLM
+    learned = game.learned_guess()
+    if learned:
+        return jsonify(result_payload(game, game_id, learned, learned['confidence']))
+    
+    # Prefer a single fused LLM call for guess decision, match and next question
+    turn = game.plan_turn()
+    if turn is not None:
+        if turn['should_guess']:
+            return jsonify(result_payload(game, game_id, turn['person'], guess_confidence(game, turn['person'])))
+        next_question = turn['question'] or game.get_next_question()
+    else:
+        # The guess check and the next question only depend on the current answers,
+        # so run them concurrently and discard whichever result is not needed
+        question_future = None
+        if PARALLEL_TURN and llm_integration.current_llm != 'none':
+            question_future = turn_executor.submit(contextvars.copy_context().run, game.get_next_question)
+        
+        # Check if we should make a guess
+        best_match = game.find_guess()
+        if best_match:
+            if question_future:
+                question_future.cancel()
+            return jsonify(result_payload(game, game_id, best_match, guess_confidence(game, best_match)))
+        
+        # Get next question
+        next_question = question_future.result() if question_future else game.get_next_question()
     
     if next_question:
-        progress = len(game.asked_questions) / 15 * 100  # Assume max 15 questions
-        return jsonify({
-            "type": "question",
-            "question": next_question,
-            "progress": progress,
-            "game_state": {
-                "asked_questions": list(game.asked_questions),
-                "answers": {str(k): v for k, v in game.answers.items()}
-            }
-        })
+        return jsonify(question_payload(game, game_id, next_question))
     else:
         # No more questions, make best guess
-        best_match = game.get_best_match()
-        return jsonify({
-            "type": "result",
-            "person": best_match,
-            "confidence": 0.6 if best_match else 0.0,
-            "questions_asked": len(game.asked_questions)
-        })
+        best_match = (turn and turn['person']) or game.get_best_match()
+        return jsonify(result_payload(game, game_id, best_match, 0.6 if best_match else 0.0))
+
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/answer/stream', methods=['POST'])
+def answer_question_stream():
+    """Submit an answer and stream the next question as Server-Sent Events
+    
+    Emits `token` events with question text as the LLM produces it, then one final
+    `question` or `result` event with the same payload as /api/answer. Tokens can be
+    followed by a `result` event when the concurrent guess check decides to guess, or
+    by a `replace` event when the streamed text was rejected (a repeat of an asked
+    question, or not a usable question): the client discards it and shows the
+    `question` that follows.
+    """
+    game, game_id = load_answered_game(request.json)
+    if game is None:
+        return jsonify({"error": "Unknown or expired game"}), 404
+    
+    def events():
+        next_question = game.get_opening_question()
+        if next_question:
+            yield sse_event('question', question_payload(game, game_id, next_question))
+            return
+        
+        learned = game.learned_guess()
+        if learned:
+            yield sse_event('result', result_payload(game, game_id, learned, learned['confidence']))
+            return
+        
+        # Run the guess check while the question streams
+        if PARALLEL_TURN and llm_integration.current_llm != 'none':
+            guess_future = turn_executor.submit(contextvars.copy_context().run, game.find_guess)
+        else:
+            guess_future = None
+            best_match = game.find_guess()
+            if best_match:
+                yield sse_event('result', result_payload(game, game_id, best_match, guess_confidence(game, best_match)))
+                return
+        
+        chunks = []
+        for chunk in game.stream_question_text():
+            chunks.append(chunk)
+            yield sse_event('token', {"text": chunk})
+        
+        if guess_future:
+            best_match = guess_future.result()
+            if best_match:
+                yield sse_event('result', result_payload(game, game_id, best_match, guess_confidence(game, best_match)))
+                return
+        
+        text = ''.join(chunks).strip()
+        if text and len(text) < 100 and not game.repeats_asked(text, 'stream'):
+            next_question = game.llm_question(text)
+        else:
+            next_question = game.get_fallback_question()
+            if chunks:
+                yield sse_event('replace', {"discarded": text})
+        
+        if next_question:
+            yield sse_event('question', question_payload(game, game_id, next_question))
+        else:
+            best_match = game.get_best_match()
+            yield sse_event('result', result_payload(game, game_id, best_match, 0.6 if best_match else 0.0))
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def record_feedback(data):
+    """Record whether the guess for a finished game was right; returns False for unknown games"""
+    game_id = data.get('game_id')
+    entry = recent_guesses.get(game_id) if game_id else None
+    if entry is None:
+        return False
+    recent_guesses.delete(game_id)
+    source, pattern, person = entry
+    correct = bool(data.get('correct'))
+    if answer_patterns is not None:
+        answer_patterns.record(pattern, person, correct)
+    if source:
+        task, model = source
+        llm_integration.record_guess_outcome(task, model, correct)
+        logger.info("Guess feedback: %s with %s was %s", task, model, 'right' if correct else 'wrong')
+    return True
+
+@app.route('/api/feedback', methods=['POST'])
+def guess_feedback():
+    """Tell the server whether its guess was right"""
+    return jsonify({"recorded": record_feedback(request.json or {})})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
 
 @app.route('/api/llm-status', methods=['GET'])
 def get_llm_status():
     """Get LLM availability status"""
-    return jsonify({
+    return jsonify(llm_status_payload())
+
+def llm_status_payload():
+    """LLM availability and runtime statistics"""
+    return {
         "available_llms": llm_integration.get_available_llms_info(),
-        "current_llm": llm_integration.current_llm
-    })
+        "current_llm": llm_integration.current_llm,
+        "health": llm_integration.get_health_stats(),
+        "latency": llm_integration.get_latency_stats(),
+        "batching": llm_integration.get_batch_stats(),
+        "ollama_models": llm_integration.get_model_stats(),
+        "model_routing": llm_integration.get_routing_stats(),
+        "ollama_contexts": llm_integration.get_context_stats(),
+        "connection_pools": llm_integration.get_client_stats(),
+        "cache": llm_integration.get_cache_stats(),
+        "similarity_cache": llm_integration.get_similarity_cache_stats(),
+        "tokens": llm_integration.get_token_stats(),
+        "rate_limits": llm_integration.get_rate_limit_stats(),
+        "circuits": llm_integration.get_circuit_stats(),
+        "sessions": session_store.stats(),
+        "answer_patterns": answer_patterns.stats() if answer_patterns else None
+    }
 
 if __name__ == '__main__':
-    app.run(debug=False, port=5000) 
\ No newline at end of file
+    app.run(debug=False, port=int(os.getenv('PORT', '5000')))
\ No newline at end of file
@@ -0,0 +1,260 @@
+"""Asyncio-native serving mode.
+
+Serves the same API as app.py from a single event loop, with LLM calls made
+through async HTTP clients so waiting games do not hold a thread each.
+Session store and answer-pattern reads and writes (SQLite when configured)
+run in worker threads so they do not block the loop:
+
+    uvicorn asgi:app --port 5000
+"""
+import asyncio
+import json
+import time
+
+from app import (
+    AkinatorGame, guess_confidence, llm_integration, llm_status_payload, load_answered_game,
+    logger, new_game_payload, question_payload, record_feedback, result_payload, sse_event
+)
+from game_logging import bind_log_context
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY, record_http_request
+
+class BadRequest(Exception):
+    """Raised for a request that cannot be parsed; answered with 400"""
+
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-headers', b'Content-Type'),
+    (b'access-control-allow-methods', b'GET, POST, OPTIONS'),
+]
+
+
+async def start_game():
+    """Start a new game"""
+    bind_log_context(stage='start')
+    logger.info("=== Starting new game ===")
+    game = AkinatorGame()
+    question = await game.aget_next_question()
+    
+    logger.info("First question: %s", question)
+    return 200, await asyncio.to_thread(new_game_payload, game, question)
+
+
+async def load_game(data):
+    """load_answered_game in a worker thread; its log context is bound again on the loop"""
+    game, game_id = await asyncio.to_thread(load_answered_game, data)
+    bind_log_context(stage='answer', game_id=game_id)
+    return game, game_id
+
+
+async def answer_question(data):
+    """Submit an answer and get the next question or result"""
+    game, game_id = await load_game(data)
+    if game is None:
+        return 404, {"error": "Unknown or expired game"}
+    
+    # Early turns are served from the precomputed opening tree without any LLM call
+    next_question = game.get_opening_question()
+    if next_question:
+        return 200, await asyncio.to_thread(question_payload, game, game_id, next_question)
+    
+    # A pattern confirmed by earlier games is guessed without asking the LLM
+    learned = await asyncio.to_thread(game.learned_guess)
+    if learned:
+        return 200, await asyncio.to_thread(result_payload, game, game_id, learned, learned['confidence'])
+    
+    # Prefer a single fused LLM call for guess decision, match and next question
+    turn = await game.aplan_turn()
+    if turn is not None:
+        if turn['should_guess']:
+            return 200, await asyncio.to_thread(result_payload, game, game_id, turn['person'],
+                                                guess_confidence(game, turn['person']))
+        next_question = turn['question'] or await game.aget_next_question()
+    else:
+        # Guess check and next question run concurrently on the event loop
+        question_task = asyncio.ensure_future(game.aget_next_question())
+        best_match = await game.afind_guess()
+        if best_match:
+            question_task.cancel()
+            return 200, await asyncio.to_thread(result_payload, game, game_id, best_match,
+                                                guess_confidence(game, best_match))
+        next_question = await question_task
+    
+    if next_question:
+        return 200, await asyncio.to_thread(question_payload, game, game_id, next_question)
+    
+    # No more questions, make best guess
+    best_match = (turn and turn['person']) or await game.aget_best_match()
+    return 200, await asyncio.to_thread(result_payload, game, game_id, best_match, 0.6 if best_match else 0.0)
+
+
+async def answer_question_stream(data, send):
+    """Submit an answer and stream the next question as Server-Sent Events"""
+    game, game_id = await load_game(data)
+    if game is None:
+        await send_json(send, 404, {"error": "Unknown or expired game"})
+        return
+    
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache')] + CORS_HEADERS,
+    })
+    
+    async def emit(event, payload):
+        await send({'type': 'http.response.body', 'body': sse_event(event, payload).encode('utf-8'), 'more_body': True})
+    
+    async def emit_question(next_question):
+        await emit('question', await asyncio.to_thread(question_payload, game, game_id, next_question))
+    
+    async def emit_result(person, confidence):
+        await emit('result', await asyncio.to_thread(result_payload, game, game_id, person, confidence))
+    
+    next_question = game.get_opening_question()
+    learned = None if next_question else await asyncio.to_thread(game.learned_guess)
+    if next_question:
+        await emit_question(next_question)
+    elif learned:
+        await emit_result(learned, learned['confidence'])
+    else:
+        # Run the guess check while the question streams
+        guess_task = asyncio.ensure_future(game.afind_guess())
+        chunks = []
+        if llm_integration.current_llm != 'none':
+            async for chunk in llm_integration.astream_smart_question(game.answers, game.asked_questions, session_id=game_id,
+                                                                      question_texts=game.question_texts):
+                chunks.append(chunk)
+                await emit('token', {"text": chunk})
+        
+        best_match = await guess_task
+        text = ''.join(chunks).strip()
+        if best_match:
+            await emit_result(best_match, guess_confidence(game, best_match))
+        else:
+            if text and len(text) < 100 and not game.repeats_asked(text, 'stream'):
+                next_question = game.llm_question(text)
+            else:
+                next_question = game.get_fallback_question()
+                if chunks:
+                    # Streamed text that is not asked must be discarded by the client
+                    await emit('replace', {"discarded": text})
+            if next_question:
+                await emit_question(next_question)
+            else:
+                best_match = await game.aget_best_match()
+                await emit_result(best_match, 0.6 if best_match else 0.0)
+    
+    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+async def read_json(receive):
+    """Read and decode the full JSON request body; raises BadRequest when it is not JSON"""
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    try:
+        return json.loads(body) if body else {}
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise BadRequest("Invalid JSON body") from e
+
+
+async def send_json(send, status, payload):
+    await send_body(send, status, json.dumps(payload).encode('utf-8'), 'application/json')
+
+
+async def send_body(send, status, body, content_type):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode())] + CORS_HEADERS,
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await llm_integration.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+# Paths reported as their own route label; anything else is 'unmatched'
+ROUTES = {'/api/start', '/api/answer', '/api/answer/stream', '/api/feedback', '/api/llm-status', '/metrics'}
+
+
+async def app(scope, receive, send):
+    """ASGI application"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    
+    method, path = scope['method'], scope['path']
+    started = time.perf_counter()
+    statuses = []
+    
+    async def send_tracked(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+        await send(message)
+    
+    try:
+        await dispatch(method, path, receive, send_tracked)
+    finally:
+        record_http_request(path if path in ROUTES else 'unmatched', method, statuses[0] if statuses else 500,
+                            time.perf_counter() - started)
+
+
+async def dispatch(method, path, receive, send):
+    """Route one HTTP request"""
+    response_started = False
+    
+    async def send_tracked(message):
+        nonlocal response_started
+        if message['type'] == 'http.response.start':
+            response_started = True
+        await send(message)
+    
+    if method == 'OPTIONS':
+        await send({'type': 'http.response.start', 'status': 204, 'headers': CORS_HEADERS})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    if method == 'GET' and path == '/metrics':
+        await send_body(send, 200, REGISTRY.render().encode('utf-8'), METRICS_CONTENT_TYPE)
+        return
+    
+    try:
+        if method == 'POST' and path == '/api/start':
+            await read_json(receive)
+            status, payload = await start_game()
+        elif method == 'POST' and path == '/api/answer':
+            status, payload = await answer_question(await read_json(receive))
+        elif method == 'POST' and path == '/api/answer/stream':
+            await answer_question_stream(await read_json(receive), send_tracked)
+            return
+        elif method == 'POST' and path == '/api/feedback':
+            status, payload = 200, {"recorded": await asyncio.to_thread(record_feedback, await read_json(receive))}
+        elif method == 'GET' and path == '/api/llm-status':
+            status, payload = 200, await asyncio.to_thread(llm_status_payload)
+        else:
+            status, payload = 404, {"error": "Not found"}
+    except BadRequest as e:
+        status, payload = 400, {"error": str(e)}
+    except Exception:
+        logger.exception("Exception on %s [%s]", path, method)
+        status, payload = 500, {"error": "Internal server error"}
+    
+    if response_started:
+        # A stream already sent its status; end it instead of starting a second response
+        logger.warning("Ended %s [%s] early: %s", path, method, payload['error'])
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        return
+    await send_json(send, status, payload)
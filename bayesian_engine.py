@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class BayesianEngine:
+    """Local person x trait inference engine used when no LLM is available"""
+
+    def __init__(self, people: List[Dict], traits: List[Dict], noise: float = 0.05):
+        self.people = people
+        self.traits = traits
+        self.trait_index = {trait['key']: i for i, trait in enumerate(traits)}
+
+        # P(answer is yes | person), clipped so a single wrong answer is not fatal
+        matrix = np.full((len(people), len(traits)), 0.5)
+        for row, person in enumerate(people):
+            for key, probability in person.get('traits', {}).items():
+                if key in self.trait_index:
+                    matrix[row, self.trait_index[key]] = probability
+        self.p_yes = np.clip(matrix, noise, 1.0 - noise)
+
+        self.log_yes = np.log(self.p_yes)
+        self.log_no = np.log(1.0 - self.p_yes)
+        # "Unsure" is most likely when the trait itself is ambiguous for the person
+        self.log_unsure = np.log(1.0 - 0.5 * np.abs(2.0 * self.p_yes - 1.0))
+        self.log_prior = np.full(len(people), -np.log(len(people)))
+
+    @classmethod
+    def load(cls, path: str) -> Optional['BayesianEngine']:
+        """Load people and traits from a JSON file, returning None if unavailable"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if not data.get('people') or not data.get('traits'):
+                return None
+            return cls(data['people'], data['traits'])
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Error loading Bayesian engine data %s: %s", path, e)
+            return None
+
+    def posterior(self, observations: Iterable[Tuple[str, Optional[bool]]]) -> np.ndarray:
+        """Posterior over people given (trait key, answer) pairs; None means unsure"""
+        log_post = self.log_prior.copy()
+        for key, answer in observations:
+            column = self.trait_index.get(key)
+            if column is None:
+                continue
+            if answer is True:
+                log_post += self.log_yes[:, column]
+            elif answer is False:
+                log_post += self.log_no[:, column]
+            else:
+                log_post += self.log_unsure[:, column]
+        log_post -= log_post.max()
+        post = np.exp(log_post)
+        return post / post.sum()
+
+    def select_question(self, posterior: np.ndarray, asked_traits: Iterable[str]) -> Optional[Dict]:
+        """Pick the unasked trait with the highest expected information gain"""
+        asked = np.zeros(len(self.traits), dtype=bool)
+        for key in asked_traits:
+            if key in self.trait_index:
+                asked[self.trait_index[key]] = True
+        if asked.all():
+            return None
+
+        # Joint P(person, answer) for every trait at once, shape (people, traits)
+        joint_yes = posterior[:, None] * self.p_yes
+        joint_no = posterior[:, None] - joint_yes
+        p_yes = joint_yes.sum(axis=0)
+        p_no = 1.0 - p_yes
+
+        expected_entropy = p_yes * _entropy(joint_yes / np.maximum(p_yes, 1e-12)) \
+            + p_no * _entropy(joint_no / np.maximum(p_no, 1e-12))
+        gain = _entropy(posterior[:, None]) - expected_entropy
+        gain[asked] = -np.inf
+
+        column = int(np.argmax(gain))
+        return self.traits[column]
+
+    def best_match(self, posterior: np.ndarray) -> Dict:
+        """Most probable person, with the posterior as confidence"""
+        row = int(np.argmax(posterior))
+        person = self.people[row]
+        return {
+            'name': person['name'],
+            'description': person.get('description', ''),
+            'image': person.get('image') or f"https://en.wikipedia.org/wiki/{person['name'].replace(' ', '_')}",
+            'confidence': float(posterior[row])
+        }
+
+    def should_guess(self, posterior: np.ndarray, threshold: float = 0.85) -> bool:
+        """Guess once a single person holds most of the posterior mass"""
+        return float(posterior.max()) >= threshold
+
+
+def _entropy(distribution: np.ndarray) -> np.ndarray:
+    """Column-wise Shannon entropy in bits"""
+    safe = np.where(distribution > 0, distribution, 1.0)
+    return -(distribution * np.log2(safe)).sum(axis=0)
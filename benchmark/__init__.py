@@ -0,0 +1 @@
+"""Load benchmarks for the game server, run against a stub LLM server (see benchmark/__main__.py)"""
@@ -0,0 +1,111 @@
+"""Benchmark the game end to end against the stub LLM server
+
+Starts the stub server, starts the app in a subprocess pointed at it, plays
+games concurrently and reports throughput, per-endpoint latency percentiles
+and LLM calls per game:
+
+    python -m benchmark --server asgi --games 200 --concurrency 32 --latency all=lognormal:300:0.4
+
+Use --url to load a server that is already running instead (it must be
+configured with LLM_BASE_URL_* pointing at --stub-port).
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+from benchmark.load import add_llm_calls, add_load_arguments, driver_from_args, llm_call_counts, write_report
+from benchmark.stub_server import add_stub_arguments, stub_environment, stub_from_args
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind: str, port: int, stub_url: str, backends, log_path: str) -> subprocess.Popen:
+    """Start app.py (flask) or asgi.py (asgi) with every LLM backend pointed at the stub"""
+    env = dict(os.environ, PORT=str(port))
+    for key, value in stub_environment(stub_url, backends).items():
+        if value is None:
+            env.pop(key, None)
+        else:
+            env[key] = value
+    if kind == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning']
+    else:
+        command = [sys.executable, 'app.py']
+    with open(log_path, 'w') as log:
+        return subprocess.Popen(command, cwd=REPO_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 60.0):
+    """Wait until the server answers and has discovered an LLM backend"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            status = requests.get(url + '/api/llm-status', timeout=2).json()
+            if status.get('current_llm') != 'none':
+                return status
+        except (requests.RequestException, ValueError):
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Server at {url} did not discover the stub LLM backends within {timeout:.0f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /api/start and /api/answer against a stub LLM server")
+    parser.add_argument('--server', choices=['flask', 'asgi'], default='flask', help="Serving mode to start")
+    parser.add_argument('--url', help="Load an already running server instead of starting one")
+    parser.add_argument('--port', type=int, default=None, help="Port for the started server (default: a free port)")
+    parser.add_argument('--stub-port', type=int, default=0, help="Port for the stub LLM server (default: a free port)")
+    parser.add_argument('--server-log', default='benchmark_server.log', help="Where the started server's output goes")
+    add_stub_arguments(parser)
+    add_load_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        stub = stub_from_args(args, port=args.stub_port).start()
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Stub LLM server on {stub.url} serving {args.backends}")
+
+    process = None
+    url = args.url
+    try:
+        if url is None:
+            port = args.port or free_port()
+            url = f'http://127.0.0.1:{port}'
+            process = start_server(args.server, port, stub.url, args.backends.split(','), args.server_log)
+        status = wait_until_ready(url.rstrip('/'), process)
+        print(f"Server on {url} using {status['current_llm']}; playing {args.games} games, {args.concurrency} at a time")
+
+        driver = driver_from_args(args, url)
+        driver.warm_up(args.warmup)
+        before = llm_call_counts(stub.url)
+        report = driver.run(args.games)
+        add_llm_calls(report, before, llm_call_counts(stub.url))
+        report['config'] = {key: value for key, value in vars(args).items() if key != 'json'}
+        report['stub'] = stub.stats()
+        report['llm_status'] = requests.get(url.rstrip('/') + '/api/llm-status', timeout=5).json()
+        write_report(report, args.json)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
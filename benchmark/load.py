@@ -0,0 +1,284 @@
+"""Load driver: plays full games against a running server and reports latencies
+
+    python -m benchmark.load --url http://127.0.0.1:5000 --games 200 --concurrency 16
+
+Each simulated player thinks of a person from people_traits.json and answers
+trait questions the way that person would; other questions get a random answer.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+import requests
+
+from benchmark.stub_server import TRAITS_PATH
+
+# Stop a game that has not ended after this many answers
+MAX_ANSWERS = 40
+
+
+def _load_people():
+    with open(TRAITS_PATH, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {trait['question']: trait['key'] for trait in data['traits']}, data['people']
+
+
+class Player:
+    """Answers questions as one person from people_traits.json would"""
+
+    def __init__(self, person: Dict, trait_keys: Dict[str, str], rng: random.Random, unsure_rate: float = 0.05):
+        self.person = person
+        self.trait_keys = trait_keys
+        self.rng = rng
+        self.unsure_rate = unsure_rate
+
+    def answer(self, question: Dict):
+        if self.rng.random() < self.unsure_rate:
+            return 'dont_know'
+        key = question.get('trait')
+        if key not in self.person['traits']:
+            key = self.trait_keys.get(question.get('text'))
+        return self.rng.random() < self.person['traits'].get(key, 0.5)
+
+
+class LoadResults:
+    """Per-endpoint latencies and per-game counters, safe to update from worker threads"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.games_completed = 0
+        self.games_failed = 0
+        self.questions: List[int] = []
+        self.correct_guesses = 0
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float, ok: bool = True):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def record_game(self, questions: int, correct: Optional[bool]):
+        with self._lock:
+            if correct is None:
+                self.games_failed += 1
+                return
+            self.games_completed += 1
+            self.questions.append(questions)
+            self.correct_guesses += int(correct)
+
+    def summary(self, duration: float) -> Dict:
+        endpoints = {}
+        for endpoint, samples in sorted(self.latencies.items()):
+            values = np.asarray(samples) * 1000.0
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            endpoints[endpoint] = {
+                'requests': len(samples),
+                'errors': self.errors.get(endpoint, 0),
+                'mean_ms': float(values.mean()),
+                'p50_ms': float(p50),
+                'p95_ms': float(p95),
+                'p99_ms': float(p99),
+                'max_ms': float(values.max()),
+            }
+        requests_total = sum(len(samples) for samples in self.latencies.values())
+        return {
+            'duration_s': duration,
+            'games_completed': self.games_completed,
+            'games_failed': self.games_failed,
+            'games_per_s': self.games_completed / duration if duration else 0.0,
+            'requests_per_s': requests_total / duration if duration else 0.0,
+            'questions_per_game': float(np.mean(self.questions)) if self.questions else 0.0,
+            'guess_accuracy': self.correct_guesses / self.games_completed if self.games_completed else 0.0,
+            'endpoints': endpoints,
+        }
+
+
+class LoadDriver:
+    """Plays games concurrently, one requests.Session per worker thread"""
+
+    def __init__(self, url: str, concurrency: int = 8, stream: bool = False, feedback: bool = True,
+                 timeout: float = 60.0, seed: Optional[int] = None):
+        self.url = url.rstrip('/')
+        self.concurrency = concurrency
+        self.stream = stream
+        self.feedback = feedback
+        self.timeout = timeout
+        self.trait_keys, self.people = _load_people()
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _new_player(self) -> Player:
+        with self._rng_lock:
+            return Player(self._rng.choice(self.people), self.trait_keys, random.Random(self._rng.random()))
+
+    def _post(self, results: LoadResults, endpoint: str, path: str, payload: Optional[Dict] = None) -> Dict:
+        started = time.perf_counter()
+        try:
+            response = self._session().post(self.url + path, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError):
+            results.record(endpoint, time.perf_counter() - started, ok=False)
+            raise
+        results.record(endpoint, time.perf_counter() - started)
+        return data
+
+    def _post_stream(self, results: LoadResults, payload: Dict) -> Dict:
+        """POST /api/answer/stream and return the final event's payload"""
+        started = time.perf_counter()
+        first_event = None
+        try:
+            with self._session().post(self.url + '/api/answer/stream', json=payload,
+                                      timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                event = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if first_event is None and line:
+                        first_event = time.perf_counter() - started
+                    if line.startswith('event:'):
+                        event = line[len('event:'):].strip()
+                    elif line.startswith('data:') and event in ('question', 'result'):
+                        data = json.loads(line[len('data:'):])
+                        break
+                else:
+                    raise ValueError("stream ended without a question or result")
+        except (requests.RequestException, ValueError):
+            results.record('answer_stream', time.perf_counter() - started, ok=False)
+            raise
+        results.record('answer_stream', time.perf_counter() - started)
+        results.record('answer_stream_first_event', first_event)
+        return data
+
+    def play(self, results: LoadResults):
+        """Play one game to its result"""
+        player = self._new_player()
+        try:
+            data = self._post(results, 'start', '/api/start')
+            game_id, question = data['game_id'], data['question']
+            for answered in range(1, MAX_ANSWERS + 1):
+                payload = {'game_id': game_id, 'question_id': question['id'], 'answer': player.answer(question)}
+                if self.stream:
+                    data = self._post_stream(results, payload)
+                else:
+                    data = self._post(results, 'answer', '/api/answer', payload)
+                if data.get('type') == 'result':
+                    break
+                question = data['question']
+            else:
+                raise ValueError(f"game did not end after {MAX_ANSWERS} answers")
+
+            person = data.get('person') or {}
+            correct = person.get('name') == player.person['name']
+            if self.feedback:
+                self._post(results, 'feedback', '/api/feedback', {'game_id': game_id, 'correct': correct})
+        except (requests.RequestException, ValueError, KeyError, TypeError):
+            results.record_game(0, None)
+            return
+        results.record_game(answered, correct)
+
+    def warm_up(self, games: int):
+        """Play games that are left out of the report, e.g. to fill caches and load models"""
+        if games:
+            self._play_many(games, LoadResults())
+
+    def run(self, games: int) -> Dict:
+        """Play games and summarise them"""
+        results = LoadResults()
+        started = time.perf_counter()
+        self._play_many(games, results)
+        return results.summary(time.perf_counter() - started)
+
+    def _play_many(self, games: int, results: LoadResults):
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='player') as executor:
+            for future in [executor.submit(self.play, results) for _ in range(games)]:
+                future.result()
+
+
+def format_report(report: Dict) -> str:
+    """Human-readable summary of a benchmark report"""
+    lines = [
+        f"games: {report['games_completed']} completed, {report['games_failed']} failed "
+        f"in {report['duration_s']:.1f}s ({report['games_per_s']:.2f} games/s, {report['requests_per_s']:.1f} requests/s)",
+        f"questions per game: {report['questions_per_game']:.1f}, guess accuracy: {report['guess_accuracy']:.0%}",
+    ]
+    if 'llm_calls_per_game' in report:
+        per_task = ', '.join(f"{task} {calls:.2f}" for task, calls in sorted(report['llm_calls_per_task'].items()))
+        lines.append(f"LLM calls per game: {report['llm_calls_per_game']:.2f} ({per_task or 'none'})")
+    lines.append(f"{'endpoint':<28}{'requests':>9}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, stats in report['endpoints'].items():
+        lines.append(f"{endpoint:<28}{stats['requests']:>9}{stats['errors']:>8}"
+                     f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+    return '\n'.join(lines)
+
+
+def add_load_arguments(parser: argparse.ArgumentParser):
+    """Load driver options, shared with the benchmark runner"""
+    group = parser.add_argument_group('load driver')
+    group.add_argument('--games', type=int, default=100, help="Games to play")
+    group.add_argument('--concurrency', type=int, default=8, help="Games played at the same time")
+    group.add_argument('--warmup', type=int, default=0, help="Games played first and left out of the report")
+    group.add_argument('--stream', action='store_true', help="Answer through /api/answer/stream")
+    group.add_argument('--no-feedback', action='store_true', help="Do not post /api/feedback after each game")
+    group.add_argument('--request-timeout', type=float, default=60.0)
+    group.add_argument('--player-seed', type=int, default=None, help="Random seed for players")
+    group.add_argument('--json', metavar='PATH', help="Also write the report as JSON, for comparing runs")
+
+
+def driver_from_args(args, url: str) -> LoadDriver:
+    return LoadDriver(url, concurrency=args.concurrency, stream=args.stream, feedback=not args.no_feedback,
+                      timeout=args.request_timeout, seed=args.player_seed)
+
+
+def llm_call_counts(stub_url: str) -> Dict:
+    """Completion counters of a stub LLM server"""
+    return requests.get(stub_url.rstrip('/') + '/stats', timeout=5).json()['calls']
+
+
+def add_llm_calls(report: Dict, before: Dict, after: Dict, backends=('ollama', 'openai', 'anthropic')):
+    """Add LLM calls per game to a report from stub counters taken around the run"""
+    games = max(1, report['games_completed'] + report['games_failed'])
+    delta = {name: after.get(name, 0) - before.get(name, 0) for name in after}
+    report['llm_calls_per_game'] = sum(delta.get(backend, 0) for backend in backends) / games
+    report['llm_calls_per_task'] = {name: calls / games for name, calls in delta.items() if name not in backends}
+
+
+def write_report(report: Dict, path: Optional[str]):
+    print(format_report(report))
+    if path:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play concurrent games against a running Akinator server")
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help="Server to load")
+    parser.add_argument('--stub-url', help="Stub LLM server the app talks to, for LLM calls per game")
+    add_load_arguments(parser)
+    args = parser.parse_args()
+
+    driver = driver_from_args(args, args.url)
+    driver.warm_up(args.warmup)
+    before = llm_call_counts(args.stub_url) if args.stub_url else None
+    report = driver.run(args.games)
+    if args.stub_url:
+        add_llm_calls(report, before, llm_call_counts(args.stub_url))
+    write_report(report, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""Self-play: simulated players answer the game in-process across a process pool
+
+    python -m benchmark.selfplay --games 2000 --workers 8
+    python -m benchmark.selfplay --games 2000 --llm none          # local engine only
+    python -m benchmark.selfplay --games 200 --llm env            # backends from .env
+
+Each worker process imports app.py and plays whole games through the Flask
+test client, so the real turn logic runs without HTTP. An oracle answers every
+question as a person from the fact table (people_traits.json) would. The report
+gives questions to guess, guess accuracy, LLM calls and wall time per game,
+which is how changes to the question policy should be evaluated.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmark.load import MAX_ANSWERS, Player
+from benchmark.stub_server import TRAITS_PATH, add_stub_arguments, stub_environment, stub_from_args
+
+# Nothing listens here, so every backend probe fails fast and the app runs without an LLM
+UNREACHABLE_URL = 'http://127.0.0.1:9'
+
+_worker = {}
+
+
+def _init_worker(env: Dict[str, Optional[str]], traits_path: str):
+    """Point the app at the chosen backends, then import it once per process"""
+    # Removed keys are set empty rather than unset so load_dotenv cannot bring them back
+    for key, value in env.items():
+        os.environ[key] = value or ''
+    import app
+    from metrics import LLM_CALL_SECONDS, LLM_COMPLETION_TOKENS, LLM_PROMPT_TOKENS
+
+    with open(traits_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    _worker.update(
+        client=app.app.test_client(),
+        llm=app.llm_integration,
+        calls=LLM_CALL_SECONDS,
+        prompt_tokens=LLM_PROMPT_TOKENS,
+        completion_tokens=LLM_COMPLETION_TOKENS,
+        task_index=LLM_CALL_SECONDS.labelnames.index('task'),
+        trait_keys={trait['question']: trait['key'] for trait in data['traits']},
+        people=data['people'],
+    )
+
+
+def _llm_calls() -> Dict[str, int]:
+    """LLM calls made by this worker so far, per task"""
+    calls = defaultdict(int)
+    for key, count in _worker['calls'].counts().items():
+        calls[key[_worker['task_index']]] += count
+    return calls
+
+
+def _tokens() -> Dict[str, float]:
+    """Prompt and completion tokens used by this worker so far"""
+    return {kind: sum(_worker[kind].sums().values()) for kind in ('prompt_tokens', 'completion_tokens')}
+
+
+def _post(path: str, payload: Optional[Dict] = None) -> Dict:
+    response = _worker['client'].post(path, json=payload)
+    if response.status_code != 200:
+        raise ValueError(f"{path} answered {response.status_code}")
+    return response.get_json()
+
+
+def play_game(seed: int, feedback: bool = True) -> Dict:
+    """Play one game in this worker; the seed picks the person and their answers"""
+    rng = random.Random(seed)
+    player = Player(rng.choice(_worker['people']), _worker['trait_keys'], rng)
+    before, tokens_before = _llm_calls(), _tokens()
+    started = time.perf_counter()
+    result = {'person': player.person['name'], 'backend': _worker['llm'].current_llm}
+    try:
+        data = _post('/api/start')
+        game_id, question = data['game_id'], data['question']
+        for answered in range(1, MAX_ANSWERS + 1):
+            data = _post('/api/answer', {'game_id': game_id, 'question_id': question['id'],
+                                         'answer': player.answer(question)})
+            if data.get('type') == 'result':
+                break
+            question = data['question']
+        else:
+            raise ValueError(f"game did not end after {MAX_ANSWERS} answers")
+        guess = (data.get('person') or {}).get('name')
+        result.update(ok=True, questions=answered, guess=guess, correct=guess == player.person['name'])
+        if feedback:
+            _post('/api/feedback', {'game_id': game_id, 'correct': result['correct']})
+    except (ValueError, KeyError, TypeError) as e:
+        result.update(ok=False, error=str(e))
+    result['seconds'] = time.perf_counter() - started
+    after, tokens_after = _llm_calls(), _tokens()
+    result.update({kind: tokens_after[kind] - tokens_before[kind] for kind in tokens_after})
+    result['llm_calls'] = {task: after[task] - before.get(task, 0) for task in after if after[task] != before.get(task, 0)}
+    return result
+
+
+def _worker_backend(_) -> str:
+    """Backend a worker settled on, used to check the pool before playing"""
+    return _worker['llm'].current_llm
+
+
+def _percentiles(values) -> Dict[str, float]:
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return {'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+    p50, p95 = np.percentile(values, [50, 95])
+    return {'mean': float(values.mean()), 'p50': float(p50), 'p95': float(p95), 'max': float(values.max())}
+
+
+def summarize(games: List[Dict], duration: float) -> Dict:
+    """Aggregate per-game results into a report"""
+    completed = [game for game in games if game['ok']]
+    per_task = defaultdict(int)
+    for game in games:
+        for task, calls in game['llm_calls'].items():
+            per_task[task] += calls
+    played = max(1, len(games))
+    return {
+        'duration_s': duration,
+        'games_completed': len(completed),
+        'games_failed': len(games) - len(completed),
+        'games_per_s': len(games) / duration if duration else 0.0,
+        'backends': sorted({game['backend'] for game in games}),
+        'guess_accuracy': sum(game['correct'] for game in completed) / len(completed) if completed else 0.0,
+        'questions': _percentiles([game['questions'] for game in completed]),
+        'llm_calls': _percentiles([sum(game['llm_calls'].values()) for game in games]),
+        'llm_calls_per_task': {task: calls / played for task, calls in sorted(per_task.items())},
+        'prompt_tokens': _percentiles([game['prompt_tokens'] for game in games]),
+        'completion_tokens': _percentiles([game['completion_tokens'] for game in games]),
+        'game_seconds': _percentiles([game['seconds'] for game in games]),
+    }
+
+
+def format_report(report: Dict) -> str:
+    """Human-readable summary of a self-play report"""
+    per_task = ', '.join(f"{task} {calls:.2f}" for task, calls in report['llm_calls_per_task'].items())
+    lines = [
+        f"games: {report['games_completed']} completed, {report['games_failed']} failed in "
+        f"{report['duration_s']:.1f}s ({report['games_per_s']:.1f} games/s) using {', '.join(report['backends'])}",
+        f"guess accuracy: {report['guess_accuracy']:.1%}",
+        f"{'per game':<18}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}",
+    ]
+    for label, key, scale in (('questions', 'questions', 1), ('LLM calls', 'llm_calls', 1),
+                              ('prompt tokens', 'prompt_tokens', 1), ('completion tokens', 'completion_tokens', 1),
+                              ('wall time ms', 'game_seconds', 1000)):
+        stats = report[key]
+        lines.append(f"{label:<18}" + ''.join(f"{stats[name] * scale:>10.1f}" for name in ('mean', 'p50', 'p95', 'max')))
+    lines.append(f"LLM calls per game by task: {per_task or 'none'}")
+    return '\n'.join(lines)
+
+
+def run(games: int, workers: int, env: Dict[str, Optional[str]], seed: int = 0, feedback: bool = True,
+        traits_path: str = TRAITS_PATH, require_llm: bool = False, patterns: bool = True) -> Dict:
+    """Play games across a pool of worker processes and summarise them
+
+    Learned answer patterns go to an index that starts empty and is deleted
+    after the run, so simulated games never reach the real one and runs do
+    not skew each other.
+    """
+    # Discovery runs once at import in each worker rather than in a background thread
+    env = dict({'SESSION_BACKEND': 'memory', 'LLM_DISCOVERY_BACKGROUND': 'false',
+                'LOG_CONSOLE': 'false', 'LOG_LEVEL': 'WARNING'}, **env)
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix='selfplay-') as patterns_dir:
+        env.update(ANSWER_PATTERNS_ENABLED='true' if patterns else 'false',
+                   ANSWER_PATTERNS_PATH=os.path.join(patterns_dir, 'answer_patterns.db'))
+        return _play(games, workers, env, seed, feedback, traits_path, require_llm, context)
+
+
+def _play(games: int, workers: int, env: Dict[str, Optional[str]], seed: int, feedback: bool,
+          traits_path: str, require_llm: bool, context) -> Dict:
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(env, traits_path)) as executor:
+        if require_llm and 'none' in set(executor.map(_worker_backend, range(workers))):
+            raise RuntimeError("A worker found no LLM backend; check the LLM_BASE_URL_* settings")
+        started = time.perf_counter()
+        seeds = [seed * 1_000_003 + index for index in range(games)]
+        results = list(executor.map(play_game, seeds, [feedback] * games,
+                                    chunksize=max(1, games // (workers * 8))))
+    return summarize(results, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play simulated games in-process across a process pool")
+    parser.add_argument('--games', type=int, default=1000, help="Games to play")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help="Worker processes")
+    parser.add_argument('--llm', choices=['stub', 'env', 'none'], default='stub',
+                        help="stub: start the stub LLM server; env: backends configured in the environment; "
+                             "none: local engine only")
+    parser.add_argument('--game-seed', type=int, default=0, help="Seed for the people and answers played")
+    parser.add_argument('--people', default=TRAITS_PATH, help="Fact table the oracle answers from")
+    parser.add_argument('--no-feedback', action='store_true', help="Do not report guess outcomes after each game")
+    parser.add_argument('--no-patterns', action='store_true',
+                        help="Do not guess from answer patterns learned earlier in the run")
+    parser.add_argument('--json', metavar='PATH', help="Also write the report as JSON, for comparing runs")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    stub = None
+    if args.llm == 'stub':
+        try:
+            stub = stub_from_args(args).start()
+        except ValueError as e:
+            parser.error(str(e))
+        env = stub_environment(stub.url, args.backends.split(','))
+        print(f"Stub LLM server on {stub.url} serving {args.backends}")
+    elif args.llm == 'none':
+        env = stub_environment(UNREACHABLE_URL, ())
+    else:
+        env = {}
+
+    print(f"Playing {args.games} games on {args.workers} worker processes")
+    try:
+        report = run(args.games, args.workers, env, seed=args.game_seed, feedback=not args.no_feedback,
+                     traits_path=args.people, require_llm=args.llm == 'stub', patterns=not args.no_patterns)
+    finally:
+        if stub is not None:
+            stub.stop()
+    report['config'] = {key: value for key, value in vars(args).items() if key != 'json'}
+    print(format_report(report))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,478 @@
+"""Stub LLM server for benchmarks.
+
+Serves the parts of the Ollama, OpenAI and Anthropic APIs the game uses, with
+sampled latencies and injected errors, so the game can be load-tested without
+real models or API keys:
+
+    python -m benchmark.stub_server --port 11500 --latency ollama=lognormal:400:0.5 --error-rate ollama=0.02
+
+Point the app at it with LLM_BASE_URL_LOCAL_OLLAMA, LLM_BASE_URL_OPENAI and
+LLM_BASE_URL_ANTHROPIC (any API key will do for the cloud backends).
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+TRAITS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'people_traits.json')
+
+BACKENDS = ('ollama', 'openai', 'anthropic')
+
+DEFAULT_MODELS = {'mistral:7b': 4_100_000_000, 'llama2:13b': 7_400_000_000}
+
+
+def parse_distribution(spec: str) -> Callable[[random.Random], float]:
+    """Latency sampler in seconds for a spec in milliseconds
+
+    Specs: "fixed:MS", "uniform:LOW:HIGH", "normal:MEAN:STDDEV",
+    "lognormal:MEDIAN:SIGMA" or "exponential:MEAN".
+    """
+    kind, *params = spec.split(':')
+    try:
+        values = [float(value) for value in params]
+    except ValueError:
+        raise ValueError(f"Bad latency spec {spec!r}")
+    samplers = {
+        'fixed': (1, lambda rng, ms: ms),
+        'uniform': (2, lambda rng, low, high: rng.uniform(low, high)),
+        'normal': (2, lambda rng, mean, stddev: rng.gauss(mean, stddev)),
+        'lognormal': (2, lambda rng, median, sigma: median * rng.lognormvariate(0.0, sigma)),
+        'exponential': (1, lambda rng, mean: rng.expovariate(1.0 / mean) if mean > 0 else 0.0),
+    }
+    if kind not in samplers or len(values) != samplers[kind][0]:
+        raise ValueError(f"Bad latency spec {spec!r}")
+    sampler = samplers[kind][1]
+    return lambda rng: max(0.0, sampler(rng, *values)) / 1000.0
+
+
+def parse_backend_values(items: Optional[List[str]], convert: Callable, default) -> Dict:
+    """{'ollama': ..., 'openai': ..., 'anthropic': ...} from "backend=value" items ("all=" sets every backend)"""
+    values = {backend: default for backend in BACKENDS}
+    for item in items or []:
+        backend, _, value = item.partition('=')
+        targets = BACKENDS if backend == 'all' else [backend]
+        if not value or any(target not in BACKENDS for target in targets):
+            raise ValueError(f"Expected backend=value with backend in {BACKENDS + ('all',)}, got {item!r}")
+        for target in targets:
+            values[target] = convert(value)
+    return values
+
+
+def _load_game_data():
+    try:
+        with open(TRAITS_PATH, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return [trait['question'] for trait in data['traits']], data['people']
+    except (OSError, ValueError, KeyError):
+        return ["Is this person male?", "Is this person still alive?"], [
+            {'name': 'Albert Einstein', 'description': 'Physicist', 'image': ''}
+        ]
+
+
+class StubCompletions:
+    """Task-aware completion text, so the app's parsers accept the replies
+
+    The task is recognised from the output format in the prompt. Replies walk
+    through the trait questions of people_traits.json and decide to guess once
+    guess_after questions have been answered.
+    """
+
+    def __init__(self, guess_after: int = 8):
+        self.guess_after = guess_after
+        self.questions, self.people = _load_game_data()
+
+    @staticmethod
+    def task(prompt: str) -> str:
+        if 'should_guess' in prompt:
+            return 'turn'
+        if 'name, description, image, confidence' in prompt:
+            return 'identification'
+        if 'number between 0 and 1' in prompt or 'Should we make a guess now?' in prompt:
+            return 'analysis'
+        return 'question_generation'
+
+    @staticmethod
+    def questions_answered(prompt: str, carried: int = 0) -> int:
+        ids = [int(question_id) for question_id in re.findall(r'\bQ(?:uestion )?(\d+)\b', prompt)]
+        return max([carried] + ids)
+
+    def _person(self, prompt: str) -> Dict:
+        person = self.people[zlib.crc32(prompt.encode('utf-8')) % len(self.people)]
+        return {'name': person['name'], 'description': person.get('description', ''), 'image': person.get('image', '')}
+
+    def reply(self, task: str, prompt: str, answered: int) -> str:
+        confidence = round(min(0.95, 0.2 + 0.75 * answered / max(1, self.guess_after)), 2)
+        question = self.questions[answered % len(self.questions)]
+        if task == 'question_generation':
+            return question
+        if task == 'analysis':
+            return str(confidence)
+        person = dict(self._person(prompt), confidence=confidence)
+        if task == 'identification':
+            return json.dumps(person)
+        return json.dumps({
+            'should_guess': answered >= self.guess_after,
+            'confidence': confidence,
+            'person': person,
+            'question': question,
+        })
+
+
+class StubLLMServer:
+    """Threaded HTTP server answering Ollama, OpenAI and Anthropic requests"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 11500,
+                 latency: Optional[Dict[str, Callable]] = None, error_rate: Optional[Dict[str, float]] = None,
+                 error_status: int = 503, token_delay: float = 0.005, backends=BACKENDS,
+                 models: Optional[Dict[str, int]] = None, guess_after: int = 8, seed: Optional[int] = None,
+                 rate_limit: Optional[Dict[str, float]] = None):
+        self.latency = latency or {backend: parse_distribution('fixed:0') for backend in BACKENDS}
+        self.error_rate = error_rate or {backend: 0.0 for backend in BACKENDS}
+        self.error_status = error_status
+        self.token_delay = token_delay
+        self.backends = set(backends)
+        self.models = dict(DEFAULT_MODELS if models is None else models)
+        self.completions = StubCompletions(guess_after)
+        # Requests per minute per backend, enforced like a provider: 429 with Retry-After
+        self.rate_limit = {backend: rpm for backend, rpm in (rate_limit or {}).items() if rpm > 0}
+        self._allowance = {backend: (rpm / 60.0, time.monotonic()) for backend, rpm in self.rate_limit.items()}
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._loaded = set()
+        self._counts = Counter()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'StubLLMServer':
+        """Serve from a daemon thread"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='llm-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def count(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._counts[key] += 1
+
+    def stats(self) -> Dict:
+        """Request counters: 'requests', 'errors', 'throttled' (429s) and 'calls' (completions) per backend and task"""
+        with self._lock:
+            counts = dict(self._counts)
+        result = {'requests': {}, 'errors': {}, 'throttled': {}, 'calls': {}}
+        for key, value in counts.items():
+            kind, _, name = key.partition(':')
+            result[kind][name] = value
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+    def _sample(self, backend: str):
+        """(latency in seconds, whether to fail) for one completion"""
+        with self._lock:
+            return self.latency[backend](self._rng), self._rng.random() < self.error_rate[backend]
+
+    def _admit(self, backend: str) -> Optional[float]:
+        """None when a completion is within the backend's rate limit, else seconds until one would be"""
+        if backend not in self.rate_limit:
+            return None
+        rate = self.rate_limit[backend] / 60.0
+        with self._lock:
+            # One second of burst, refilled continuously
+            level, updated = self._allowance[backend]
+            now = time.monotonic()
+            level = min(max(1.0, rate), level + (now - updated) * rate)
+            if level >= 1:
+                self._allowance[backend] = (level - 1, now)
+                return None
+            self._allowance[backend] = (level, now)
+            return (1 - level) / rate
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(StubRequestHandler):
+            stub = server
+        return Handler
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    stub: StubLLMServer = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status: int = 200, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_chunked(self, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def _write_chunk(self, data: str):
+        data = data.encode('utf-8')
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return {}
+
+    def _route(self, method: str):
+        """(backend, handler) for the request path, or (None, None)"""
+        routes = {
+            ('GET', '/api/tags'): ('ollama', self._ollama_tags),
+            ('GET', '/api/ps'): ('ollama', self._ollama_ps),
+            ('POST', '/api/generate'): ('ollama', self._ollama_generate),
+            ('POST', '/v1/chat/completions'): ('openai', self._openai_chat),
+            ('POST', '/v1/messages'): ('anthropic', self._anthropic_messages),
+        }
+        if method == 'GET' and self.path == '/v1/models':
+            # Shared by OpenAI and Anthropic; the API key header tells them apart
+            return ('anthropic' if 'x-api-key' in self.headers else 'openai'), self._models
+        return routes.get((method, self.path), (None, None))
+
+    def _dispatch(self, method: str):
+        if self.path == '/stats':
+            if method == 'GET':
+                return self._send_json(self.stub.stats())
+            self.stub.reset()
+            return self._send_json({'reset': True})
+
+        backend, handler = self._route(method)
+        if backend is None or backend not in self.stub.backends:
+            return self._send_json({'error': 'not found'}, 404)
+        self.stub.count(f'requests:{backend}')
+        handler(backend)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _models(self, backend):
+        self._send_json({'data': [{'id': 'stub-model', 'object': 'model'}]})
+
+    def _ollama_tags(self, backend):
+        self._send_json({'models': [{'name': name, 'size': size} for name, size in self.stub.models.items()]})
+
+    def _ollama_ps(self, backend):
+        with self.stub._lock:
+            loaded = sorted(self.stub._loaded)
+        self._send_json({'models': [{'name': name, 'size': self.stub.models.get(name, 0)} for name in loaded]})
+
+    def _completion(self, backend: str, prompt: str, carried: int = 0):
+        """Sleep for a sampled latency; returns (task, text, answered) or None after sending an error"""
+        task = self.stub.completions.task(prompt)
+        answered = self.stub.completions.questions_answered(prompt, carried)
+        wait = self.stub._admit(backend)
+        if wait is not None:
+            self.stub.count(f'throttled:{backend}')
+            self._send_json({'error': {'type': 'rate_limit_error', 'message': 'rate limit exceeded'}}, 429,
+                            {'Retry-After': f'{wait:.3f}'})
+            return None
+        delay, fail = self.stub._sample(backend)
+        time.sleep(delay)
+        if fail:
+            self.stub.count(f'errors:{backend}')
+            self._send_json({'error': 'injected failure'}, self.stub.error_status)
+            return None
+        self.stub.count(f'calls:{backend}', f'calls:{task}')
+        return task, self.stub.completions.reply(task, prompt, answered), answered
+
+    def _tokens(self, text: str):
+        for index, token in enumerate(text.split(' ')):
+            if index and self.stub.token_delay:
+                time.sleep(self.stub.token_delay)
+            yield token if index == 0 else ' ' + token
+
+    def _ollama_generate(self, backend):
+        body = self._read_json()
+        model = body.get('model')
+        with self.stub._lock:
+            self.stub._loaded.add(model)
+        if not body.get('prompt'):
+            # A request without a prompt only loads the model
+            return self._send_json({'model': model, 'response': '', 'done': True})
+
+        # The context array carries the number of answered questions between turns
+        context = body.get('context') or [0]
+        prompt = body['prompt']
+        completion = self._completion(backend, prompt, carried=context[0])
+        if completion is None:
+            return
+        task, text, answered = completion
+        new_context = [answered] + context[1:] + [0] * ((len(prompt) + len(text)) // 4)
+
+        if not body.get('stream'):
+            return self._send_json({'model': model, 'response': text, 'done': True, 'context': new_context,
+                                    'prompt_eval_count': len(prompt) // 4, 'eval_count': len(text) // 4})
+        self._start_chunked('application/x-ndjson')
+        for token in self._tokens(text):
+            self._write_chunk(json.dumps({'model': model, 'response': token, 'done': False}) + '\n')
+        self._write_chunk(json.dumps({'model': model, 'response': '', 'done': True, 'context': new_context}) + '\n')
+        self._end_chunked()
+
+    def _openai_chat(self, backend):
+        body = self._read_json()
+        prompt = '\n'.join(message.get('content', '') for message in body.get('messages', []))
+        completion = self._completion(backend, prompt)
+        if completion is None:
+            return
+        text = completion[1]
+
+        if not body.get('stream'):
+            return self._send_json({
+                'object': 'chat.completion',
+                'model': body.get('model'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(text) // 4},
+            })
+        self._start_chunked('text/event-stream')
+        for token in self._tokens(text):
+            chunk = {'object': 'chat.completion.chunk', 'choices': [{'index': 0, 'delta': {'content': token}}]}
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self._end_chunked()
+
+    def _anthropic_messages(self, backend):
+        body = self._read_json()
+        prompt = '\n'.join(str(message.get('content', '')) for message in body.get('messages', []))
+        completion = self._completion(backend, prompt)
+        if completion is None:
+            return
+        text = completion[1]
+
+        if not body.get('stream'):
+            return self._send_json({
+                'type': 'message',
+                'role': 'assistant',
+                'model': body.get('model'),
+                'content': [{'type': 'text', 'text': text}],
+                'stop_reason': 'end_turn',
+                'usage': {'input_tokens': len(prompt) // 4, 'output_tokens': len(text) // 4},
+            })
+        self._start_chunked('text/event-stream')
+        self._write_chunk(f"event: message_start\ndata: {json.dumps({'type': 'message_start'})}\n\n")
+        for token in self._tokens(text):
+            event = {'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': token}}
+            self._write_chunk(f"event: content_block_delta\ndata: {json.dumps(event)}\n\n")
+        self._write_chunk(f"event: message_stop\ndata: {json.dumps({'type': 'message_stop'})}\n\n")
+        self._end_chunked()
+
+
+# LLM_BASE_URL_<NAME> suffix of each stub backend
+BACKEND_ENV = {
+    'ollama': 'LOCAL_OLLAMA',
+    'openai': 'OPENAI',
+    'anthropic': 'ANTHROPIC',
+}
+
+
+def stub_environment(stub_url: str, backends) -> Dict[str, Optional[str]]:
+    """Environment pointing the app at a stub server; None values must be removed"""
+    env = {f'LLM_BASE_URL_{name}': stub_url for name in BACKEND_ENV.values()}
+    # Games against the stub must not teach the real answer-pattern index
+    env['ANSWER_PATTERNS_ENABLED'] = 'false'
+    for backend, key in (('openai', 'OPENAI_API_KEY'), ('anthropic', 'ANTHROPIC_API_KEY')):
+        env[key] = 'stub' if backend in backends else None
+    return env
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser):
+    """Stub server options, shared with the benchmark runner"""
+    group = parser.add_argument_group('stub LLM server')
+    group.add_argument('--latency', action='append', metavar='BACKEND=SPEC',
+                       help="Latency distribution per backend (ollama, openai, anthropic or all), "
+                            "e.g. ollama=lognormal:400:0.5; default fixed:0")
+    group.add_argument('--error-rate', action='append', metavar='BACKEND=RATE',
+                       help="Fraction of completions that fail, e.g. openai=0.02")
+    group.add_argument('--error-status', type=int, default=503, help="HTTP status of injected failures")
+    group.add_argument('--rate-limit', action='append', metavar='BACKEND=RPM',
+                       help="Requests per minute a backend accepts before answering 429 with Retry-After, "
+                            "e.g. openai=600")
+    group.add_argument('--token-delay-ms', type=float, default=5.0, help="Delay between streamed tokens")
+    group.add_argument('--backends', default=','.join(BACKENDS),
+                       help="Comma-separated backends to serve; the others answer 404 and look unhealthy")
+    group.add_argument('--guess-after', type=int, default=8, help="Questions answered before the stub guesses")
+    group.add_argument('--seed', type=int, default=None, help="Random seed for latencies and failures")
+
+
+def stub_from_args(args, host: str = '127.0.0.1', port: int = 0) -> StubLLMServer:
+    backends = [backend.strip() for backend in args.backends.split(',') if backend.strip()]
+    unknown = set(backends) - set(BACKENDS)
+    if unknown:
+        raise ValueError(f"Unknown backends: {', '.join(sorted(unknown))}")
+    return StubLLMServer(
+        host=host,
+        port=port,
+        latency=parse_backend_values(args.latency, parse_distribution, parse_distribution('fixed:0')),
+        error_rate=parse_backend_values(args.error_rate, float, 0.0),
+        error_status=args.error_status,
+        token_delay=args.token_delay_ms / 1000.0,
+        backends=backends,
+        guess_after=args.guess_after,
+        seed=args.seed,
+        rate_limit=parse_backend_values(args.rate_limit, float, 0.0),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Ollama/OpenAI/Anthropic server for benchmarks")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11500)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        stub = stub_from_args(args, args.host, args.port)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Stub LLM server on {stub.url}")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
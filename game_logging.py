@@ -0,0 +1,165 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# Extra for log calls that dump game state (answers, asked questions, ...)
+STATE = {'category': 'state'}
+# Extra for log calls that record LLM inputs and outputs
+LLM = {'category': 'llm'}
+
+_log_context: contextvars.ContextVar = contextvars.ContextVar('log_context', default={})
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def bind_log_context(**fields):
+    """Replace the fields (e.g. game_id, stage) attached to records logged from this context"""
+    _log_context.set(fields)
+
+
+def update_log_context(**fields):
+    """Add fields to the current log context"""
+    _log_context.set({**_log_context.get(), **fields})
+
+
+class ContextFilter(logging.Filter):
+    """Copy the current log context and a default category onto each record"""
+
+    def filter(self, record):
+        for key, value in _log_context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        if not hasattr(record, 'category'):
+            record.category = 'game'
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of records per category; warnings and errors always pass"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self.default_rate = rates.get('default', 1.0)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, 'category', 'game'), self.default_rate)
+        return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+
+class JSONLinesFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'category': getattr(record, 'category', 'game'),
+            'msg': record.getMessage(),
+        }
+        for key in ('game_id', 'stage'):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records unformatted so messages and tracebacks are rendered on the writer thread
+
+    The stock prepare() formats the message and traceback on the logging
+    thread. Here only container arguments are copied, so answers and asked
+    questions mutated after the call still log as they were.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if isinstance(record.args, tuple):
+            record.args = tuple(copy.copy(arg) if isinstance(arg, (dict, list, set)) else arg
+                                for arg in record.args)
+        elif isinstance(record.args, dict):
+            # A lone mapping argument is stored as the args themselves
+            record.args = copy.copy(record.args)
+        return record
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse "state=0.01,llm=0.5,default=1" into a rate per category"""
+    rates = {}
+    for item in spec.split(','):
+        if '=' in item:
+            category, rate = item.split('=', 1)
+            try:
+                rates[category.strip()] = max(0.0, min(1.0, float(rate)))
+            except ValueError:
+                pass
+    return rates
+
+
+def setup_logging():
+    """Route all logging through a queue to a background writer thread
+
+    Configured by LOG_LEVEL, LOG_FILE, LOG_FORMAT (json or text), LOG_MAX_BYTES,
+    LOG_BACKUP_COUNT, LOG_CONSOLE, LOG_SAMPLE_RATES and LOG_STATE_DUMPS.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    rates = parse_sample_rates(os.getenv('LOG_SAMPLE_RATES', ''))
+    if os.getenv('LOG_STATE_DUMPS', 'false').lower() != 'true':
+        rates['state'] = 0.0
+
+    handlers = []
+    log_file = os.getenv('LOG_FILE', 'akinator_game.log')
+    if log_file:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file,
+            maxBytes=int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+            backupCount=int(os.getenv('LOG_BACKUP_COUNT', '5')),
+        )
+        if os.getenv('LOG_FORMAT', 'json').lower() == 'json':
+            file_handler.setFormatter(JSONLinesFormatter())
+        else:
+            file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        handlers.append(file_handler)
+    if os.getenv('LOG_CONSOLE', 'true').lower() == 'true':
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        handlers.append(console_handler)
+
+    # Filters run on the request thread before anything is queued, so sampled-out
+    # records cost almost nothing; formatting happens on the writer thread
+    queue_handler = DeferredQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,201 @@
+"""Micro-batching of concurrent LLM calls.
+
+Local inference servers decode several sequences at once (Ollama's
+OLLAMA_NUM_PARALLEL slots), but only if the requests arrive together. Calls for
+the same (backend, task, model) that arrive within a short window are held
+and released as one batch:
+
+- identical request bodies in a batch are sent once and the reply is shared;
+- the remaining requests go out together, at most max_parallel at a time per group.
+
+Ollama has no multi-prompt generate endpoint, so a batch is dispatched as
+concurrent requests rather than a single HTTP call.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class _Batch:
+    def __init__(self, released):
+        self.released = released
+        self.size = 0
+        # request key -> future of the caller that sends it
+        self.leaders: Dict[Hashable, Any] = {}
+
+
+class _LeaderCancelled(Exception):
+    """Set on a shared request whose sender was cancelled; the first waiting follower sends it instead"""
+
+    def __init__(self, future):
+        super().__init__("batched request was cancelled")
+        self.future = future
+        self.claimed = False
+
+
+class _BatchStats:
+    def __init__(self):
+        self.batches_total = 0
+        self.requests_total = 0
+        self.coalesced_total = 0
+        self.max_batch_size = 0
+
+    def closed(self, batch: _Batch):
+        self.batches_total += 1
+        self.max_batch_size = max(self.max_batch_size, batch.size)
+
+    def stats(self) -> Dict:
+        return {
+            'batches_total': self.batches_total,
+            'requests_total': self.requests_total,
+            'coalesced_total': self.coalesced_total,
+            'mean_batch_size': self.requests_total / self.batches_total if self.batches_total else 0.0,
+            'max_batch_size': self.max_batch_size,
+        }
+
+
+def batch_settings_from_env() -> Optional[Dict]:
+    """MicroBatcher keyword arguments from LLM_BATCH_* environment variables, or None if disabled"""
+    if os.getenv('LLM_BATCH_ENABLED', 'true').lower() != 'true':
+        return None
+    return {
+        'window': float(os.getenv('LLM_BATCH_WINDOW_MS', '5')) / 1000.0,
+        'max_size': int(os.getenv('LLM_BATCH_MAX_SIZE', '16')),
+        'max_parallel': int(os.getenv('LLM_BATCH_MAX_PARALLEL', '4')),
+    }
+
+
+class MicroBatcher:
+    """Thread-based batcher: each caller still sends its own request from its own thread"""
+
+    def __init__(self, window: float = 0.005, max_size: int = 16, max_parallel: int = 4):
+        self.window = window
+        self.max_size = max_size
+        self.max_parallel = max_parallel
+        self._open: Dict[Hashable, _Batch] = {}
+        self._slots: Dict[Hashable, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self._stats = _BatchStats()
+
+    def submit(self, group: Hashable, key: Hashable, call: Callable[[], Any]) -> Any:
+        """Run call() as part of the current batch for group, sharing the result for identical keys"""
+        with self._lock:
+            batch = self._open.get(group)
+            opener = batch is None
+            if opener:
+                batch = self._open[group] = _Batch(threading.Event())
+                self._slots.setdefault(group, threading.BoundedSemaphore(self.max_parallel))
+            future = batch.leaders.get(key)
+            leader = future is None
+            if leader:
+                future = batch.leaders[key] = Future()
+            else:
+                self._stats.coalesced_total += 1
+            batch.size += 1
+            self._stats.requests_total += 1
+            if batch.size >= self.max_size:
+                self._close(group, batch)
+
+        if opener:
+            batch.released.wait(self.window)
+            with self._lock:
+                self._close(group, batch)
+        else:
+            batch.released.wait()
+
+        if not leader:
+            return future.result()
+        try:
+            with self._slots[group]:
+                result = call()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+    def _close(self, group: Hashable, batch: _Batch):
+        # Called with the lock held
+        if self._open.get(group) is batch:
+            del self._open[group]
+            self._stats.closed(batch)
+            batch.released.set()
+
+    def stats(self) -> Dict:
+        return self._stats.stats()
+
+
+class AsyncMicroBatcher:
+    """Event-loop variant of MicroBatcher; use from a single event loop only"""
+
+    def __init__(self, window: float = 0.005, max_size: int = 16, max_parallel: int = 4):
+        self.window = window
+        self.max_size = max_size
+        self.max_parallel = max_parallel
+        self._open: Dict[Hashable, _Batch] = {}
+        self._slots: Dict[Hashable, asyncio.Semaphore] = {}
+        self._stats = _BatchStats()
+
+    async def submit(self, group: Hashable, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Async variant of MicroBatcher.submit"""
+        batch = self._open.get(group)
+        opener = batch is None
+        if opener:
+            batch = self._open[group] = _Batch(asyncio.Event())
+            if group not in self._slots:
+                self._slots[group] = asyncio.Semaphore(self.max_parallel)
+        future = batch.leaders.get(key)
+        leader = future is None
+        if leader:
+            future = batch.leaders[key] = asyncio.get_running_loop().create_future()
+        else:
+            self._stats.coalesced_total += 1
+        batch.size += 1
+        self._stats.requests_total += 1
+        if batch.size >= self.max_size:
+            self._close(group, batch)
+
+        if opener:
+            try:
+                await asyncio.wait_for(batch.released.wait(), self.window)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._close(group, batch)
+        else:
+            await batch.released.wait()
+
+        while not leader:
+            try:
+                # shield: a follower cancelled by a hedge race must not cancel the shared request
+                return await asyncio.shield(future)
+            except _LeaderCancelled as handoff:
+                future = handoff.future
+                leader = not handoff.claimed
+                handoff.claimed = True
+        try:
+            async with self._slots[group]:
+                result = await call()
+        except asyncio.CancelledError:
+            # A cancelled sender is not a backend failure: hand the request to a follower
+            future.set_exception(_LeaderCancelled(asyncio.get_running_loop().create_future()))
+            # Nobody else may be waiting; mark the exception as retrieved
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        future.set_result(result)
+        return result
+
+    def _close(self, group: Hashable, batch: _Batch):
+        if self._open.get(group) is batch:
+            del self._open[group]
+            self._stats.closed(batch)
+            batch.released.set()
+
+    def stats(self) -> Dict:
+        return self._stats.stats()
@@ -0,0 +1,325 @@
+import atexit
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from question_dedup import normalize_question
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_answer(answer: Any) -> Any:
+    """True/False/None for the answer spellings clients send"""
+    if isinstance(answer, str):
+        answer = answer.strip().lower()
+        if answer in ('yes', 'true'):
+            return True
+        elif answer in ('no', 'false'):
+            return False
+        elif answer in ('unsure', 'dont_know'):
+            return None
+    return answer
+
+
+def normalize_answers(answers: Dict) -> list:
+    """Canonical, order-independent form of an answers dict"""
+    normalized = [[str(question_id), normalize_answer(answer)] for question_id, answer in answers.items()]
+    normalized.sort(key=lambda item: (len(item[0]), item[0]))
+    return normalized
+
+
+def answer_features(answers: Dict, question_texts: Optional[Dict]) -> Set[str]:
+    """(normalised question text, answer) pairs of the answered questions whose text is known"""
+    question_texts = question_texts or {}
+    features = set()
+    for question_id, answer in answers.items():
+        answer = normalize_answer(answer)
+        text = question_texts.get(question_id)
+        if answer is None or not text:
+            continue
+        features.add(f"{' '.join(normalize_question(text))}={str(answer).lower()}")
+    return features
+
+
+def make_cache_key(task: str, backend: str, model: str, answers: Dict, extra: Any = None) -> str:
+    """Hash (task, backend, model, normalized answers) and any other JSON-able prompt input into a cache key"""
+    parts = [task, backend, model, normalize_answers(answers)]
+    if extra is not None:
+        parts.append(extra)
+    payload = json.dumps(parts, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """Thread-safe LRU cache with TTL and byte budget for LLM results"""
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 16 * 1024 * 1024,
+                 ttl: float = 3600.0, persist_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.persist_path = persist_path
+
+        # key -> (expires_at, size, value)
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if persist_path:
+            self.load()
+            atexit.register(self.save)
+
+    @classmethod
+    def from_env(cls) -> Optional['LLMResponseCache']:
+        """Build a cache from LLM_CACHE_* environment variables, or None if disabled"""
+        if os.getenv('LLM_CACHE_ENABLED', 'true').lower() != 'true':
+            return None
+        return cls(
+            max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', '10000')),
+            max_bytes=int(os.getenv('LLM_CACHE_MAX_BYTES', str(16 * 1024 * 1024))),
+            ttl=float(os.getenv('LLM_CACHE_TTL', '3600')),
+            persist_path=os.getenv('LLM_CACHE_PATH') or None,
+        )
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Return (hit, value) for a key, refreshing its LRU position"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            expires_at, size, value = entry
+            if expires_at < time.time():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return True, copy.deepcopy(value)
+
+    def put(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store a JSON-serializable value, evicting least recently used entries"""
+        size = len(key) + len(json.dumps(value, separators=(',', ':')))
+        if size > self.max_bytes:
+            return
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, size, copy.deepcopy(value))
+            self.total_bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> Dict:
+        """Get hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    def save(self):
+        """Write unexpired entries to persist_path"""
+        if not self.persist_path:
+            return
+        now = time.time()
+        with self._lock:
+            rows = [[key, expires_at, value] for key, (expires_at, _, value) in self._entries.items() if expires_at >= now]
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(rows, f, separators=(',', ':'))
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            logger.warning("Error saving LLM cache: %s", e)
+
+    def load(self):
+        """Load unexpired entries from persist_path, oldest first"""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path) as f:
+                rows = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Error loading LLM cache: %s", e)
+            return
+        now = time.time()
+        for key, expires_at, value in rows:
+            if expires_at >= now:
+                self.put(key, value, ttl=expires_at - now)
+
+
+class MinHashLSHCache:
+    """Approximate-match cache: results of answer sets with similar (question, answer) pairs
+
+    Each answer set is sketched with MinHash and indexed by LSH bands, so a
+    lookup only compares against entries sharing at least one band. A stored
+    result is returned when the estimated Jaccard similarity of the two sets
+    reaches threshold. Entries are scoped (e.g. by task, backend and model)
+    and evicted least recently used beyond max_entries.
+    """
+
+    # Universal hashing modulo a Mersenne prime; 32-bit inputs keep a * x + b inside uint64
+    _PRIME = np.uint64((1 << 61) - 1)
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, max_entries: int = 5000,
+                 min_features: int = 4, ttl: float = 3600.0, seed: int = 1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.max_entries = max_entries
+        self.min_features = min_features
+        self.ttl = ttl
+        self.rows = self._rows_per_band(threshold, num_perm)
+        self.bands = num_perm // self.rows
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+        # entry id -> (expires_at, scope, signature, band keys, value), least recently used first
+        self._entries: "OrderedDict[int, Tuple[float, Hashable, np.ndarray, List[bytes], Any]]" = OrderedDict()
+        self._buckets: Dict[bytes, Set[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> Optional['MinHashLSHCache']:
+        """Build a cache from LLM_SIMILARITY_* environment variables, or None if disabled"""
+        if os.getenv('LLM_SIMILARITY_CACHE_ENABLED', 'true').lower() != 'true':
+            return None
+        return cls(
+            threshold=float(os.getenv('LLM_SIMILARITY_THRESHOLD', '0.8')),
+            num_perm=int(os.getenv('LLM_SIMILARITY_NUM_PERM', '64')),
+            max_entries=int(os.getenv('LLM_SIMILARITY_MAX_ENTRIES', '5000')),
+            min_features=int(os.getenv('LLM_SIMILARITY_MIN_FEATURES', '4')),
+            ttl=float(os.getenv('LLM_CACHE_TTL', '3600')),
+        )
+
+    @staticmethod
+    def _rows_per_band(threshold: float, num_perm: int) -> int:
+        """Rows per band whose LSH candidate threshold (1/b)^(1/r) is the highest not above threshold"""
+        best = 1
+        for rows in range(1, num_perm + 1):
+            if num_perm % rows == 0 and (rows / num_perm) ** (1.0 / rows) <= threshold:
+                best = rows
+        return best
+
+    def signature(self, features: Iterable[str]) -> np.ndarray:
+        """MinHash signature of a feature set"""
+        hashes = np.fromiter((zlib.crc32(feature.encode('utf-8')) for feature in features), dtype=np.uint64)
+        values = (np.outer(hashes, self._a) + self._b) % self._PRIME
+        return values.min(axis=0)
+
+    def _band_keys(self, scope: Hashable, signature: np.ndarray) -> List[bytes]:
+        prefix = repr(scope).encode('utf-8')
+        return [
+            hashlib.blake2b(prefix + bytes([band]) + signature[band * self.rows:(band + 1) * self.rows].tobytes(),
+                            digest_size=12).digest()
+            for band in range(self.bands)
+        ]
+
+    def get(self, scope: Hashable, features: Set[str]) -> Tuple[bool, Any, float]:
+        """Return (hit, value, similarity) for the most similar stored answer set in scope"""
+        if len(features) < self.min_features:
+            return False, None, 0.0
+        signature = self.signature(features)
+        now = time.time()
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(scope, signature):
+                candidates.update(self._buckets.get(key, ()))
+            best_id, best_similarity = None, 0.0
+            for entry_id in candidates:
+                expires_at, entry_scope, entry_signature, _, _ = self._entries[entry_id]
+                if expires_at < now:
+                    self._remove(entry_id)
+                    continue
+                if entry_scope != scope:
+                    continue
+                similarity = float(np.mean(entry_signature == signature))
+                if similarity > best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+            if best_id is None or best_similarity < self.threshold:
+                self.misses += 1
+                return False, None, best_similarity
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            value = self._entries[best_id][4]
+        return True, copy.deepcopy(value), best_similarity
+
+    def put(self, scope: Hashable, features: Set[str], value: Any):
+        """Store a result for an answer set, evicting least recently used entries"""
+        if len(features) < self.min_features:
+            return
+        signature = self.signature(features)
+        keys = self._band_keys(scope, signature)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (time.time() + self.ttl, scope, signature, keys, copy.deepcopy(value))
+            for key in keys:
+                self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, entry_id: int):
+        _, _, _, keys, _ = self._entries.pop(entry_id)
+        for key in keys:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'threshold': self.threshold,
+                'bands': self.bands,
+                'rows_per_band': self.rows,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,154 @@
+"""Circuit breakers per LLM backend and model
+
+A breaker watches the outcomes of the last calls to one (backend, model).
+When too many of them failed or took longer than slow_seconds, it opens and
+calls fail immediately, so an outage costs a fallback question instead of a
+connect or read timeout per call. After open_seconds it lets a few trial
+calls through (half-open): if they succeed it closes again, otherwise it
+reopens.
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Closed/open/half-open state of one (backend, model) from its recent calls"""
+
+    def __init__(self, window: int = 20, min_calls: int = 5, failure_rate: float = 0.5,
+                 slow_seconds: float = 10.0, slow_rate: float = 0.8, open_seconds: float = 30.0,
+                 half_open_calls: int = 2):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        # (failed, slow) per recent call while closed
+        self._outcomes = deque(maxlen=window)
+        self._trials = 0
+        self._trial_successes = 0
+        self._lock = threading.Lock()
+        self.rejected_total = 0
+        self.opened_total = 0
+
+    def _transition(self, state: str, now: float) -> str:
+        # Called with the lock held
+        self.state = state
+        if state == OPEN:
+            self.opened_at = now
+            self.opened_total += 1
+        elif state == CLOSED:
+            self._outcomes.clear()
+        self._trials = self._trial_successes = 0
+        return state
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now; half-open admits a few trial calls at a time"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at >= self.open_seconds:
+                self._transition(HALF_OPEN, now)
+                self.opened_at = now
+            if self.state == HALF_OPEN:
+                # Trials that never report back (cancelled hedges) are written off after open_seconds
+                if self._trials >= self.half_open_calls and now - self.opened_at >= self.open_seconds:
+                    self._trials = self._trial_successes
+                    self.opened_at = now
+                if self._trials < self.half_open_calls:
+                    self._trials += 1
+                    return True
+            elif self.state == CLOSED:
+                return True
+            self.rejected_total += 1
+            return False
+
+    def is_open(self) -> bool:
+        """Whether calls would be refused now, without taking a half-open trial"""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < self.open_seconds
+
+    def record(self, seconds: float, ok: bool) -> Optional[str]:
+        """Record a finished call; returns the new state when it changed"""
+        slow = seconds >= self.slow_seconds
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                if not ok or slow:
+                    return self._transition(OPEN, now)
+                self._trial_successes += 1
+                if self._trial_successes >= self.half_open_calls:
+                    return self._transition(CLOSED, now)
+                return None
+            if self.state == OPEN:
+                # A call admitted before the breaker opened
+                return None
+            self._outcomes.append((not ok, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return None
+            failures = sum(failed for failed, _ in self._outcomes)
+            slow_calls = sum(slow for _, slow in self._outcomes)
+            if failures / calls >= self.failure_rate or slow_calls / calls >= self.slow_rate:
+                return self._transition(OPEN, now)
+            return None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            calls = len(self._outcomes)
+            return {
+                'state': self.state,
+                'recent_calls': calls,
+                'failure_rate': sum(failed for failed, _ in self._outcomes) / calls if calls else 0.0,
+                'slow_rate': sum(slow for _, slow in self._outcomes) / calls if calls else 0.0,
+                'opened_total': self.opened_total,
+                'rejected_total': self.rejected_total,
+            }
+
+
+class CircuitBreakers:
+    """One CircuitBreaker per (backend, model), created on first use"""
+
+    def __init__(self, **settings):
+        self.settings = settings
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional['CircuitBreakers']:
+        """Breakers from LLM_CIRCUIT_* environment variables, or None if disabled"""
+        if os.getenv('LLM_CIRCUIT_ENABLED', 'true').lower() != 'true':
+            return None
+        return cls(
+            window=int(os.getenv('LLM_CIRCUIT_WINDOW', '20')),
+            min_calls=int(os.getenv('LLM_CIRCUIT_MIN_CALLS', '5')),
+            failure_rate=float(os.getenv('LLM_CIRCUIT_FAILURE_RATE', '0.5')),
+            slow_seconds=float(os.getenv('LLM_CIRCUIT_SLOW_SECONDS', '10')),
+            slow_rate=float(os.getenv('LLM_CIRCUIT_SLOW_RATE', '0.8')),
+            open_seconds=float(os.getenv('LLM_CIRCUIT_OPEN_SECONDS', '30')),
+            half_open_calls=int(os.getenv('LLM_CIRCUIT_HALF_OPEN_CALLS', '2')),
+        )
+
+    def get(self, backend: str, model: str) -> CircuitBreaker:
+        key = (backend, model)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(key, CircuitBreaker(**self.settings))
+        return breaker
+
+    def open_count(self) -> int:
+        """Breakers currently refusing calls"""
+        return sum(breaker.is_open() for breaker in list(self._breakers.values()))
+
+    def stats(self) -> Dict[str, Dict]:
+        return {f"{backend}/{model}": breaker.stats() for (backend, model), breaker in list(self._breakers.items())}
@@ -0,0 +1,268 @@
+import contextlib
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # Only needed for the async serving mode
+    httpx = None
+
+# Default pool settings per backend; overridable through environment variables
+# such as LLM_POOL_SIZE_OPENAI or LLM_READ_TIMEOUT_LOCAL_OLLAMA.
+DEFAULT_CLIENT_SETTINGS = {
+    'local_ollama': {'pool_size': 8, 'connect_timeout': 2.0, 'read_timeout': 30.0},
+    'openai': {'pool_size': 16, 'connect_timeout': 5.0, 'read_timeout': 30.0},
+    'anthropic': {'pool_size': 16, 'connect_timeout': 5.0, 'read_timeout': 30.0},
+}
+
+# API base URL per backend; LLM_BASE_URL_<BACKEND> points a backend elsewhere,
+# e.g. at a remote Ollama host or the benchmark stub server
+DEFAULT_BASE_URLS = {
+    'local_ollama': 'http://localhost:11434',
+    'openai': 'https://api.openai.com',
+    'anthropic': 'https://api.anthropic.com',
+}
+
+
+def backend_url(backend: str, path: str) -> str:
+    """Full URL of an API path on a backend"""
+    base = os.getenv(f'LLM_BASE_URL_{backend.upper()}') or DEFAULT_BASE_URLS[backend]
+    return base.rstrip('/') + path
+
+
+def is_timeout(error: BaseException) -> bool:
+    """Whether an exception raised by a sync or async client is a connect or read timeout"""
+    if isinstance(error, requests.Timeout):
+        return True
+    return httpx is not None and isinstance(error, httpx.TimeoutException)
+
+
+def _env_setting(name: str, backend: str, default: float) -> float:
+    """Read a per-backend setting, falling back to the global one and then the default"""
+    for key in (f'{name}_{backend.upper()}', name):
+        value = os.getenv(key)
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+    return default
+
+
+class PoolExhaustedError(Exception):
+    """Raised when a blocking pool has no free connection within the timeout"""
+
+
+class ProviderClient:
+    """Keep-alive HTTP client with a bounded connection pool for one LLM backend"""
+
+    def __init__(self, backend: str, pool_size: int = 8, connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0, block: bool = False):
+        self.backend = backend
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.block = block
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=block)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests_total = 0
+        self.errors_total = 0
+        self.pool_exhausted_total = 0
+
+    def _acquire(self):
+        """Reserve a pool slot, recording exhaustion when none is free"""
+        if self._slots.acquire(blocking=False):
+            return True
+        with self._lock:
+            self.pool_exhausted_total += 1
+        if self.block:
+            if not self._slots.acquire(timeout=self.timeout[0]):
+                raise PoolExhaustedError(f"No free connection for {self.backend} within {self.timeout[0]}s")
+            return True
+        # Non-blocking pools still issue the request on an overflow connection
+        return False
+
+    def request(self, method: str, url: str, timeout: Optional[Tuple[float, float]] = None, **kwargs) -> requests.Response:
+        """Issue a request through the pooled session"""
+        holds_slot = self._acquire()
+        with self._lock:
+            self.in_flight += 1
+            self.requests_total += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+        except Exception:
+            with self._lock:
+                self.errors_total += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            if holds_slot:
+                self._slots.release()
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def stats(self) -> Dict:
+        """Get pool usage counters for this backend"""
+        with self._lock:
+            return {
+                'pool_size': self.pool_size,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'requests_total': self.requests_total,
+                'errors_total': self.errors_total,
+                'pool_exhausted_total': self.pool_exhausted_total,
+            }
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncProviderClient:
+    """httpx.AsyncClient with a bounded keep-alive pool for one LLM backend"""
+
+    def __init__(self, backend: str, pool_size: int = 8, connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0):
+        if httpx is None:
+            raise RuntimeError("httpx is required for async LLM clients (pip install httpx)")
+        self.backend = backend
+        self.pool_size = pool_size
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout, pool=connect_timeout),
+        )
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests_total = 0
+        self.errors_total = 0
+        self.pool_exhausted_total = 0
+
+    def _start(self):
+        # Called from the event loop thread only, so no locking is needed
+        if self.in_flight >= self.pool_size:
+            self.pool_exhausted_total += 1
+        self.in_flight += 1
+        self.requests_total += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    async def request(self, method: str, url: str, **kwargs) -> 'httpx.Response':
+        """Issue a request through the pooled client"""
+        self._start()
+        try:
+            return await self.client.request(method, url, **kwargs)
+        except Exception:
+            self.errors_total += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def post(self, url: str, **kwargs) -> 'httpx.Response':
+        return await self.request('POST', url, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> 'httpx.Response':
+        return await self.request('GET', url, **kwargs)
+
+    @contextlib.asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        """Stream a response body; the pool slot is held until the block exits"""
+        self._start()
+        try:
+            async with self.client.stream(method, url, **kwargs) as response:
+                yield response
+        except Exception:
+            self.errors_total += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict:
+        return {
+            'pool_size': self.pool_size,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'requests_total': self.requests_total,
+            'errors_total': self.errors_total,
+            'pool_exhausted_total': self.pool_exhausted_total,
+        }
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class ProviderClientPool:
+    """Lazily created ProviderClient per backend, shared by every LLM call path"""
+
+    def __init__(self, settings: Optional[Dict[str, Dict]] = None):
+        self.settings = settings or DEFAULT_CLIENT_SETTINGS
+        self.block = os.getenv('LLM_POOL_BLOCK', 'false').lower() == 'true'
+        self._clients: Dict[str, ProviderClient] = {}
+        self._lock = threading.Lock()
+
+    def get(self, backend: str) -> ProviderClient:
+        """Get (or create) the client for a backend"""
+        client = self._clients.get(backend)
+        if client is not None:
+            return client
+        with self._lock:
+            if backend not in self._clients:
+                defaults = self.settings.get(backend, DEFAULT_CLIENT_SETTINGS['openai'])
+                self._clients[backend] = ProviderClient(
+                    backend,
+                    pool_size=int(_env_setting('LLM_POOL_SIZE', backend, defaults['pool_size'])),
+                    connect_timeout=_env_setting('LLM_CONNECT_TIMEOUT', backend, defaults['connect_timeout']),
+                    read_timeout=_env_setting('LLM_READ_TIMEOUT', backend, defaults['read_timeout']),
+                    block=self.block,
+                )
+            return self._clients[backend]
+
+    def stats(self) -> Dict[str, Dict]:
+        """Get pool usage counters for every backend used so far"""
+        return {backend: client.stats() for backend, client in list(self._clients.items())}
+
+    def close(self):
+        for client in list(self._clients.values()):
+            client.close()
+
+
+class AsyncProviderClientPool:
+    """Lazily created AsyncProviderClient per backend, using the same settings as ProviderClientPool"""
+
+    def __init__(self, settings: Optional[Dict[str, Dict]] = None):
+        self.settings = settings or DEFAULT_CLIENT_SETTINGS
+        self._clients: Dict[str, AsyncProviderClient] = {}
+
+    def get(self, backend: str) -> AsyncProviderClient:
+        """Get (or create) the async client for a backend"""
+        if backend not in self._clients:
+            defaults = self.settings.get(backend, DEFAULT_CLIENT_SETTINGS['openai'])
+            self._clients[backend] = AsyncProviderClient(
+                backend,
+                pool_size=int(_env_setting('LLM_POOL_SIZE', backend, defaults['pool_size'])),
+                connect_timeout=_env_setting('LLM_CONNECT_TIMEOUT', backend, defaults['connect_timeout']),
+                read_timeout=_env_setting('LLM_READ_TIMEOUT', backend, defaults['read_timeout']),
+            )
+        return self._clients[backend]
+
+    def stats(self) -> Dict[str, Dict]:
+        return {backend: client.stats() for backend, client in self._clients.items()}
+
+    async def aclose(self):
+        for client in list(self._clients.values()):
+            await client.aclose()
+        self._clients.clear()
@@ -0,0 +1,107 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from llm_clients import backend_url
+
+logger = logging.getLogger(__name__)
+
+# Cheap, token-free paths used to check that a backend is reachable
+HEALTH_ENDPOINTS = {
+    'local_ollama': '/api/tags',
+    'openai': '/v1/models',
+    'anthropic': '/v1/models',
+}
+
+# Environment variable holding the API key for each cloud backend
+API_KEY_ENV = {
+    'openai': 'OPENAI_API_KEY',
+    'anthropic': 'ANTHROPIC_API_KEY',
+}
+
+
+def _probe_headers(backend: str) -> Dict[str, str]:
+    if backend == 'openai':
+        return {'Authorization': f'Bearer {os.getenv("OPENAI_API_KEY")}'}
+    if backend == 'anthropic':
+        return {'x-api-key': os.getenv('ANTHROPIC_API_KEY'), 'anthropic-version': '2023-06-01'}
+    return {}
+
+
+def probe_backend(client, backend: str, timeout: float = 2.0) -> Dict:
+    """Check one backend, returning {'healthy', 'latency_ms', 'models', 'sizes', 'error'}"""
+    if backend in API_KEY_ENV and not os.getenv(API_KEY_ENV[backend]):
+        return {'healthy': False, 'latency_ms': None, 'models': [], 'error': 'no API key'}
+
+    started = time.perf_counter()
+    try:
+        response = client.get(backend_url(backend, HEALTH_ENDPOINTS[backend]), headers=_probe_headers(backend), timeout=(timeout, timeout))
+    except Exception as e:
+        return {'healthy': False, 'latency_ms': None, 'models': [], 'error': str(e)}
+    latency_ms = (time.perf_counter() - started) * 1000.0
+
+    if response.status_code != 200:
+        return {'healthy': False, 'latency_ms': latency_ms, 'models': [], 'error': f"HTTP {response.status_code}"}
+
+    models, sizes = [], {}
+    if backend == 'local_ollama':
+        try:
+            for model in response.json().get('models', []):
+                models.append(model['name'])
+                sizes[model['name']] = model.get('size', 0)
+        except (ValueError, KeyError, TypeError):
+            pass
+        if not models:
+            return {'healthy': False, 'latency_ms': latency_ms, 'models': [], 'error': 'no models pulled'}
+    return {'healthy': True, 'latency_ms': latency_ms, 'models': models, 'sizes': sizes, 'error': None}
+
+
+class HealthMonitor:
+    """Daemon thread that calls refresh() at startup and then every interval seconds"""
+
+    def __init__(self, refresh: Callable[[], None], interval: float = 30.0, min_interval: float = 5.0):
+        self.refresh = refresh
+        self.interval = interval
+        self.min_interval = min_interval
+        self.last_refresh: Optional[float] = None
+        self.discovered = threading.Event()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='llm-health', daemon=True)
+            self._thread.start()
+
+    def request_refresh(self):
+        """Probe again soon, e.g. after a backend call failed"""
+        self._wake.set()
+
+    def wait_for_discovery(self, timeout: Optional[float] = None) -> bool:
+        """Block until the first discovery pass has finished"""
+        return self.discovered.wait(timeout)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("LLM health refresh failed")
+            self.last_refresh = time.monotonic()
+            self.discovered.set()
+
+            if self.interval <= 0:
+                # Periodic probing disabled; only refresh when woken
+                self._wake.wait()
+            else:
+                self._wake.wait(self.interval)
+            self._wake.clear()
+            # Failures can arrive in bursts; do not probe more often than min_interval
+            self._stop.wait(max(0.0, self.min_interval - (time.monotonic() - self.last_refresh)))
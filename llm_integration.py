@@ -1,592 +1,1181 @@
-import requests
+import asyncio
 import json
+import logging
 import os
-import hashlib
-from typing import Dict, List, Optional, Any
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Any, Tuple
+from llm_circuit import CircuitBreakers
+from llm_clients import AsyncProviderClientPool, ProviderClientPool, backend_url, is_timeout
+from llm_batching import AsyncMicroBatcher, MicroBatcher, batch_settings_from_env
+from llm_cache import LLMResponseCache, MinHashLSHCache, answer_features, make_cache_key
+from llm_health import HEALTH_ENDPOINTS, HealthMonitor, probe_backend
+from llm_ratelimit import NEW_GAME_ANSWERS, ProviderLimiter, RateLimitedError, RateLimits
+from llm_routing import LatencyRouter, ModelRouter
+from metrics import (
+    LLM_CALL_SECONDS, LLM_CIRCUIT_REJECTED, LLM_CIRCUIT_TRANSITIONS, LLM_COMPLETION_TOKENS, LLM_PARSE_FAILURES,
+    LLM_PROMPT_TOKENS, LLM_RATE_LIMITED, LLM_TIMEOUTS
+)
+from ollama_context import OllamaContextStore
+from ollama_models import ModelResidencyManager
+from prompts import (
+    OLLAMA_OUTPUT_FORMATS, PREAMBLE, TASK_PROMPTS, PromptBuilder, TokenAccounting, estimate_tokens,
+    request_prompt_text, response_usage
+)
+
+logger = logging.getLogger(__name__)
+
+# (temperature, top_p, max tokens) per task
+TASK_OPTIONS = {
+    'question_generation': (0.7, 0.9, 50),
+    'identification': (0.3, 0.8, 200),
+    'analysis': (0.2, 0.8, 20),
+    'turn': (0.3, 0.8, 250),
+}
+
+# What a task returns when the backend fails
+TASK_DEFAULTS = {'analysis': 0.5}
+
+# Backends served by a local inference server that benefits from micro-batching
+BATCHED_BACKENDS = ('local_ollama',)
+
+CLOUD_MODELS = {
+    'openai': 'gpt-4',
+    'anthropic': 'claude-3-sonnet-20240229',
+}
 
 class LLMIntegration:
-    def __init__(self):
+    def __init__(self, background_discovery: Optional[bool] = None):
         self.current_llm = 'none'
-        self.available_llms = self._detect_available_llms()
-        self._select_best_llm()
+        self.available_llms = {}
+        self.health = {}
+        self.clients = ProviderClientPool()
+        self._async_clients = None
+        self.fused_turn_enabled = os.getenv('LLM_FUSED_TURN', 'true').lower() == 'true'
+        self.prompts = PromptBuilder.from_env()
+        self.token_usage = TokenAccounting()
+        self.cache = LLMResponseCache.from_env()
+        # Identification results reused for games with similar (question, answer) sets
+        self.similarity_cache = MinHashLSHCache.from_env()
+        
+        # Concurrent calls for the same task and model are released together in micro-batches
+        self._batch_settings = batch_settings_from_env()
+        self.batcher = MicroBatcher(**self._batch_settings) if self._batch_settings else None
+        self._async_batcher = None
+        
+        # Per-backend latency tracking; slow calls are hedged onto the next backend.
+        # Hedging only uses idle workers: calls never queue for one, so the hedge delay
+        # counts from when a call starts and a busy process stops hedging instead of
+        # waiting for workers
+        self.router = LatencyRouter.from_env()
+        hedge_workers = int(os.getenv('LLM_HEDGE_WORKERS', '16'))
+        self._hedge_executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix='llm-hedge')
+        self._hedge_slots = threading.BoundedSemaphore(hedge_workers)
+        
+        # Request and token budgets per cloud provider; in-progress games are served first
+        self.rate_limits = RateLimits.from_env()
+        
+        # Per-(backend, model) circuit breakers: a failing or hanging model fails fast while open
+        self.circuits = CircuitBreakers.from_env()
+        
+        # Per-(task, model) latency, failures and guess outcomes drive model choice
+        self.model_router = ModelRouter.from_env()
+        
+        # Keeps the Ollama models chosen for each task loaded between requests
+        self.ollama_models = ModelResidencyManager.from_env(self.clients.get('local_ollama'))
+        
+        # Ollama conversation state per game, so later turns only evaluate new answers
+        self.ollama_contexts = OllamaContextStore.from_env()
+        
+        # Backends are probed off the request path and re-probed periodically,
+        # so a restarted Ollama or a newly pulled model is picked up at runtime
+        self.health_timeout = float(os.getenv('LLM_HEALTH_TIMEOUT', '2'))
+        self._refresh_lock = threading.Lock()
+        self.health_monitor = HealthMonitor(
+            self.refresh_available_llms,
+            interval=float(os.getenv('LLM_HEALTH_INTERVAL', '30'))
+        )
+        if background_discovery is None:
+            background_discovery = os.getenv('LLM_DISCOVERY_BACKGROUND', 'true').lower() == 'true'
+        if background_discovery:
+            self.health_monitor.start()
+        else:
+            self.refresh_available_llms()
+    
+    def refresh_available_llms(self):
+        """Probe every backend and swap in the new model lists and current backend"""
+        with self._refresh_lock:
+            health = {}
+            for backend in HEALTH_ENDPOINTS:
+                health[backend] = probe_backend(self.clients.get(backend), backend, self.health_timeout)
+                health[backend]['checked_at'] = time.time()
+            available = self._detect_available_llms(health)
+            current = self._select_best_llm(available)
+            
+            # Readers never lock: each attribute is replaced by a complete new object
+            self.health = health
+            self.available_llms = available
+            if current != self.current_llm:
+                logger.info("LLM backend changed: %s -> %s", self.current_llm, current)
+            self.current_llm = current
+            
+            if 'local_ollama' in available:
+                self.ollama_models.refresh(health['local_ollama'].get('sizes'))
+                self.ollama_models.preload(self._ollama_task_models())
     
-    def _detect_available_llms(self):
-        """Detect available LLM services"""
+    def _detect_available_llms(self, health: Dict[str, Dict]) -> Dict[str, Dict]:
+        """Available LLM services from the latest health probes"""
         llms = {}
         
-        # Check Ollama (local)
-        try:
-            response = requests.get('http://localhost:11434/api/tags', timeout=2)
-            if response.status_code == 200:
-                models = response.json().get('models', [])
-                if models:
-                    llms['local_ollama'] = {
-                        'models': [model['name'] for model in models],
-                        'type': 'local',
-                        'priority': 1
-                    }
-        except:
-            pass
+        # Ollama (local)
+        if health.get('local_ollama', {}).get('healthy'):
+            llms['local_ollama'] = {
+                'models': health['local_ollama']['models'],
+                'type': 'local',
+                'priority': 1,
+                'latency_ms': health['local_ollama']['latency_ms']
+            }
         
-        # Check OpenAI
-        if os.getenv('OPENAI_API_KEY'):
+        # OpenAI
+        if health.get('openai', {}).get('healthy'):
             llms['openai'] = {
                 'models': ['gpt-4', 'gpt-3.5-turbo'],
                 'type': 'cloud',
-                'priority': 2
+                'priority': 2,
+                'latency_ms': health['openai']['latency_ms']
             }
         
-        # Check Anthropic
-        if os.getenv('ANTHROPIC_API_KEY'):
+        # Anthropic
+        if health.get('anthropic', {}).get('healthy'):
             llms['anthropic'] = {
                 'models': ['claude-3-opus-20240229', 'claude-3-sonnet-20240229'],
                 'type': 'cloud',
-                'priority': 3
+                'priority': 3,
+                'latency_ms': health['anthropic']['latency_ms']
             }
         
         return llms
     
-    def _select_best_llm(self):
+    def _select_best_llm(self, available_llms: Dict[str, Dict]) -> str:
         """Select the best available LLM"""
-        if not self.available_llms:
-            self.current_llm = 'none'
-            return
-        
         # Prefer local Ollama if available
-        if 'local_ollama' in self.available_llms:
-            self.current_llm = 'local_ollama'
-        elif 'openai' in self.available_llms:
-            self.current_llm = 'openai'
-        elif 'anthropic' in self.available_llms:
-            self.current_llm = 'anthropic'
-        else:
-            self.current_llm = 'none'
+        if 'local_ollama' in available_llms:
+            return 'local_ollama'
+        elif 'openai' in available_llms:
+            return 'openai'
+        elif 'anthropic' in available_llms:
+            return 'anthropic'
+        return 'none'
     
     def get_available_llms_info(self):
         """Get information about available LLMs"""
         return self.available_llms
     
-    def generate_smart_question(self, answers: Dict, asked_questions: set) -> Optional[str]:
-        """Generate the next smart question using LLM"""
+    def get_health_stats(self):
+        """Get the latest probe result for every backend"""
+        return self.health
+    
+    def get_batch_stats(self):
+        """Get micro-batching counters, or None when batching is disabled"""
+        if not self._batch_settings:
+            return None
+        stats = {'sync': self.batcher.stats()}
+        if self._async_batcher is not None:
+            stats['async'] = self._async_batcher.stats()
+        return stats
+    
+    def get_latency_stats(self):
+        """Get latency percentiles and hedging counters for each backend"""
+        return self.router.stats()
+    
+    def get_model_stats(self):
+        """Get Ollama model residency: keep-alive, budget and resident models"""
+        return self.ollama_models.stats()
+    
+    def get_context_stats(self):
+        """Get Ollama context reuse counters, or None when reuse is disabled"""
+        return self.ollama_contexts.stats() if self.ollama_contexts else None
+    
+    def get_routing_stats(self):
+        """Get per-task latency targets and per-model counters"""
+        return self.model_router.stats()
+    
+    def record_guess_outcome(self, task: str, model: str, correct: bool):
+        """Feed back whether a guess made by a model was right"""
+        self.model_router.record_guess(task, model, correct)
+    
+    def get_client_stats(self):
+        """Get connection pool usage for each LLM backend"""
+        stats = self.clients.stats()
+        if self._async_clients is not None:
+            stats.update({f"{backend}_async": s for backend, s in self._async_clients.stats().items()})
+        return stats
+    
+    def get_cache_stats(self):
+        """Get response cache counters, or None when caching is disabled"""
+        return self.cache.stats() if self.cache else None
+    
+    def get_token_stats(self):
+        """Get prompt and completion tokens per task"""
+        return self.token_usage.stats()
+    
+    def get_similarity_cache_stats(self):
+        """Get approximate-match cache counters, or None when it is disabled"""
+        return self.similarity_cache.stats() if self.similarity_cache else None
+    
+    def get_circuit_stats(self):
+        """Get circuit breaker state per backend and model, or None when breakers are disabled"""
+        return self.circuits.stats() if self.circuits else None
+    
+    def get_rate_limit_stats(self):
+        """Get per-provider rate limiter state, or None when rate limiting is disabled"""
+        return self.rate_limits.stats() if self.rate_limits else None
+    
+    @property
+    def async_batcher(self) -> Optional[AsyncMicroBatcher]:
+        """Async micro-batcher, created on first use inside the running event loop"""
+        if self._async_batcher is None and self._batch_settings:
+            self._async_batcher = AsyncMicroBatcher(**self._batch_settings)
+        return self._async_batcher
+    
+    @property
+    def async_clients(self) -> AsyncProviderClientPool:
+        """Async HTTP clients, created on first use inside the running event loop"""
+        if self._async_clients is None:
+            self._async_clients = AsyncProviderClientPool()
+        return self._async_clients
+    
+    def _current_model(self, task: str) -> str:
+        """Model the current backend would use for a task"""
+        return self._backend_model(self.current_llm, task)
+    
+    def _backend_model(self, backend: str, task: str) -> str:
+        """Model a backend would use for a task"""
+        if backend == 'local_ollama':
+            return self._select_best_ollama_model(task)
+        return CLOUD_MODELS.get(backend, 'none')
+    
+    def _cache_key(self, task: str, answers: Dict, question_texts: Optional[Dict] = None,
+                   avoid: Iterable[str] = ()) -> Optional[str]:
+        """Cache key for a task on the current backend/model, answers and the question texts in the prompt"""
+        if not self.cache:
+            return None
+        extra = None
+        if question_texts or avoid:
+            texts = sorted([str(question_id), text] for question_id, text in (question_texts or {}).items())
+            extra = [texts, sorted(avoid)]
+        return make_cache_key(task, self.current_llm, self._current_model(task), answers, extra)
+    
+    def _cache_get(self, key: Optional[str]):
+        if key is None:
+            return False, None
+        return self.cache.get(key)
+    
+    def _sketch(self, answers: Dict, question_texts: Optional[Dict]) -> Optional[set]:
+        """Features for the approximate-match cache, or None when it is disabled"""
+        if not self.similarity_cache:
+            return None
+        return answer_features(answers, question_texts)
+    
+    def _similar_get(self, task: str, sketch: Optional[set]):
+        if not sketch:
+            return False, None
+        hit, value, similarity = self.similarity_cache.get((task, self.current_llm, self._current_model(task)), sketch)
+        if hit:
+            logger.info("Similarity cache hit for %s (%.2f)", task, similarity)
+        return hit, value
+    
+    def _cache_put(self, key: Optional[str], value: Any):
+        # None is what every backend returns on failure, so never cache it
+        if key is not None and value is not None:
+            self.cache.put(key, value)
+    
+    def generate_smart_question(self, answers: Dict, asked_questions: set, session_id: Optional[str] = None,
+                                question_texts: Optional[Dict] = None, avoid: Iterable[str] = ()) -> Optional[str]:
+        """Generate the next smart question using LLM; avoid lists rejected questions to steer away from"""
         if self.current_llm == 'none':
             return None
         
         # Prepare context from previous answers
-        context = self._prepare_question_context(answers, asked_questions)
-        
-        if self.current_llm == 'local_ollama':
-            return self._generate_question_with_ollama(context)
-        elif self.current_llm == 'openai':
-            return self._generate_question_with_openai(context)
-        elif self.current_llm == 'anthropic':
-            return self._generate_question_with_anthropic(context)
-        
-        return None
+        context = self._prepare_question_context(answers, asked_questions, question_texts, avoid)
+        question, _ = self._run_task('question_generation', answers, context,
+                                     self._session(session_id, answers, asked_questions, question_texts),
+                                     self._cache_key('question_generation', answers, question_texts, avoid))
+        return question
     
-    def identify_person(self, answers: Dict) -> Optional[Dict]:
-        """Identify the person based on answers using LLM"""
+    def identify_person(self, answers: Dict, session_id: Optional[str] = None,
+                        question_texts: Optional[Dict] = None) -> Tuple[Optional[Dict], Optional[Tuple]]:
+        """Identify the person based on answers using LLM
+        
+        Returns the person and the (backend, model) that answered, or None as the
+        source when the answer came from a cache.
+        """
         if self.current_llm == 'none':
-            return None
+            return None, None
         
         # Prepare context from answers
-        context = self._prepare_identification_context(answers)
-        
-        if self.current_llm == 'local_ollama':
-            return self._identify_person_with_ollama(context)
-        elif self.current_llm == 'openai':
-            return self._identify_person_with_openai(context)
-        elif self.current_llm == 'anthropic':
-            return self._identify_person_with_anthropic(context)
-        
-        return None
+        context = self._prepare_identification_context(answers, question_texts)
+        return self._run_task('identification', answers, context,
+                              self._session(session_id, answers, question_texts=question_texts),
+                              self._cache_key('identification', answers, question_texts),
+                              self._sketch(answers, question_texts))
     
-    def analyze_confidence_for_guess(self, answers: Dict) -> float:
+    def analyze_confidence_for_guess(self, answers: Dict, session_id: Optional[str] = None,
+                                     question_texts: Optional[Dict] = None) -> float:
         """Analyze if we should make a guess based on current answers"""
         if self.current_llm == 'none':
             return 0.5
         
-        # Prepare context
-        context = self._prepare_confidence_context(answers)
+        context = self._prepare_confidence_context(answers, question_texts)
+        confidence, _ = self._run_task('analysis', answers, context,
+                                       self._session(session_id, answers, question_texts=question_texts),
+                                       self._cache_key('analysis', answers, question_texts))
+        return confidence
+    
+    def analyze_turn(self, answers: Dict, asked_questions: set, session_id: Optional[str] = None,
+                     question_texts: Optional[Dict] = None) -> Tuple[Optional[Dict], Optional[Tuple]]:
+        """Get guess decision, best candidate and next question from a single LLM call
         
-        if self.current_llm == 'local_ollama':
-            return self._analyze_confidence_with_ollama(context)
-        elif self.current_llm == 'openai':
-            return self._analyze_confidence_with_openai(context)
-        elif self.current_llm == 'anthropic':
-            return self._analyze_confidence_with_anthropic(context)
+        Returns the turn and its source, as identify_person does.
+        """
+        if self.current_llm == 'none' or not self.fused_turn_enabled:
+            return None, None
+        
+        # A guess made for a similar answer set ends the turn without a call
+        sketch = self._sketch(answers, question_texts)
+        hit, guess = self._similar_get('turn', sketch)
+        if hit:
+            return dict(guess, question=None), None
         
-        return 0.5
+        context = self._prepare_turn_context(answers, asked_questions, question_texts)
+        result, source = self._run_task('turn', answers, context,
+                                        self._session(session_id, answers, asked_questions, question_texts),
+                                        self._cache_key('turn', answers, question_texts))
+        self._store_turn_guess(sketch, result)
+        return result, source
     
-    def _prepare_question_context(self, answers: Dict, asked_questions: set) -> str:
-        """Prepare context for question generation"""
-        if not answers:
-            return "No previous answers available. Generate a general question to start narrowing down the person."
+    def stream_smart_question(self, answers: Dict, asked_questions: set, session_id: Optional[str] = None,
+                              question_texts: Optional[Dict] = None) -> Iterator[str]:
+        """Generate the next smart question using LLM, yielding text as it is produced"""
+        if self.current_llm == 'none':
+            return
         
-        # Convert answers to readable format
-        answer_texts = []
-        for question_id, answer in answers.items():
-            if answer is not None:  # Skip unsure/don't know answers
-                answer_texts.append(f"Question {question_id}: {answer}")
+        cache_key = self._cache_key('question_generation', answers, question_texts)
+        hit, cached = self._cache_get(cache_key)
+        if hit:
+            yield cached
+            return
         
-        context = f"""
-        Previous answers: {', '.join(answer_texts) if answer_texts else 'None'}
+        context = self._prepare_question_context(answers, asked_questions, question_texts)
+        chunks = []
+        session = self._session(session_id, answers, asked_questions, question_texts)
+        for chunk in self._stream_backend(self.current_llm, 'question_generation', context, session,
+                                          len(answers) >= NEW_GAME_ANSWERS):
+            chunks.append(chunk)
+            yield chunk
         
-        Generate the next most informative yes/no question to narrow down the person.
-        The question should be specific and help eliminate many possibilities.
-        """
-        return context
+        self._store_result('question_generation', cache_key, self._parse_task_output('question_generation', ''.join(chunks)))
     
-    def _prepare_identification_context(self, answers: Dict) -> str:
-        """Prepare context for person identification"""
-        if not answers:
-            return "No answers available for identification."
+    async def agenerate_smart_question(self, answers: Dict, asked_questions: set, session_id: Optional[str] = None,
+                                       question_texts: Optional[Dict] = None, avoid: Iterable[str] = ()) -> Optional[str]:
+        """Async variant of generate_smart_question"""
+        if self.current_llm == 'none':
+            return None
+        question, _ = await self._arun_task('question_generation', answers,
+                                            self._prepare_question_context(answers, asked_questions, question_texts, avoid),
+                                            self._session(session_id, answers, asked_questions, question_texts),
+                                            self._cache_key('question_generation', answers, question_texts, avoid))
+        return question
+    
+    async def aidentify_person(self, answers: Dict, session_id: Optional[str] = None,
+                               question_texts: Optional[Dict] = None) -> Tuple[Optional[Dict], Optional[Tuple]]:
+        """Async variant of identify_person"""
+        if self.current_llm == 'none':
+            return None, None
+        return await self._arun_task('identification', answers, self._prepare_identification_context(answers, question_texts),
+                                     self._session(session_id, answers, question_texts=question_texts),
+                                     self._cache_key('identification', answers, question_texts),
+                                     self._sketch(answers, question_texts))
+    
+    async def aanalyze_confidence_for_guess(self, answers: Dict, session_id: Optional[str] = None,
+                                            question_texts: Optional[Dict] = None) -> float:
+        """Async variant of analyze_confidence_for_guess"""
+        if self.current_llm == 'none':
+            return 0.5
+        confidence, _ = await self._arun_task('analysis', answers, self._prepare_confidence_context(answers, question_texts),
+                                              self._session(session_id, answers, question_texts=question_texts),
+                                              self._cache_key('analysis', answers, question_texts))
+        return confidence
+    
+    async def aanalyze_turn(self, answers: Dict, asked_questions: set, session_id: Optional[str] = None,
+                            question_texts: Optional[Dict] = None) -> Tuple[Optional[Dict], Optional[Tuple]]:
+        """Async variant of analyze_turn"""
+        if self.current_llm == 'none' or not self.fused_turn_enabled:
+            return None, None
+        sketch = self._sketch(answers, question_texts)
+        hit, guess = self._similar_get('turn', sketch)
+        if hit:
+            return dict(guess, question=None), None
+        result, source = await self._arun_task('turn', answers, self._prepare_turn_context(answers, asked_questions, question_texts),
+                                               self._session(session_id, answers, asked_questions, question_texts),
+                                               self._cache_key('turn', answers, question_texts))
+        self._store_turn_guess(sketch, result)
+        return result, source
+    
+    async def astream_smart_question(self, answers: Dict, asked_questions: set, session_id: Optional[str] = None,
+                                     question_texts: Optional[Dict] = None) -> AsyncIterator[str]:
+        """Async variant of stream_smart_question"""
+        if self.current_llm == 'none':
+            return
         
-        # Convert answers to readable format
-        answer_texts = []
-        for question_id, answer in answers.items():
-            if answer is not None:  # Skip unsure/don't know answers
-                answer_texts.append(f"Question {question_id}: {answer}")
+        cache_key = self._cache_key('question_generation', answers, question_texts)
+        hit, cached = self._cache_get(cache_key)
+        if hit:
+            yield cached
+            return
         
-        context = f"""
-        Based on these answers: {', '.join(answer_texts)}
+        context = self._prepare_question_context(answers, asked_questions, question_texts)
+        chunks = []
+        session = self._session(session_id, answers, asked_questions, question_texts)
+        async for chunk in self._astream_backend(self.current_llm, 'question_generation', context, session,
+                                                 len(answers) >= NEW_GAME_ANSWERS):
+            chunks.append(chunk)
+            yield chunk
+        
+        self._store_result('question_generation', cache_key, self._parse_task_output('question_generation', ''.join(chunks)))
+    
+    def end_session(self, session_id: str):
+        """Forget per-game backend state (Ollama contexts) once a game is over"""
+        if self.ollama_contexts is not None:
+            self.ollama_contexts.end_game(session_id)
+    
+    def _session(self, session_id: Optional[str], answers: Dict, asked_questions: Optional[set] = None,
+                 question_texts: Optional[Dict] = None) -> Optional[Tuple]:
+        """(game id, answers, asked questions, question texts) for backends that keep per-game state"""
+        if session_id is None or self.ollama_contexts is None:
+            return None
+        return (session_id, answers, asked_questions or set(), question_texts)
+    
+    async def aclose(self):
+        """Close async HTTP clients; call on event loop shutdown"""
+        if self._async_clients is not None:
+            await self._async_clients.aclose()
+            self._async_clients = None
+        self._async_batcher = None
+    
+    def _run_task(self, task: str, answers: Dict, context: str, session: Optional[Tuple] = None,
+                  cache_key: Optional[str] = None, sketch: Optional[set] = None) -> Tuple[Any, Optional[Tuple]]:
+        """Run a task on the current backend through the response cache, then the similarity cache if sketched
         
-        Identify the most likely person. Return a JSON object with:
-        - name: full name
-        - description: brief description
-        - image: URL to their image
-        - confidence: confidence level (0-1)
+        Returns the result and the (backend, model) that produced it; the source
+        is None for cache hits and failures.
         """
-        return context
+        cache_key = cache_key or self._cache_key(task, answers)
+        hit, cached = self._cache_get(cache_key)
+        if not hit:
+            hit, cached = self._similar_get(task, sketch)
+        if hit:
+            return cached, None
+        
+        result, source = self._route_call(task, context, session, len(answers) >= NEW_GAME_ANSWERS)
+        self._store_result(task, cache_key, result, sketch)
+        return result, source
+    
+    async def _arun_task(self, task: str, answers: Dict, context: str, session: Optional[Tuple] = None,
+                         cache_key: Optional[str] = None, sketch: Optional[set] = None) -> Tuple[Any, Optional[Tuple]]:
+        """Async variant of _run_task"""
+        cache_key = cache_key or self._cache_key(task, answers)
+        hit, cached = self._cache_get(cache_key)
+        if not hit:
+            hit, cached = self._similar_get(task, sketch)
+        if hit:
+            return cached, None
+        
+        result, source = await self._aroute_call(task, context, session, len(answers) >= NEW_GAME_ANSWERS)
+        self._store_result(task, cache_key, result, sketch)
+        return result, source
+    
+    def _store_result(self, task: str, cache_key: Optional[str], result: Any, sketch: Optional[set] = None):
+        # Task defaults (such as the 0.5 confidence) are also what failures return, so never cache them
+        if result != TASK_DEFAULTS.get(task) and result is not None:
+            self._cache_put(cache_key, result)
+            if sketch:
+                self.similarity_cache.put((task, self.current_llm, self._current_model(task)), sketch, result)
+    
+    def _store_turn_guess(self, sketch: Optional[set], result: Optional[Dict]):
+        # Only the guess part of a turn carries over to similar answer sets; the next
+        # question depends on exactly which questions were asked, so it is never reused
+        if sketch and result and result['should_guess']:
+            self.similarity_cache.put(('turn', self.current_llm, self._current_model('turn')), sketch,
+                                      {key: result[key] for key in ('should_guess', 'confidence', 'person')})
     
-    def _prepare_confidence_context(self, answers: Dict) -> str:
+    def _prepare_question_context(self, answers: Dict, asked_questions: set, question_texts: Optional[Dict] = None,
+                                  avoid: Iterable[str] = ()) -> str:
+        """Prepare context for question generation"""
+        return self.prompts.context('question_generation', answers, asked_questions, question_texts, avoid)
+    
+    def _prepare_identification_context(self, answers: Dict, question_texts: Optional[Dict] = None) -> str:
+        """Prepare context for person identification"""
+        return self.prompts.context('identification', answers, question_texts=question_texts)
+    
+    def _prepare_confidence_context(self, answers: Dict, question_texts: Optional[Dict] = None) -> str:
         """Prepare context for confidence analysis"""
-        if not answers:
-            return "No answers available."
+        return self.prompts.context('analysis', answers, question_texts=question_texts)
+    
+    def _prepare_turn_context(self, answers: Dict, asked_questions: set, question_texts: Optional[Dict] = None) -> str:
+        """Prepare context for a fused guess/identify/next-question turn"""
+        return self.prompts.context('turn', answers, asked_questions, question_texts)
+    
+    def _parse_turn_response(self, response_text: str) -> Optional[Dict]:
+        """Parse the JSON object returned by a fused turn completion"""
+        start = response_text.find('{')
+        end = response_text.rfind('}') + 1
+        if start == -1 or end <= start:
+            return None
         
-        answer_texts = []
-        for question_id, answer in answers.items():
-            if answer is not None:
-                answer_texts.append(f"Question {question_id}: {answer}")
+        try:
+            data = json.loads(response_text[start:end])
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(data, dict):
+            return None
         
-        context = f"""
-        Based on these answers: {', '.join(answer_texts)}
+        try:
+            confidence = max(0.0, min(1.0, float(data.get('confidence', 0.0))))
+        except (TypeError, ValueError):
+            confidence = 0.0
         
-        Should we make a guess now? Consider:
-        1. How specific the answers are
-        2. How many questions we've asked
-        3. Whether we have enough information
+        person = data.get('person')
+        if not (isinstance(person, dict) and all(key in person for key in ['name', 'description', 'confidence'])):
+            person = None
+        elif 'image' not in person:
+            person['image'] = f"https://en.wikipedia.org/wiki/{person['name'].replace(' ', '_')}"
         
-        Return only a number between 0 and 1 representing confidence.
-        """
-        return context
+        question = data.get('question')
+        if not (isinstance(question, str) and question.strip() and len(question.strip()) < 100):
+            question = None
+        else:
+            question = question.strip()
+        
+        if person is None and question is None:
+            return None
+        
+        return {
+            'should_guess': bool(data.get('should_guess')) and person is not None,
+            'confidence': confidence,
+            'person': person,
+            'question': question
+        }
     
-    def _generate_question_with_ollama(self, context: str) -> Optional[str]:
-        """Generate question using Ollama"""
+    def _parse_person_response(self, response_text: str) -> Optional[Dict]:
+        """Parse the JSON person object returned by an identification completion"""
+        # Find JSON in response
+        start = response_text.find('{')
+        end = response_text.rfind('}') + 1
+        if start == -1 or end <= start:
+            return None
+        
         try:
-            # Select best model for question generation
-            model = self._select_best_ollama_model('question_generation')
-            
-            prompt = f"""You are playing Akinator. Generate ONE short yes/no question to narrow down the person.
-
-{context}
-
-RULES:
-- Question must be short (max 10 words)
-- Must be yes/no only
-- No explanations or emojis
-- Focus on distinctive traits
-
-Return ONLY the question text."""
-            
-            response = requests.post(
-                'http://localhost:11434/api/generate',
-                json={
-                    'model': model,
-                    'prompt': prompt,
-                    'stream': False,
-                    'options': {
-                        'temperature': 0.7,
-                        'top_p': 0.9,
-                        'num_predict': 50
-                    }
-                },
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                question = result.get('response', '').strip()
-                if question and len(question) < 100:  # Sanity check
-                    return question
-            
-        except Exception as e:
-            print(f"Error generating question with Ollama: {e}")
+            person_data = json.loads(response_text[start:end])
+        except json.JSONDecodeError:
+            return None
         
+        # Validate required fields
+        if not (isinstance(person_data, dict) and all(key in person_data for key in ['name', 'description', 'confidence'])):
+            return None
+        
+        # Add default image if not provided
+        if 'image' not in person_data:
+            person_data['image'] = f"https://en.wikipedia.org/wiki/{person_data['name'].replace(' ', '_')}"
+        return person_data
+    
+    def _parse_confidence_response(self, response_text: str) -> Optional[float]:
+        """Extract a confidence between 0 and 1 from a completion"""
+        numbers = re.findall(r'0\.\d+|\d+\.\d+|\d+', response_text)
+        if not numbers:
+            return None
+        return max(0.0, min(1.0, float(numbers[0])))  # Clamp between 0 and 1
+    
+    def _parse_task_output(self, task: str, response_text: str) -> Any:
+        """Turn completion text into the task's result, or None if unusable"""
+        response_text = response_text.strip()
+        if task == 'question_generation':
+            return response_text if response_text and len(response_text) < 100 else None  # Sanity check
+        elif task == 'identification':
+            return self._parse_person_response(response_text)
+        elif task == 'analysis':
+            return self._parse_confidence_response(response_text)
+        elif task == 'turn':
+            return self._parse_turn_response(response_text)
         return None
     
-    def _identify_person_with_ollama(self, context: str) -> Optional[Dict]:
-        """Identify person using Ollama"""
-        try:
-            model = self._select_best_ollama_model('identification')
-            
-            prompt = f"""You are playing Akinator. Based on the answers, identify the person.
-
-{context}
-
-Return ONLY a valid JSON object with: name, description, image, confidence.
-Example: {{"name": "Albert Einstein", "description": "Famous physicist", "image": "https://...", "confidence": 0.9}}"""
-            
-            response = requests.post(
-                'http://localhost:11434/api/generate',
-                json={
-                    'model': model,
-                    'prompt': prompt,
-                    'stream': False,
-                    'options': {
-                        'temperature': 0.3,
-                        'top_p': 0.8,
-                        'num_predict': 200
+    def _build_request(self, backend: str, task: str, context: str, stream: bool = False,
+                       session: Optional[Tuple] = None) -> Tuple[str, Dict]:
+        """URL and request keyword arguments for a task on a backend"""
+        instruction, output_format = TASK_PROMPTS[task]
+        temperature, top_p, max_tokens = TASK_OPTIONS[task]
+        
+        if backend == 'local_ollama':
+            model = self._select_best_ollama_model(task)
+            self.ollama_models.mark_used(model)
+            body = {
+                'model': model,
+                'prompt': f"{PREAMBLE}\n\n{context}\n\n{instruction}\n{OLLAMA_OUTPUT_FORMATS.get(task, output_format)}",
+                'stream': stream,
+                'keep_alive': self.ollama_models.keep_alive,
+                'options': {
+                    'temperature': temperature,
+                    'top_p': top_p,
+                    'num_predict': max_tokens
+                }
+            }
+            if session is not None:
+                # Continue this game's conversation: only the new answers need evaluating
+                game_id, answers, asked_questions, question_texts = session
+                reuse = self.ollama_contexts.lookup(game_id, task, model, answers)
+                if reuse is not None:
+                    body['context'], new_answers = reuse
+                    body['prompt'] = (f"{self.prompts.followup(task, new_answers, asked_questions, question_texts)}\n"
+                                      f"{OLLAMA_OUTPUT_FORMATS.get(task, output_format)}")
+            return backend_url('local_ollama', '/api/generate'), {'json': body}
+        elif backend == 'openai':
+            body = {
+                'model': CLOUD_MODELS['openai'],
+                'messages': [
+                    {
+                        'role': 'system',
+                        'content': PREAMBLE
+                    },
+                    {
+                        'role': 'user',
+                        'content': f"{context}\n\n{instruction} {output_format}"
                     }
+                ],
+                'max_tokens': max_tokens,
+                'temperature': temperature
+            }
+            if stream:
+                body['stream'] = True
+            return backend_url('openai', '/v1/chat/completions'), {
+                'headers': {
+                    'Authorization': f'Bearer {os.getenv("OPENAI_API_KEY")}',
+                    'Content-Type': 'application/json'
                 },
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                response_text = result.get('response', '').strip()
-                
-                # Try to parse JSON from response
-                try:
-                    # Find JSON in response
-                    start = response_text.find('{')
-                    end = response_text.rfind('}') + 1
-                    if start != -1 and end > start:
-                        json_str = response_text[start:end]
-                        person_data = json.loads(json_str)
-                        
-                        # Validate required fields
-                        if all(key in person_data for key in ['name', 'description', 'confidence']):
-                            # Add default image if not provided
-                            if 'image' not in person_data:
-                                person_data['image'] = f"https://en.wikipedia.org/wiki/{person_data['name'].replace(' ', '_')}"
-                            
-                            return person_data
-                except json.JSONDecodeError:
-                    pass
-            
-        except Exception as e:
-            print(f"Error identifying person with Ollama: {e}")
-        
-        return None
-    
-    def _analyze_confidence_with_ollama(self, context: str) -> float:
-        """Analyze confidence using Ollama"""
-        try:
-            model = self._select_best_ollama_model('analysis')
-            
-            prompt = f"""You are playing Akinator. Analyze if we should make a guess.
-
-{context}
-
-Return ONLY a number between 0 and 1 representing confidence."""
-            
-            response = requests.post(
-                'http://localhost:11434/api/generate',
-                json={
-                    'model': model,
-                    'prompt': prompt,
-                    'stream': False,
-                    'options': {
-                        'temperature': 0.2,
-                        'top_p': 0.8,
-                        'num_predict': 20
+                'json': body
+            }
+        elif backend == 'anthropic':
+            body = {
+                'model': CLOUD_MODELS['anthropic'],
+                'max_tokens': max_tokens,
+                'system': PREAMBLE,
+                'messages': [
+                    {
+                        'role': 'user',
+                        'content': f"{context}\n\n{instruction}\n{output_format}"
                     }
+                ]
+            }
+            if stream:
+                body['stream'] = True
+            return backend_url('anthropic', '/v1/messages'), {
+                'headers': {
+                    'x-api-key': os.getenv('ANTHROPIC_API_KEY'),
+                    'Content-Type': 'application/json',
+                    'anthropic-version': '2023-06-01'
                 },
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                response_text = result.get('response', '').strip()
-                
-                # Extract number from response
-                try:
-                    import re
-                    numbers = re.findall(r'0\.\d+|\d+\.\d+|\d+', response_text)
-                    if numbers:
-                        confidence = float(numbers[0])
-                        return max(0.0, min(1.0, confidence))  # Clamp between 0 and 1
-                except:
-                    pass
-            
-        except Exception as e:
-            print(f"Error analyzing confidence with Ollama: {e}")
+                'json': body
+            }
+        raise ValueError(f"Unknown LLM backend: {backend}")
+    
+    def _response_text(self, backend: str, result: Dict) -> str:
+        """Completion text from a non-streaming backend response"""
+        if backend == 'local_ollama':
+            return result.get('response', '')
+        elif backend == 'openai':
+            return result['choices'][0]['message']['content']
+        return result['content'][0]['text']
+    
+    def _parse_stream_line(self, backend: str, line: str) -> Tuple[Optional[str], bool]:
+        """Text chunk and end-of-stream flag for one line of a streaming response"""
+        if not line:
+            return None, False
         
-        return 0.5
+        # Ollama streams one JSON object per line
+        if backend == 'local_ollama':
+            chunk = json.loads(line)
+            return chunk.get('response'), bool(chunk.get('done'))
+        
+        # OpenAI and Anthropic stream Server-Sent Events
+        if not line.startswith('data:'):
+            return None, False
+        payload = line[len('data:'):].strip()
+        if backend == 'openai':
+            if payload == '[DONE]':
+                return None, True
+            return json.loads(payload)['choices'][0].get('delta', {}).get('content'), False
+        
+        event = json.loads(payload)
+        if event.get('type') == 'content_block_delta':
+            return event.get('delta', {}).get('text'), False
+        return None, event.get('type') == 'message_stop'
     
-    def _select_best_ollama_model(self, task: str) -> str:
-        """Select the best Ollama model for a specific task"""
-        if 'local_ollama' not in self.available_llms:
-            return 'llama2'
+    def _is_answer(self, task: str, result: Any) -> bool:
+        """Whether a backend result is a usable answer rather than the failure default"""
+        return result is not None and result != TASK_DEFAULTS.get(task)
+    
+    def _backend_order(self, task: str) -> List[str]:
+        """Backends to try for a task, those whose circuit is open for the task's model last"""
+        backends = self.router.order(self.current_llm, self.available_llms)
+        if self.circuits is None or not self.circuits.open_count():
+            return backends
+        return sorted(backends, key=lambda backend: self.circuits.get(backend, self._backend_model(backend, task)).is_open())
+    
+    def _submit_hedged(self, *args):
+        """Start _call_backend on an idle hedge worker; None when every worker is busy"""
+        if not self._hedge_slots.acquire(blocking=False):
+            return None
+        future = self._hedge_executor.submit(self._call_backend, *args)
+        future.add_done_callback(lambda _: self._hedge_slots.release())
+        return future
+    
+    def _sourced(self, task: str, backend: str, result: Any, model: Optional[str]) -> Tuple[Any, Optional[Tuple]]:
+        """(result, (backend, model)) of one backend call; the source is None unless it is a usable answer"""
+        return result, ((backend, model) if self._is_answer(task, result) else None)
+    
+    def _route_call(self, task: str, context: str, session: Optional[Tuple] = None,
+                    urgent: bool = True) -> Tuple[Any, Optional[Tuple]]:
+        """Run a task on the current backend, hedging onto the next one when it is slow or fails
+
+        Returns the result and the (backend, model) that produced it, or None as
+        the source when no backend answered. urgent calls (games in progress) are
+        scheduled ahead of new games by the rate limiter. While no hedge worker is
+        idle the call runs on the caller's thread without a hedge.
+        """
+        backends = self._backend_order(task)
+        if not self.router.enabled or len(backends) < 2:
+            return self._sourced(task, backends[0], *self._call_backend(backends[0], task, context, session, urgent))
         
-        models = self.available_llms['local_ollama']['models']
+        primary, secondary = backends[0], backends[1]
+        future = self._submit_hedged(primary, task, context, session, urgent)
+        if future is None:
+            self.router.record_hedge_skipped(secondary)
+            answer = self._sourced(task, primary, *self._call_backend(primary, task, context, session, urgent))
+            if answer[1]:
+                return answer
+            return self._sourced(task, secondary, *self._call_backend(secondary, task, context, session, urgent))
         
-        # Prefer more capable models for complex tasks
-        if task in ['identification', 'analysis']:
-            preferred_models = ['llama2:70b', 'llama2:13b', 'mistral:7b', 'codellama:13b', 'llama2']
-        else:
-            preferred_models = ['mistral:7b', 'llama2:13b', 'llama2:70b', 'codellama:13b', 'llama2']
+        futures = {future: primary}
+        done, _ = wait(futures, timeout=self.router.hedge_delay(primary))
+        if done:
+            answer = self._sourced(task, primary, *future.result())
+            if answer[1]:
+                return answer
+            # The primary failed fast: fail over on this thread instead of hedging
+            return self._sourced(task, secondary, *self._call_backend(secondary, task, context, session, urgent))
+        
+        future = self._submit_hedged(secondary, task, context, session, urgent)
+        if future is None:
+            self.router.record_hedge_skipped(secondary)
+            answer = self._sourced(task, primary, *futures.popitem()[0].result())
+            if answer[1]:
+                return answer
+            return self._sourced(task, secondary, *self._call_backend(secondary, task, context, session, urgent))
+        futures[future] = secondary
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                backend = futures.pop(future)
+                answer = self._sourced(task, backend, *future.result())
+                if answer[1]:
+                    self.router.record_hedge(secondary, won=backend == secondary)
+                    # Requests already in flight cannot be interrupted; their result is dropped
+                    for other in futures:
+                        other.cancel()
+                    return answer
+        self.router.record_hedge(secondary, won=False)
+        return TASK_DEFAULTS.get(task), None
+    
+    async def _aroute_call(self, task: str, context: str, session: Optional[Tuple] = None,
+                           urgent: bool = True) -> Tuple[Any, Optional[Tuple]]:
+        """Async variant of _route_call; the losing request is cancelled"""
+        backends = self._backend_order(task)
+        if not self.router.enabled or len(backends) < 2:
+            return self._sourced(task, backends[0], *await self._acall_backend(backends[0], task, context, session, urgent))
         
-        for preferred in preferred_models:
-            if preferred in models:
-                return preferred
+        primary, secondary = backends[0], backends[1]
+        tasks = {asyncio.ensure_future(self._acall_backend(primary, task, context, session, urgent)): primary}
+        done, _ = await asyncio.wait(tasks, timeout=self.router.hedge_delay(primary))
+        for done_task in done:
+            answer = self._sourced(task, primary, *done_task.result())
+            if answer[1]:
+                return answer
+            del tasks[done_task]
         
-        # Fallback to first available model
-        return models[0] if models else 'llama2'
+        tasks[asyncio.ensure_future(self._acall_backend(secondary, task, context, session, urgent))] = secondary
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for done_task in done:
+                    backend = tasks.pop(done_task)
+                    answer = self._sourced(task, backend, *done_task.result())
+                    if answer[1]:
+                        self.router.record_hedge(secondary, won=backend == secondary)
+                        return answer
+            self.router.record_hedge(secondary, won=False)
+            return TASK_DEFAULTS.get(task), None
+        finally:
+            for pending in tasks:
+                pending.cancel()
+    
+    def _remember_session(self, backend: str, task: str, kwargs: Dict, session: Optional[Tuple], data: Optional[Dict]):
+        """Keep the Ollama context of a successful reply; drop it when a reply could not be used"""
+        if backend != 'local_ollama' or session is None:
+            return
+        game_id, answers = session[:2]
+        if data is None:
+            if 'context' in kwargs['json']:
+                self.ollama_contexts.invalidate(game_id, task)
+        else:
+            self.ollama_contexts.store(game_id, task, kwargs['json']['model'], answers, data.get('context'))
+    
+    def _remember_stream_session(self, backend: str, task: str, kwargs: Dict, session: Optional[Tuple], line: str):
+        if backend == 'local_ollama' and session is not None:
+            try:
+                self._remember_session(backend, task, kwargs, session, json.loads(line))
+            except ValueError:
+                pass
+    
+    def _record_stream_tokens(self, backend: str, task: str, kwargs: Dict, line: str, chunks: List[str]):
+        # Ollama's final stream line carries the token counts; other streams are estimated
+        data = None
+        if backend == 'local_ollama':
+            try:
+                data = json.loads(line)
+            except ValueError:
+                pass
+        self._record_tokens(backend, kwargs['json']['model'], task, kwargs['json'], data, ''.join(chunks))
+    
+    def _batch_key(self, kwargs: Dict) -> str:
+        """Identical request bodies in one batch are sent once"""
+        return json.dumps(kwargs['json'], sort_keys=True)
+    
+    def _record_call(self, backend: str, model: Optional[str], task: str, started: float, outcome: str):
+        """Record a finished call's latency for hedging, model routing and metrics
+
+        outcome is 'ok', 'parse_failure', 'timeout', 'throttled' (a 429 after every retry) or 'error'.
+        """
+        elapsed = time.perf_counter() - started
+        LLM_CALL_SECONDS.observe(elapsed, backend=backend, model=model or '', task=task, outcome=outcome)
+        # A throttled provider is up, so it does not count against the circuit
+        if outcome != 'throttled':
+            self._record_circuit(backend, model, elapsed, outcome not in ('timeout', 'error'))
+        if outcome == 'throttled':
+            outcome = 'error'
+        elif outcome == 'timeout':
+            LLM_TIMEOUTS.inc(backend=backend, task=task)
+            outcome = 'error'
+        elif outcome == 'parse_failure':
+            LLM_PARSE_FAILURES.inc(backend=backend, model=model or '', task=task)
+        # An unparseable answer still measures how fast the backend responds
+        self.router.record(backend, elapsed, ok=outcome != 'error')
+        if model is not None:
+            self.model_router.record(task, model, elapsed, outcome)
+    
+    def _circuit_allows(self, backend: str, model: str, task: str) -> bool:
+        """Whether the circuit of a backend and model lets a call through"""
+        if self.circuits is None or self.circuits.get(backend, model).allow():
+            return True
+        LLM_CIRCUIT_REJECTED.inc(backend=backend, model=model)
+        logger.debug("Circuit open for %s/%s; skipping %s", backend, model, task)
+        return False
+    
+    def _record_circuit(self, backend: str, model: Optional[str], seconds: float, ok: bool):
+        if self.circuits is None or model is None:
+            return
+        state = self.circuits.get(backend, model).record(seconds, ok)
+        if state is not None:
+            LLM_CIRCUIT_TRANSITIONS.inc(backend=backend, model=model, state=state)
+            logger.warning("Circuit for %s/%s is now %s", backend, model, state)
+            if state == 'open':
+                self.health_monitor.request_refresh()
+    
+    def _record_tokens(self, backend: str, model: Optional[str], task: str, body: Dict, data: Optional[Dict] = None,
+                       completion: str = ''):
+        """Count a call's prompt and completion tokens, estimating them when the backend reports none"""
+        usage = response_usage(backend, data)
+        estimated = usage is None
+        if estimated:
+            usage = estimate_tokens(request_prompt_text(body)), estimate_tokens(completion)
+        prompt_tokens, completion_tokens = usage
+        self.token_usage.record(task, prompt_tokens, completion_tokens, estimated)
+        LLM_PROMPT_TOKENS.observe(prompt_tokens, backend=backend, model=model or '', task=task)
+        LLM_COMPLETION_TOKENS.observe(completion_tokens, backend=backend, model=model or '', task=task)
+        logger.debug("%s on %s/%s: %d prompt tokens, %d completion tokens", task, backend, model, *usage)
+    
+    def _token_reservation(self, task: str, body: Dict) -> int:
+        """Tokens a call may use: its estimated prompt plus the completion limit"""
+        return estimate_tokens(request_prompt_text(body)) + TASK_OPTIONS[task][2]
+    
+    def _settle_rate_limit(self, limiter: ProviderLimiter, attempt: int, reserved: int, status_code: int,
+                           data: Optional[Dict], headers) -> bool:
+        """Settle a call's token reservation; on a 429 pause the provider and return True"""
+        if status_code == 429:
+            limiter.settle(reserved, 0)
+            delay = limiter.throttled(attempt, headers)
+            LLM_RATE_LIMITED.inc(backend=limiter.backend, reason='429')
+            logger.info("%s answered 429, pausing it for %.1fs", limiter.backend, delay)
+            return True
+        usage = response_usage(limiter.backend, data)
+        limiter.settle(reserved, sum(usage) if usage else reserved if status_code == 200 else 0)
+        return False
+    
+    def _limited_exchange(self, backend: str, task: str, body: Dict, exchange, urgent: bool) -> Tuple:
+        """exchange() within the provider's rate limits, retried after the backoff when it answers 429"""
+        limiter = self.rate_limits.get(backend) if self.rate_limits else None
+        if limiter is None:
+            return exchange()
+        reserved = self._token_reservation(task, body)
+        started = time.monotonic()
+        for attempt in range(limiter.retries + 1):
+            limiter.acquire(reserved, urgent, started)
+            status_code, data, headers = exchange()
+            if not self._settle_rate_limit(limiter, attempt, reserved, status_code, data, headers):
+                break
+        return status_code, data, headers
     
-    def _generate_question_with_openai(self, context: str) -> Optional[str]:
-        """Generate question using OpenAI"""
+    async def _alimited_exchange(self, backend: str, task: str, body: Dict, exchange, urgent: bool) -> Tuple:
+        """Async variant of _limited_exchange"""
+        limiter = self.rate_limits.get(backend) if self.rate_limits else None
+        if limiter is None:
+            return await exchange()
+        reserved = self._token_reservation(task, body)
+        started = time.monotonic()
+        for attempt in range(limiter.retries + 1):
+            await limiter.aacquire(reserved, urgent, started)
+            status_code, data, headers = await exchange()
+            if not self._settle_rate_limit(limiter, attempt, reserved, status_code, data, headers):
+                break
+        return status_code, data, headers
+    
+    def _rate_limited(self, backend: str, task: str, error: RateLimitedError) -> Any:
+        LLM_RATE_LIMITED.inc(backend=backend, reason=error.reason)
+        logger.info("Skipping %s on %s: %s", task, backend, error)
+        return TASK_DEFAULTS.get(task)
+    
+    def _call_backend(self, backend: str, task: str, context: str, session: Optional[Tuple] = None,
+                      urgent: bool = True) -> Tuple[Any, Optional[str]]:
+        """Run one task on one backend: (result, model used), with the task default as result on any failure"""
+        started = time.perf_counter()
+        model = status_code = None
         try:
-            response = requests.post(
-                'https://api.openai.com/v1/chat/completions',
-                headers={
-                    'Authorization': f'Bearer {os.getenv("OPENAI_API_KEY")}',
-                    'Content-Type': 'application/json'
-                },
-                json={
-                    'model': 'gpt-4',
-                    'messages': [
-                        {
-                            'role': 'system',
-                            'content': 'You are playing Akinator. Generate ONE short yes/no question to narrow down the person. Return ONLY the question text.'
-                        },
-                        {
-                            'role': 'user',
-                            'content': context
-                        }
-                    ],
-                    'max_tokens': 50,
-                    'temperature': 0.7
-                },
-                timeout=30
-            )
+            url, kwargs = self._build_request(backend, task, context, session=session)
+            model = kwargs['json']['model']
+            if not self._circuit_allows(backend, model, task):
+                return TASK_DEFAULTS.get(task), model
             
-            if response.status_code == 200:
-                result = response.json()
-                question = result['choices'][0]['message']['content'].strip()
-                if question and len(question) < 100:
-                    return question
+            def exchange():
+                response = self.clients.get(backend).post(url, **kwargs)
+                return response.status_code, response.json() if response.status_code == 200 else None, response.headers
             
-        except Exception as e:
-            print(f"Error generating question with OpenAI: {e}")
-        
-        return None
-    
-    def _identify_person_with_openai(self, context: str) -> Optional[Dict]:
-        """Identify person using OpenAI"""
-        try:
-            response = requests.post(
-                'https://api.openai.com/v1/chat/completions',
-                headers={
-                    'Authorization': f'Bearer {os.getenv("OPENAI_API_KEY")}',
-                    'Content-Type': 'application/json'
-                },
-                json={
-                    'model': 'gpt-4',
-                    'messages': [
-                        {
-                            'role': 'system',
-                            'content': 'You are playing Akinator. Identify the person based on the answers. Return ONLY a valid JSON object with: name, description, image, confidence.'
-                        },
-                        {
-                            'role': 'user',
-                            'content': context
-                        }
-                    ],
-                    'max_tokens': 200,
-                    'temperature': 0.3
-                },
-                timeout=30
-            )
+            if self.batcher is not None and backend in BATCHED_BACKENDS:
+                status_code, data, _ = self.batcher.submit((backend, task, model), self._batch_key(kwargs), exchange)
+            else:
+                status_code, data, _ = self._limited_exchange(backend, task, kwargs['json'], exchange, urgent)
             
-            if response.status_code == 200:
-                result = response.json()
-                response_text = result['choices'][0]['message']['content'].strip()
-                
-                try:
-                    person_data = json.loads(response_text)
-                    if all(key in person_data for key in ['name', 'description', 'confidence']):
-                        if 'image' not in person_data:
-                            person_data['image'] = f"https://en.wikipedia.org/wiki/{person_data['name'].replace(' ', '_')}"
-                        return person_data
-                except json.JSONDecodeError:
-                    pass
+            if status_code == 200:
+                text = self._response_text(backend, data)
+                self._record_tokens(backend, model, task, kwargs['json'], data, text)
+                result = self._parse_task_output(task, text)
+                self._remember_session(backend, task, kwargs, session, data if result is not None else None)
+                if result is not None:
+                    self._record_call(backend, model, task, started, 'ok')
+                    return result, model
+                self._record_call(backend, model, task, started, 'parse_failure')
+                return TASK_DEFAULTS.get(task), model
+            elif status_code >= 500:
+                self.health_monitor.request_refresh()
             
+        except RateLimitedError as e:
+            # Not sent, so the backend's latency and health are unaffected
+            return self._rate_limited(backend, task, e), model
         except Exception as e:
-            print(f"Error identifying person with OpenAI: {e}")
+            logger.warning("Error running %s with %s: %s", task, backend, e)
+            self.health_monitor.request_refresh()
+            if is_timeout(e):
+                self._record_call(backend, model, task, started, 'timeout')
+                return TASK_DEFAULTS.get(task), model
         
-        return None
+        self._record_call(backend, model, task, started, 'throttled' if status_code == 429 else 'error')
+        return TASK_DEFAULTS.get(task), model
     
-    def _analyze_confidence_with_openai(self, context: str) -> float:
-        """Analyze confidence using OpenAI"""
+    async def _acall_backend(self, backend: str, task: str, context: str, session: Optional[Tuple] = None,
+                             urgent: bool = True) -> Tuple[Any, Optional[str]]:
+        """Async variant of _call_backend"""
+        started = time.perf_counter()
+        model = status_code = None
         try:
-            response = requests.post(
-                'https://api.openai.com/v1/chat/completions',
-                headers={
-                    'Authorization': f'Bearer {os.getenv("OPENAI_API_KEY")}',
-                    'Content-Type': 'application/json'
-                },
-                json={
-                    'model': 'gpt-4',
-                    'messages': [
-                        {
-                            'role': 'system',
-                            'content': 'You are playing Akinator. Analyze if we should make a guess. Return ONLY a number between 0 and 1 representing confidence.'
-                        },
-                        {
-                            'role': 'user',
-                            'content': context
-                        }
-                    ],
-                    'max_tokens': 20,
-                    'temperature': 0.2
-                },
-                timeout=30
-            )
+            url, kwargs = self._build_request(backend, task, context, session=session)
+            model = kwargs['json']['model']
+            if not self._circuit_allows(backend, model, task):
+                return TASK_DEFAULTS.get(task), model
             
-            if response.status_code == 200:
-                result = response.json()
-                response_text = result['choices'][0]['message']['content'].strip()
-                
-                try:
-                    import re
-                    numbers = re.findall(r'0\.\d+|\d+\.\d+|\d+', response_text)
-                    if numbers:
-                        confidence = float(numbers[0])
-                        return max(0.0, min(1.0, confidence))
-                except:
-                    pass
+            async def exchange():
+                response = await self.async_clients.get(backend).post(url, **kwargs)
+                return response.status_code, response.json() if response.status_code == 200 else None, response.headers
             
-        except Exception as e:
-            print(f"Error analyzing confidence with OpenAI: {e}")
-        
-        return 0.5
-    
-    def _generate_question_with_anthropic(self, context: str) -> Optional[str]:
-        """Generate question using Anthropic"""
-        try:
-            response = requests.post(
-                'https://api.anthropic.com/v1/messages',
-                headers={
-                    'x-api-key': os.getenv('ANTHROPIC_API_KEY'),
-                    'Content-Type': 'application/json',
-                    'anthropic-version': '2023-06-01'
-                },
-                json={
-                    'model': 'claude-3-sonnet-20240229',
-                    'max_tokens': 50,
-                    'messages': [
-                        {
-                            'role': 'user',
-                            'content': f'You are playing Akinator. Generate ONE short yes/no question to narrow down the person.\n\n{context}\n\nReturn ONLY the question text.'
-                        }
-                    ]
-                },
-                timeout=30
-            )
+            batcher = self.async_batcher
+            if batcher is not None and backend in BATCHED_BACKENDS:
+                status_code, data, _ = await batcher.submit((backend, task, model), self._batch_key(kwargs), exchange)
+            else:
+                status_code, data, _ = await self._alimited_exchange(backend, task, kwargs['json'], exchange, urgent)
             
-            if response.status_code == 200:
-                result = response.json()
-                question = result['content'][0]['text'].strip()
-                if question and len(question) < 100:
-                    return question
+            if status_code == 200:
+                text = self._response_text(backend, data)
+                self._record_tokens(backend, model, task, kwargs['json'], data, text)
+                result = self._parse_task_output(task, text)
+                self._remember_session(backend, task, kwargs, session, data if result is not None else None)
+                if result is not None:
+                    self._record_call(backend, model, task, started, 'ok')
+                    return result, model
+                self._record_call(backend, model, task, started, 'parse_failure')
+                return TASK_DEFAULTS.get(task), model
+            elif status_code >= 500:
+                self.health_monitor.request_refresh()
             
+        except RateLimitedError as e:
+            return self._rate_limited(backend, task, e), model
+        except asyncio.CancelledError:
+            # Lost a hedge race; the elapsed time is still a lower bound on this backend's latency
+            self.router.record(backend, time.perf_counter() - started, ok=True)
+            raise
         except Exception as e:
-            print(f"Error generating question with Anthropic: {e}")
+            logger.warning("Error running %s with %s: %s", task, backend, e)
+            self.health_monitor.request_refresh()
+            if is_timeout(e):
+                self._record_call(backend, model, task, started, 'timeout')
+                return TASK_DEFAULTS.get(task), model
         
-        return None
+        self._record_call(backend, model, task, started, 'throttled' if status_code == 429 else 'error')
+        return TASK_DEFAULTS.get(task), model
     
-    def _identify_person_with_anthropic(self, context: str) -> Optional[Dict]:
-        """Identify person using Anthropic"""
+    def _stream_backend(self, backend: str, task: str, context: str, session: Optional[Tuple] = None,
+                        urgent: bool = True) -> Iterator[str]:
+        """Stream completion text for a task from one backend
+
+        Streams wait for the rate limiter but are not retried after a 429: the
+        caller falls back instead of holding the player's open response. The
+        circuit records whether the response started in time.
+        """
+        started = time.perf_counter()
+        model = None
         try:
-            response = requests.post(
-                'https://api.anthropic.com/v1/messages',
-                headers={
-                    'x-api-key': os.getenv('ANTHROPIC_API_KEY'),
-                    'Content-Type': 'application/json',
-                    'anthropic-version': '2023-06-01'
-                },
-                json={
-                    'model': 'claude-3-sonnet-20240229',
-                    'max_tokens': 200,
-                    'messages': [
-                        {
-                            'role': 'user',
-                            'content': f'You are playing Akinator. Identify the person based on the answers.\n\n{context}\n\nReturn ONLY a valid JSON object with: name, description, image, confidence.'
-                        }
-                    ]
-                },
-                timeout=30
-            )
+            url, kwargs = self._build_request(backend, task, context, stream=True, session=session)
+            model = kwargs['json']['model']
+            if not self._circuit_allows(backend, model, task):
+                return
+            limiter = self.rate_limits.get(backend) if self.rate_limits else None
+            if limiter is not None:
+                reserved = self._token_reservation(task, kwargs['json'])
+                limiter.acquire(reserved, urgent)
+            response = self.clients.get(backend).post(url, stream=True, **kwargs)
+            if limiter is not None:
+                self._settle_rate_limit(limiter, 0, reserved, response.status_code, None, response.headers)
+            if response.status_code != 429:
+                self._record_circuit(backend, model, time.perf_counter() - started, response.status_code < 500)
             
             if response.status_code == 200:
-                result = response.json()
-                response_text = result['content'][0]['text'].strip()
-                
-                try:
-                    person_data = json.loads(response_text)
-                    if all(key in person_data for key in ['name', 'description', 'confidence']):
-                        if 'image' not in person_data:
-                            person_data['image'] = f"https://en.wikipedia.org/wiki/{person_data['name'].replace(' ', '_')}"
-                        return person_data
-                except json.JSONDecodeError:
-                    pass
+                chunks = []
+                for line in response.iter_lines(decode_unicode=True):
+                    chunk, done = self._parse_stream_line(backend, line)
+                    if chunk:
+                        chunks.append(chunk)
+                        yield chunk
+                    if done:
+                        self._remember_stream_session(backend, task, kwargs, session, line)
+                        self._record_stream_tokens(backend, task, kwargs, line, chunks)
+                        break
+            response.close()
             
+        except RateLimitedError as e:
+            self._rate_limited(backend, task, e)
         except Exception as e:
-            print(f"Error identifying person with Anthropic: {e}")
-        
-        return None
+            logger.warning("Error streaming %s with %s: %s", task, backend, e)
+            self._record_circuit(backend, model, time.perf_counter() - started, False)
     
-    def _analyze_confidence_with_anthropic(self, context: str) -> float:
-        """Analyze confidence using Anthropic"""
+    async def _astream_backend(self, backend: str, task: str, context: str, session: Optional[Tuple] = None,
+                               urgent: bool = True) -> AsyncIterator[str]:
+        """Async variant of _stream_backend"""
+        started = time.perf_counter()
+        model = None
         try:
-            response = requests.post(
-                'https://api.anthropic.com/v1/messages',
-                headers={
-                    'x-api-key': os.getenv('ANTHROPIC_API_KEY'),
-                    'Content-Type': 'application/json',
-                    'anthropic-version': '2023-06-01'
-                },
-                json={
-                    'model': 'claude-3-sonnet-20240229',
-                    'max_tokens': 20,
-                    'messages': [
-                        {
-                            'role': 'user',
-                            'content': f'You are playing Akinator. Analyze if we should make a guess.\n\n{context}\n\nReturn ONLY a number between 0 and 1 representing confidence.'
-                        }
-                    ]
-                },
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                response_text = result['content'][0]['text'].strip()
-                
-                try:
-                    import re
-                    numbers = re.findall(r'0\.\d+|\d+\.\d+|\d+', response_text)
-                    if numbers:
-                        confidence = float(numbers[0])
-                        return max(0.0, min(1.0, confidence))
-                except:
-                    pass
+            url, kwargs = self._build_request(backend, task, context, stream=True, session=session)
+            model = kwargs['json']['model']
+            if not self._circuit_allows(backend, model, task):
+                return
+            limiter = self.rate_limits.get(backend) if self.rate_limits else None
+            if limiter is not None:
+                reserved = self._token_reservation(task, kwargs['json'])
+                await limiter.aacquire(reserved, urgent)
+            async with self.async_clients.get(backend).stream('POST', url, **kwargs) as response:
+                if limiter is not None:
+                    self._settle_rate_limit(limiter, 0, reserved, response.status_code, None, response.headers)
+                if response.status_code != 429:
+                    self._record_circuit(backend, model, time.perf_counter() - started, response.status_code < 500)
+                if response.status_code == 200:
+                    chunks = []
+                    async for line in response.aiter_lines():
+                        chunk, done = self._parse_stream_line(backend, line)
+                        if chunk:
+                            chunks.append(chunk)
+                            yield chunk
+                        if done:
+                            self._remember_stream_session(backend, task, kwargs, session, line)
+                            self._record_stream_tokens(backend, task, kwargs, line, chunks)
+                            break
             
+        except RateLimitedError as e:
+            self._rate_limited(backend, task, e)
         except Exception as e:
-            print(f"Error analyzing confidence with Anthropic: {e}")
+            logger.warning("Error streaming %s with %s: %s", task, backend, e)
+            self._record_circuit(backend, model, time.perf_counter() - started, False)
+    
+    def _ollama_candidates(self, task: str) -> List[str]:
+        """Available Ollama models for a task, best first"""
+        if 'local_ollama' not in self.available_llms:
+            return []
+        
+        models = self.available_llms['local_ollama']['models']
         
-        return 0.5
+        # Prefer more capable models for complex tasks
+        if task in ['identification', 'analysis', 'turn']:
+            preferred_models = ['llama2:70b', 'llama2:13b', 'mistral:7b', 'codellama:13b', 'llama2']
+        else:
+            preferred_models = ['mistral:7b', 'llama2:13b', 'llama2:70b', 'codellama:13b', 'llama2']
+        
+        preferred = [model for model in preferred_models if model in models]
+        # Any other model is still better than nothing
+        return preferred + [model for model in models if model not in preferred]
+    
+    def _ranked_ollama_models(self, task: str) -> List[str]:
+        """Ollama models for a task ranked by measured latency, failures and guess quality"""
+        ranked = self.model_router.rank(task, self._ollama_candidates(task))
+        if self.circuits is None:
+            return ranked
+        # Models whose circuit is open go last, so another pulled model answers meanwhile
+        return sorted(ranked, key=lambda model: self.circuits.get('local_ollama', model).is_open())
+    
+    def _ollama_task_models(self) -> List[str]:
+        """Best model for each task, most frequently used task first"""
+        tasks = ['question_generation', 'identification', 'analysis']
+        if self.fused_turn_enabled:
+            tasks.insert(0, 'turn')
+        return [candidates[0] for candidates in map(self._ranked_ollama_models, tasks) if candidates]
+    
+    def _select_best_ollama_model(self, task: str) -> str:
+        """Select the Ollama model for a task by measured performance, preferring resident models under memory pressure"""
+        return self.ollama_models.choose(self._ranked_ollama_models(task)) or 'llama2'
     
     # Keep existing methods for backward compatibility
     def _prepare_context(self, people: List[Dict], question_answers: List[str], remaining_people: List[Dict]) -> str:
@@ -623,8 +1212,8 @@ RULES:
 
 Return ONLY the question text."""
             
-            response = requests.post(
-                'http://localhost:11434/api/generate',
+            response = self.clients.get('local_ollama').post(
+                backend_url('local_ollama', '/api/generate'),
                 json={
                     'model': model,
                     'prompt': enhanced_prompt,
@@ -634,8 +1223,7 @@ Return ONLY the question text."""
                         'top_p': 0.9,
                         'num_predict': 50
                     }
-                },
-                timeout=30
+                }
             )
             
             if response.status_code == 200:
@@ -645,15 +1233,15 @@ Return ONLY the question text."""
                     return question
             
         except Exception as e:
-            print(f"Error generating with Ollama: {e}")
+            logger.warning("Error generating with Ollama: %s", e)
         
         return None
     
     def _generate_with_openai(self, context: str) -> Optional[str]:
         """Generate with OpenAI (legacy method)"""
         try:
-            response = requests.post(
-                'https://api.openai.com/v1/chat/completions',
+            response = self.clients.get('openai').post(
+                backend_url('openai', '/v1/chat/completions'),
                 headers={
                     'Authorization': f'Bearer {os.getenv("OPENAI_API_KEY")}',
                     'Content-Type': 'application/json'
@@ -672,8 +1260,7 @@ Return ONLY the question text."""
                     ],
                     'max_tokens': 50,
                     'temperature': 0.7
-                },
-                timeout=30
+                }
             )
             
             if response.status_code == 200:
@@ -683,11 +1270,11 @@ Return ONLY the question text."""
                     return question
             
         except Exception as e:
-            print(f"Error generating with OpenAI: {e}")
+            logger.warning("Error generating with OpenAI: %s", e)
         
         return None
     
-    def generate_smart_question(self, people: List[Dict], question_answers: List[str], remaining_people: List[Dict]) -> Optional[str]:
+    def generate_legacy_question(self, people: List[Dict], question_answers: List[str], remaining_people: List[Dict]) -> Optional[str]:
         """Generate smart question (legacy method)"""
         if self.current_llm == 'none':
             return None
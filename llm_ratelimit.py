@@ -0,0 +1,264 @@
+"""Client-side rate limiting for cloud LLM providers
+
+Each provider gets a scheduler with token buckets for requests and tokens per
+minute. Calls from games already in progress reserve capacity first come,
+first served; calls for new games only go ahead while the buckets hold more
+than a reserved share, so a burst of new players cannot starve games that are
+halfway through. Waiting callers are bounded in number and in time, and a 429
+pauses the provider for its Retry-After (or an exponential backoff) with
+jitter, so queued callers do not all retry at once.
+"""
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+from typing import Dict, Mapping, Optional, Tuple
+
+# Backends the limiter applies to; local Ollama is bounded by micro-batching instead
+RATE_LIMITED_BACKENDS = ('openai', 'anthropic')
+
+# Games with fewer answers than this are new: they yield capacity to games in progress
+NEW_GAME_ANSWERS = 2
+
+
+class RateLimitedError(Exception):
+    """Raised when a call cannot be scheduled within the wait limits"""
+
+    def __init__(self, backend: str, reason: str):
+        super().__init__(f"{backend} rate limited ({reason})")
+        self.backend = backend
+        self.reason = reason
+
+
+def retry_after(headers: Optional[Mapping]) -> Optional[float]:
+    """Seconds to wait from a 429 response's retry-after-ms or Retry-After header"""
+    if not headers:
+        return None
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return max(0.0, float(value) / 1000.0)
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Refills at rate per second up to capacity; reservations may take the level below zero"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        """Seconds until the level reaches amount"""
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float):
+        self.level -= amount
+
+    def give(self, amount: float):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class ProviderLimiter:
+    """Request and token buckets, a bounded wait queue and 429 backoff for one provider"""
+
+    def __init__(self, backend: str, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 burst_seconds: float = 6.0, max_queue: int = 64, max_wait: float = 10.0,
+                 reserve: float = 0.2, retries: int = 2, backoff: float = 0.5, max_backoff: float = 30.0,
+                 jitter: float = 0.25):
+        self.backend = backend
+        # A limit of 0 leaves that dimension unbounded; 429s are still handled
+        self.requests = self._bucket(requests_per_minute, burst_seconds)
+        self.tokens = self._bucket(tokens_per_minute, burst_seconds)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.reserve = reserve
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.blocked_until = 0.0
+
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.granted_total = 0
+        self.queued_total = 0
+        self.wait_seconds_total = 0.0
+        self.throttled_total = 0
+        self.rejected = {'queue_full': 0, 'max_wait': 0}
+
+    @staticmethod
+    def _bucket(per_minute: float, burst_seconds: float) -> Optional[TokenBucket]:
+        if per_minute <= 0:
+            return None
+        rate = per_minute / 60.0
+        return TokenBucket(rate, max(1.0, rate * burst_seconds))
+
+    @classmethod
+    def from_env(cls, backend: str) -> 'ProviderLimiter':
+        """Limits from LLM_RPM_<BACKEND> and LLM_TPM_<BACKEND>, queueing from LLM_RATE_* variables"""
+        suffix = backend.upper()
+        return cls(
+            backend,
+            requests_per_minute=float(os.getenv(f'LLM_RPM_{suffix}', '0')),
+            tokens_per_minute=float(os.getenv(f'LLM_TPM_{suffix}', '0')),
+            burst_seconds=float(os.getenv('LLM_RATE_BURST_SECONDS', '6')),
+            max_queue=int(os.getenv('LLM_RATE_QUEUE', '64')),
+            max_wait=float(os.getenv('LLM_RATE_MAX_WAIT', '10')),
+            reserve=float(os.getenv('LLM_RATE_RESERVE', '0.2')),
+            retries=int(os.getenv('LLM_RATE_RETRIES', '2')),
+        )
+
+    def _plan(self, tokens: float, urgent: bool, now: float) -> Tuple[float, bool]:
+        """Seconds to wait and whether the call may reserve its capacity now (called with the lock held)"""
+        blocked = self.blocked_until - now
+        if blocked > 0:
+            return blocked * (1 + random.uniform(0, self.jitter)), False
+        wait = 0.0
+        for bucket, amount in ((self.requests, 1.0), (self.tokens, tokens)):
+            if bucket is None:
+                continue
+            bucket.refill(now)
+            if not urgent:
+                # New games leave the reserved share to games in progress
+                amount = min(bucket.capacity, amount + bucket.capacity * self.reserve)
+            wait = max(wait, bucket.wait_for(amount))
+        # In-progress games reserve now and wait their turn; new games re-check after waiting
+        return wait, urgent or wait == 0
+
+    def _schedule(self, tokens: float, urgent: bool, started: float, queued: bool) -> Tuple[float, bool, bool]:
+        """(seconds to wait, granted, queued) for one scheduling attempt"""
+        with self._lock:
+            now = time.monotonic()
+            wait, granted = self._plan(tokens, urgent, now)
+            if now + wait > started + self.max_wait:
+                self.rejected['max_wait'] += 1
+                raise RateLimitedError(self.backend, 'max_wait')
+            if wait and not queued:
+                if self.waiting >= self.max_queue:
+                    self.rejected['queue_full'] += 1
+                    raise RateLimitedError(self.backend, 'queue_full')
+                queued = True
+                self.waiting += 1
+                self.queued_total += 1
+                self.peak_waiting = max(self.peak_waiting, self.waiting)
+            if granted:
+                for bucket, amount in ((self.requests, 1.0), (self.tokens, tokens)):
+                    if bucket is not None:
+                        bucket.take(amount)
+                self.granted_total += 1
+                self.wait_seconds_total += now + wait - started
+            return wait, granted, queued
+
+    def _dequeue(self, queued: bool):
+        if queued:
+            with self._lock:
+                self.waiting -= 1
+
+    def acquire(self, tokens: float, urgent: bool = True, started: Optional[float] = None):
+        """Block until a call of about tokens tokens may be sent; raises RateLimitedError instead of waiting too long
+
+        started (time.monotonic()) lets the retries of one call share a single max_wait.
+        """
+        started = started or time.monotonic()
+        queued = False
+        try:
+            while True:
+                wait, granted, queued = self._schedule(tokens, urgent, started, queued)
+                if wait:
+                    time.sleep(wait)
+                if granted:
+                    return
+        finally:
+            self._dequeue(queued)
+
+    async def aacquire(self, tokens: float, urgent: bool = True, started: Optional[float] = None):
+        """Async variant of acquire"""
+        started = started or time.monotonic()
+        queued = False
+        try:
+            while True:
+                wait, granted, queued = self._schedule(tokens, urgent, started, queued)
+                if wait:
+                    await asyncio.sleep(wait)
+                if granted:
+                    return
+        finally:
+            self._dequeue(queued)
+
+    def settle(self, reserved: float, used: Optional[float] = None):
+        """Return the unused part of a token reservation once the real usage is known"""
+        if self.tokens is None:
+            return
+        with self._lock:
+            self.tokens.give(reserved - (used if used is not None else reserved))
+
+    def throttled(self, attempt: int, headers: Optional[Mapping] = None) -> float:
+        """Pause the provider after a 429; returns the backoff applied"""
+        delay = min(self.max_backoff, max(retry_after(headers) or 0.0, self.backoff * 2 ** attempt))
+        with self._lock:
+            self.throttled_total += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        return delay
+
+    def stats(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.refill(now)
+            return {
+                'requests_per_minute': self.requests.rate * 60 if self.requests else None,
+                'tokens_per_minute': self.tokens.rate * 60 if self.tokens else None,
+                'requests_available': self.requests.level if self.requests else None,
+                'tokens_available': self.tokens.level if self.tokens else None,
+                'blocked_for_s': max(0.0, self.blocked_until - now),
+                'waiting': self.waiting,
+                'peak_waiting': self.peak_waiting,
+                'granted_total': self.granted_total,
+                'queued_total': self.queued_total,
+                'mean_wait_s': self.wait_seconds_total / self.granted_total if self.granted_total else 0.0,
+                'throttled_total': self.throttled_total,
+                'rejected': dict(self.rejected),
+            }
+
+
+class RateLimits:
+    """One ProviderLimiter per cloud backend"""
+
+    def __init__(self, limiters: Dict[str, ProviderLimiter]):
+        self.limiters = limiters
+
+    @classmethod
+    def from_env(cls) -> Optional['RateLimits']:
+        """Limiters from LLM_RATE_* environment variables, or None if disabled"""
+        if os.getenv('LLM_RATE_LIMIT_ENABLED', 'true').lower() != 'true':
+            return None
+        return cls({backend: ProviderLimiter.from_env(backend) for backend in RATE_LIMITED_BACKENDS})
+
+    def get(self, backend: str) -> Optional[ProviderLimiter]:
+        return self.limiters.get(backend)
+
+    def stats(self) -> Dict:
+        return {backend: limiter.stats() for backend, limiter in self.limiters.items()}
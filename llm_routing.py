@@ -0,0 +1,291 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+
+class LatencyWindow:
+    """Latencies of the most recent calls to one backend"""
+
+    def __init__(self, size: int = 256):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.calls_total = 0
+        self.errors_total = 0
+        self.hedges_total = 0
+        self.hedge_wins_total = 0
+        self.hedges_skipped_total = 0
+
+    def record(self, seconds: float, ok: bool):
+        with self._lock:
+            self._samples.append(seconds)
+            self.calls_total += 1
+            if not ok:
+                self.errors_total += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """q-th percentile (0-100) of recent latencies in seconds, or None without samples"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(q / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def __len__(self):
+        return len(self._samples)
+
+    def stats(self) -> Dict:
+        p50, p95, p99 = (self.percentile(q) for q in (50, 95, 99))
+        return {
+            'samples': len(self),
+            'p50_ms': p50 * 1000.0 if p50 is not None else None,
+            'p95_ms': p95 * 1000.0 if p95 is not None else None,
+            'p99_ms': p99 * 1000.0 if p99 is not None else None,
+            'calls_total': self.calls_total,
+            'errors_total': self.errors_total,
+            'hedges_total': self.hedges_total,
+            'hedge_wins_total': self.hedge_wins_total,
+            'hedges_skipped_total': self.hedges_skipped_total,
+        }
+
+
+class LatencyRouter:
+    """Orders backends for a call and decides when to send a hedged duplicate"""
+
+    def __init__(self, enabled: bool = True, hedge_percentile: float = 95.0, min_samples: int = 20,
+                 default_delay: float = 2.0, min_delay: float = 0.05, window_size: int = 256):
+        self.enabled = enabled
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.window_size = window_size
+        self._windows: Dict[str, LatencyWindow] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'LatencyRouter':
+        """Build a router from LLM_HEDGE_* environment variables"""
+        return cls(
+            enabled=os.getenv('LLM_HEDGE_ENABLED', 'true').lower() == 'true',
+            hedge_percentile=float(os.getenv('LLM_HEDGE_PERCENTILE', '95')),
+            min_samples=int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20')),
+            default_delay=float(os.getenv('LLM_HEDGE_DEFAULT_DELAY', '2.0')),
+        )
+
+    def window(self, backend: str) -> LatencyWindow:
+        window = self._windows.get(backend)
+        if window is None:
+            with self._lock:
+                window = self._windows.setdefault(backend, LatencyWindow(self.window_size))
+        return window
+
+    def record(self, backend: str, seconds: float, ok: bool):
+        self.window(backend).record(seconds, ok)
+
+    def record_hedge(self, backend: str, won: bool):
+        """Count a hedged duplicate sent to a backend, and whether its answer was used"""
+        window = self.window(backend)
+        with window._lock:
+            window.hedges_total += 1
+            if won:
+                window.hedge_wins_total += 1
+
+    def record_hedge_skipped(self, backend: str):
+        """Count a call that was not hedged onto a backend because no hedge worker was idle"""
+        window = self.window(backend)
+        with window._lock:
+            window.hedges_skipped_total += 1
+
+    def order(self, current: str, available: Dict[str, Dict]) -> List[str]:
+        """Current backend first, then the other available ones by median latency and priority"""
+        others = [backend for backend in available if backend != current]
+
+        def rank(backend):
+            p50 = self.window(backend).percentile(50)
+            return (p50 if p50 is not None else float('inf'), available[backend].get('priority', 99))
+
+        return [current] + sorted(others, key=rank)
+
+    def hedge_delay(self, backend: str) -> float:
+        """How long to wait on a backend before sending a hedged duplicate elsewhere"""
+        window = self.window(backend)
+        if len(window) < self.min_samples:
+            return self.default_delay
+        return max(self.min_delay, window.percentile(self.hedge_percentile))
+
+    def stats(self) -> Dict[str, Dict]:
+        return {backend: window.stats() for backend, window in list(self._windows.items())}
+
+
+# Per-task p95 latency targets in milliseconds; None always takes the best model
+DEFAULT_LATENCY_TARGETS_MS = {
+    'question_generation': 2000.0,
+    'analysis': 2000.0,
+    'turn': 4000.0,
+    'identification': None,
+}
+
+
+class ModelStats:
+    """Latency, parse failures and guess outcomes for one (task, model)
+
+    Routing decisions only look at calls from the last window_seconds, so a
+    model that stopped getting traffic after being demoted is tried again once
+    its bad calls have aged out.
+    """
+
+    def __init__(self, window_size: int = 256, window_seconds: float = 300.0):
+        self.latency = LatencyWindow(window_size)
+        self.window_seconds = window_seconds
+        # (monotonic time, seconds, failed) of recent calls
+        self._recent = deque(maxlen=window_size)
+        self.parse_failures_total = 0
+        self.guesses_total = 0
+        self.correct_guesses_total = 0
+
+    def record(self, seconds: float, failed: bool):
+        with self.latency._lock:
+            self._recent.append((time.monotonic(), seconds, failed))
+
+    def recent(self) -> List[tuple]:
+        """(seconds, failed) of the calls within the window"""
+        cutoff = time.monotonic() - self.window_seconds
+        with self.latency._lock:
+            while self._recent and self._recent[0][0] < cutoff:
+                self._recent.popleft()
+            return [(seconds, failed) for _, seconds, failed in self._recent]
+
+    def failure_rate(self) -> float:
+        """Share of recent calls that failed or could not be parsed"""
+        calls = self.recent()
+        if not calls:
+            return 0.0
+        return sum(failed for _, failed in calls) / len(calls)
+
+    def recent_percentile(self, q: float) -> Optional[float]:
+        """q-th percentile (0-100) of recent latencies in seconds, or None without recent calls"""
+        samples = sorted(seconds for seconds, _ in self.recent())
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(round(q / 100.0 * (len(samples) - 1))))]
+
+    def stats(self) -> Dict:
+        p50, p95 = self.latency.percentile(50), self.latency.percentile(95)
+        return {
+            'samples': len(self.latency),
+            'p50_ms': p50 * 1000.0 if p50 is not None else None,
+            'p95_ms': p95 * 1000.0 if p95 is not None else None,
+            'recent_calls': len(self.recent()),
+            'calls_total': self.latency.calls_total,
+            'errors_total': self.latency.errors_total,
+            'parse_failures_total': self.parse_failures_total,
+            'failure_rate': self.failure_rate(),
+            'guesses_total': self.guesses_total,
+            'correct_guesses_total': self.correct_guesses_total,
+        }
+
+
+class ModelRouter:
+    """Ranks a task's candidate models: best quality among those meeting the task's latency target
+
+    Quality starts from the static preference order and moves towards the
+    measured guess success rate as feedback arrives, discounted by the rate of
+    errors and unparseable answers over the last window_seconds. Models without
+    enough recent samples are assumed to meet the target until measured, which
+    also brings a demoted model back for another try once its window empties.
+    """
+
+    def __init__(self, targets: Optional[Dict[str, Optional[float]]] = None, min_samples: int = 10,
+                 max_failure_rate: float = 0.2, prior_weight: float = 5.0, window_size: int = 256,
+                 window_seconds: float = 300.0):
+        self.targets = dict(DEFAULT_LATENCY_TARGETS_MS if targets is None else targets)
+        self.min_samples = min_samples
+        self.max_failure_rate = max_failure_rate
+        self.prior_weight = prior_weight
+        self.window_size = window_size
+        self.window_seconds = window_seconds
+        self._stats: Dict[tuple, ModelStats] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'ModelRouter':
+        """Build a router from LLM_LATENCY_TARGET_MS[_<TASK>] and LLM_ROUTING_* environment variables"""
+        targets = dict(DEFAULT_LATENCY_TARGETS_MS)
+        for task in targets:
+            for key in (f'LLM_LATENCY_TARGET_MS_{task.upper()}', 'LLM_LATENCY_TARGET_MS'):
+                value = os.getenv(key)
+                if value:
+                    # 0 or a negative value disables the target for the task
+                    targets[task] = float(value) if float(value) > 0 else None
+                    break
+        return cls(
+            targets,
+            min_samples=int(os.getenv('LLM_ROUTING_MIN_SAMPLES', '10')),
+            max_failure_rate=float(os.getenv('LLM_ROUTING_MAX_FAILURE_RATE', '0.2')),
+            window_seconds=float(os.getenv('LLM_ROUTING_WINDOW_SECONDS', '300')),
+        )
+
+    def model_stats(self, task: str, model: str) -> ModelStats:
+        key = (task, model)
+        stats = self._stats.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(key, ModelStats(self.window_size, self.window_seconds))
+        return stats
+
+    def record(self, task: str, model: str, seconds: float, outcome: str):
+        """Record one call; outcome is 'ok', 'parse_failure' or 'error'"""
+        stats = self.model_stats(task, model)
+        stats.latency.record(seconds, ok=outcome != 'error')
+        stats.record(seconds, failed=outcome != 'ok')
+        if outcome == 'parse_failure':
+            with stats.latency._lock:
+                stats.parse_failures_total += 1
+
+    def record_guess(self, task: str, model: str, correct: bool):
+        """Record whether a guess made with a model turned out to be right"""
+        stats = self.model_stats(task, model)
+        with stats.latency._lock:
+            stats.guesses_total += 1
+            if correct:
+                stats.correct_guesses_total += 1
+
+    def quality(self, task: str, model: str, prior: float) -> float:
+        stats = self.model_stats(task, model)
+        success = (stats.correct_guesses_total + prior * self.prior_weight) / (stats.guesses_total + self.prior_weight)
+        return success * (1.0 - stats.failure_rate())
+
+    def meets_target(self, task: str, model: str) -> bool:
+        stats = self.model_stats(task, model)
+        if len(stats.recent()) < self.min_samples:
+            return True
+        if stats.failure_rate() > self.max_failure_rate:
+            return False
+        target = self.targets.get(task)
+        return target is None or stats.recent_percentile(95) * 1000.0 <= target
+
+    def rank(self, task: str, candidates: List[str]) -> List[str]:
+        """Candidates (given in static preference order) re-ordered for a task"""
+        if len(candidates) < 2:
+            return list(candidates)
+        priors = {model: 1.0 - 0.5 * i / (len(candidates) - 1) for i, model in enumerate(candidates)}
+        by_quality = sorted(candidates, key=lambda model: -self.quality(task, model, priors[model]))
+        meeting = [model for model in by_quality if self.meets_target(task, model)]
+        # When nothing meets the target, the fastest models come first
+        missing = sorted(
+            (model for model in by_quality if model not in meeting),
+            key=lambda model: self.model_stats(task, model).recent_percentile(95) or 0.0
+        )
+        return meeting + missing
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-task latency targets and per-model counters"""
+        result = {task: {'target_ms': target, 'models': {}} for task, target in self.targets.items()}
+        for (task, model), stats in list(self._stats.items()):
+            if not stats.latency.calls_total and not stats.guesses_total:
+                continue
+            result.setdefault(task, {'target_ms': self.targets.get(task), 'models': {}})['models'][model] = stats.stats()
+        return result
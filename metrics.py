@@ -0,0 +1,250 @@
+"""Prometheus text-format metrics for the game server, served at /metrics
+
+A small in-process registry rather than a client library: counters and
+histograms with labels, plus callback metrics read from existing stats at
+scrape time. Each process keeps its own values, so scrape every worker.
+"""
+import asyncio
+import functools
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; LLM calls on CPU-only hosts can take tens of seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    """Monotonically increasing count per label set"""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}' for key, value in values
+        ]
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count per label set"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def time(self, **labels):
+        """Context manager observing the duration of its block"""
+        return _Timer(self, labels)
+
+    def counts(self) -> Dict[Tuple, int]:
+        """Observations so far per label values, in labelnames order"""
+        with self._lock:
+            return {key: sum(counts) for key, (counts, _) in self._values.items()}
+
+    def sums(self) -> Dict[Tuple, float]:
+        """Sum of observed values per label values, in labelnames order"""
+        with self._lock:
+            return {key: total for key, (_, total) in self._values.items()}
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = self.header()
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ('le',), key + (_format_value(bound),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """Single value read from a callback at scrape time; None skips the sample"""
+
+    def __init__(self, name: str, documentation: str, kind: str, callback: Callable[[], Optional[float]]):
+        super().__init__(name, documentation)
+        self.kind = kind
+        self.callback = callback
+
+    def collect(self) -> List[str]:
+        try:
+            value = self.callback()
+        except Exception:
+            value = None
+        if value is None:
+            return []
+        return self.header() + [f'{self.name} {_format_value(value)}']
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name: str, documentation: str, callback: Callable[[], Optional[float]]):
+        return self.register(CallbackMetric(name, documentation, 'gauge', callback))
+
+    def counter_callback(self, name: str, documentation: str, callback: Callable[[], Optional[float]]):
+        return self.register(CallbackMetric(name, documentation, 'counter', callback))
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'akinator_http_requests_total', 'HTTP requests by route, method and status', ('route', 'method', 'status'))
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'akinator_http_request_duration_seconds', 'HTTP request latency by route', ('route', 'method'))
+TURN_STAGE_SECONDS = REGISTRY.histogram(
+    'akinator_turn_stage_duration_seconds', 'Time spent in each stage of a turn', ('stage',))
+LLM_CALL_SECONDS = REGISTRY.histogram(
+    'akinator_llm_call_duration_seconds', 'LLM call latency by backend, model, task and outcome',
+    ('backend', 'model', 'task', 'outcome'))
+LLM_PROMPT_TOKENS = REGISTRY.histogram(
+    'akinator_llm_prompt_tokens', 'Prompt tokens per LLM call (reported by the backend or estimated)',
+    ('backend', 'model', 'task'), buckets=(32, 64, 128, 256, 512, 1024, 2048, 4096))
+LLM_COMPLETION_TOKENS = REGISTRY.histogram(
+    'akinator_llm_completion_tokens', 'Completion tokens per LLM call (reported by the backend or estimated)',
+    ('backend', 'model', 'task'), buckets=(4, 8, 16, 32, 64, 128, 256, 512))
+LLM_TIMEOUTS = REGISTRY.counter(
+    'akinator_llm_timeouts_total', 'LLM calls that hit a connect or read timeout', ('backend', 'task'))
+LLM_RATE_LIMITED = REGISTRY.counter(
+    'akinator_llm_rate_limited_total',
+    'Cloud LLM calls answered 429 or not sent because the rate limit queue was full or too slow',
+    ('backend', 'reason'))
+LLM_CIRCUIT_REJECTED = REGISTRY.counter(
+    'akinator_llm_circuit_rejected_total', 'LLM calls failed fast because the circuit was open', ('backend', 'model'))
+LLM_CIRCUIT_TRANSITIONS = REGISTRY.counter(
+    'akinator_llm_circuit_transitions_total', 'Circuit breaker state changes by new state', ('backend', 'model', 'state'))
+LLM_PARSE_FAILURES = REGISTRY.counter(
+    'akinator_llm_parse_failures_total', 'LLM replies that could not be parsed (e.g. invalid person JSON)',
+    ('backend', 'model', 'task'))
+FALLBACK_QUESTIONS = REGISTRY.counter(
+    'akinator_fallback_questions_total', 'Questions asked without the LLM, by source', ('source',))
+DUPLICATE_QUESTIONS = REGISTRY.counter(
+    'akinator_duplicate_questions_total', 'Generated questions rejected as repeats, by source', ('source',))
+GAME_QUESTIONS = REGISTRY.histogram(
+    'akinator_game_questions', 'Questions asked per finished game', buckets=(2, 4, 6, 8, 10, 12, 15, 20, 25, 30))
+
+
+def record_http_request(route: str, method: str, status: int, seconds: float):
+    HTTP_REQUESTS.inc(route=route, method=method, status=status)
+    HTTP_REQUEST_SECONDS.observe(seconds, route=route, method=method)
+
+
+def timed_stage(stage: str):
+    """Decorator recording a function's or coroutine's duration as a turn stage"""
+    def decorate(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with TURN_STAGE_SECONDS.time(stage=stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with TURN_STAGE_SECONDS.time(stage=stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,85 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+from session_store import MemorySessionStore
+
+
+class OllamaContextStore:
+    """Ollama `context` token arrays per (game, task), so later turns only send new answers
+
+    /api/generate returns the evaluated prompt and response as a `context`
+    array. Sending it back with a prompt that holds only the answers given
+    since then continues the same conversation, and Ollama only evaluates the
+    new tokens. An entry is dropped when the model changes, when earlier
+    answers no longer match, or when the context outgrows max_tokens.
+    """
+
+    def __init__(self, max_sessions: int = 10000, idle_ttl: float = 1800.0, max_tokens: int = 1536):
+        self.max_tokens = max_tokens
+        # (game_id, task) -> {'model': str, 'answers': {question_id: answer}, 'context': [int]}
+        self._store = MemorySessionStore(
+            max_sessions=max_sessions,
+            idle_ttl=idle_ttl,
+            sizeof=lambda entry: 8 * len(entry['context'])
+        )
+        self._task_names = set()
+        self.reuses = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls) -> Optional['OllamaContextStore']:
+        """Build a store from LLM_OLLAMA_CONTEXT_* environment variables, or None if disabled"""
+        if os.getenv('LLM_OLLAMA_CONTEXT_REUSE', 'true').lower() != 'true':
+            return None
+        return cls(
+            max_sessions=int(os.getenv('SESSION_MAX', '10000')),
+            idle_ttl=float(os.getenv('SESSION_TTL', '1800')),
+            max_tokens=int(os.getenv('LLM_OLLAMA_CONTEXT_MAX_TOKENS', '1536')),
+        )
+
+    def lookup(self, game_id: str, task: str, model: str, answers: Dict) -> Optional[Tuple[List[int], Dict]]:
+        """(context, answers given since it was stored), or None when the full prompt is needed"""
+        entry = self._store.get((game_id, task))
+        if entry is None:
+            self.misses += 1
+            return None
+        seen = entry['answers']
+        if (entry['model'] != model or len(entry['context']) > self.max_tokens
+                or any(question_id not in answers or answers[question_id] != answer for question_id, answer in seen.items())):
+            self.invalidate(game_id, task)
+            return None
+        new_answers = {question_id: answer for question_id, answer in answers.items() if question_id not in seen}
+        if not new_answers:
+            # Nothing to add; re-asking from the full prompt avoids repeating the last reply
+            self.misses += 1
+            return None
+        self.reuses += 1
+        return entry['context'], new_answers
+
+    def store(self, game_id: str, task: str, model: str, answers: Dict, context: Optional[List[int]]):
+        """Remember the context returned for a prompt covering answers"""
+        if not context:
+            return
+        self._task_names.add(task)
+        self._store.put((game_id, task), {'model': model, 'answers': dict(answers), 'context': list(context)})
+
+    def invalidate(self, game_id: str, task: str):
+        self._store.delete((game_id, task))
+        self.invalidations += 1
+
+    def end_game(self, game_id: str):
+        """Drop every context kept for a finished game"""
+        for task in list(self._task_names):
+            self._store.delete((game_id, task))
+
+    def stats(self) -> Dict:
+        lookups = self.reuses + self.misses
+        return {
+            'entries': len(self._store),
+            'bytes': self._store.total_bytes,
+            'reuses': self.reuses,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'reuse_rate': self.reuses / lookups if lookups else 0.0,
+        }
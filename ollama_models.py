@@ -0,0 +1,150 @@
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from llm_clients import backend_url
+
+logger = logging.getLogger(__name__)
+
+
+def parse_keep_alive(value: str) -> float:
+    """Seconds for an Ollama keep_alive value such as "30m", "1h", "300" or "-1" (forever)"""
+    match = re.fullmatch(r'\s*(-?\d+(?:\.\d+)?)\s*([smh]?)\s*', str(value))
+    if not match:
+        return 300.0
+    seconds = float(match.group(1)) * {'': 1, 's': 1, 'm': 60, 'h': 3600}[match.group(2)]
+    return float('inf') if seconds < 0 else seconds
+
+
+class ModelResidencyManager:
+    """Track which Ollama models are loaded and keep the ones we use resident
+
+    Models are loaded on demand by Ollama and evicted after keep_alive or when
+    memory runs out. Loading one takes seconds on CPU-only hosts, so the models
+    selected for each task are preloaded, every request renews keep_alive, and
+    when the memory budget cannot hold every selected model, tasks are steered
+    to a model that is already resident instead of forcing a swap.
+    """
+
+    def __init__(self, client, keep_alive: str = '30m', memory_budget: Optional[int] = None,
+                 max_resident: Optional[int] = None, preload: bool = True, load_timeout: float = 120.0):
+        self.client = client
+        self.keep_alive = keep_alive
+        self.keep_alive_seconds = parse_keep_alive(keep_alive)
+        self.memory_budget = memory_budget
+        self.max_resident = max_resident
+        self.preload_enabled = preload
+        self.load_timeout = load_timeout
+
+        self.sizes: Dict[str, int] = {}
+        # model -> time its keep_alive runs out
+        self._resident: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.preloads_total = 0
+        self.resident_fallbacks_total = 0
+
+    @classmethod
+    def from_env(cls, client) -> 'ModelResidencyManager':
+        """Build a manager from LLM_OLLAMA_* environment variables"""
+        budget_mb = os.getenv('LLM_OLLAMA_MEMORY_BUDGET_MB')
+        max_resident = os.getenv('LLM_OLLAMA_MAX_RESIDENT')
+        return cls(
+            client,
+            keep_alive=os.getenv('LLM_OLLAMA_KEEP_ALIVE', '30m'),
+            memory_budget=int(float(budget_mb) * 1024 * 1024) if budget_mb else None,
+            max_resident=int(max_resident) if max_resident else None,
+            preload=os.getenv('LLM_OLLAMA_PRELOAD', 'true').lower() == 'true',
+        )
+
+    def resident_models(self) -> List[str]:
+        now = time.time()
+        with self._lock:
+            return [model for model, expires_at in self._resident.items() if expires_at > now]
+
+    def mark_used(self, model: str):
+        """Record that a request just (re)loaded a model and renewed its keep_alive"""
+        with self._lock:
+            self._resident[model] = time.time() + self.keep_alive_seconds
+
+    def refresh(self, sizes: Optional[Dict[str, int]] = None):
+        """Update model sizes and sync the resident set with Ollama's /api/ps"""
+        if sizes is not None:
+            self.sizes = dict(sizes)
+        try:
+            response = self.client.get(backend_url('local_ollama', '/api/ps'), timeout=(2, 2))
+            if response.status_code != 200:
+                return
+            loaded = [model['name'] for model in response.json().get('models', [])]
+        except Exception as e:
+            logger.warning("Error reading resident Ollama models: %s", e)
+            return
+        now = time.time()
+        with self._lock:
+            self._resident = {
+                model: self._resident.get(model, now + self.keep_alive_seconds) for model in loaded
+            }
+
+    def _fits(self, models: Iterable[str]) -> bool:
+        models = list(dict.fromkeys(models))
+        if self.max_resident is not None and len(models) > self.max_resident:
+            return False
+        if self.memory_budget is not None and sum(self.sizes.get(model, 0) for model in models) > self.memory_budget:
+            return False
+        return True
+
+    def plan(self, models: Iterable[str]) -> List[str]:
+        """The longest prefix of models (in priority order) that fits the memory budget"""
+        pinned = []
+        for model in dict.fromkeys(models):
+            if self._fits(pinned + [model]):
+                pinned.append(model)
+        return pinned
+
+    def preload(self, models: Iterable[str]):
+        """Load the planned models ahead of the first request"""
+        if not self.preload_enabled:
+            return
+        resident = set(self.resident_models())
+        for model in self.plan(models):
+            if model in resident:
+                continue
+            try:
+                # An empty generate request loads the model without producing tokens
+                response = self.client.post(
+                    backend_url('local_ollama', '/api/generate'),
+                    json={'model': model, 'keep_alive': self.keep_alive},
+                    timeout=(2, self.load_timeout)
+                )
+                if response.status_code == 200:
+                    self.mark_used(model)
+                    self.preloads_total += 1
+                    logger.info("Preloaded Ollama model %s", model)
+            except Exception as e:
+                logger.warning("Error preloading Ollama model %s: %s", model, e)
+
+    def choose(self, candidates: List[str]) -> Optional[str]:
+        """Best candidate, unless loading it would evict a model and a resident candidate exists"""
+        if not candidates:
+            return None
+        best = candidates[0]
+        resident = self.resident_models()
+        if best in resident or self._fits(resident + [best]):
+            return best
+        for model in candidates[1:]:
+            if model in resident:
+                self.resident_fallbacks_total += 1
+                return model
+        return best
+
+    def stats(self) -> Dict:
+        return {
+            'keep_alive': self.keep_alive,
+            'memory_budget': self.memory_budget,
+            'max_resident': self.max_resident,
+            'resident': self.resident_models(),
+            'preloads_total': self.preloads_total,
+            'resident_fallbacks_total': self.resident_fallbacks_total,
+        }
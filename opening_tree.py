@@ -0,0 +1,168 @@
+"""Precomputed opening question tree.
+
+The first few levels of play are the same for everyone, so they can be explored
+offline and served without any LLM call:
+
+    python opening_tree.py --depth 4 --output opening_tree.bin
+
+The artifact is a flat binary file that is read through mmap:
+
+    header:  magic (4s) | version (H) | flags (H) | node count (I) | string blob offset (I)
+    nodes:   text offset (I) | text length (H) | yes child (i) | no child (i) | unsure child (i)
+    strings: UTF-8 question texts, deduplicated
+
+Child index -1 means the path leaves the precomputed region.
+"""
+import argparse
+import logging
+import mmap
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'AKOT'
+VERSION = 1
+HEADER = struct.Struct('<4sHHII')
+NODE = struct.Struct('<IHiii')
+
+# Branch order inside a node record
+BRANCHES = (True, False, None)
+
+
+class OpeningTree:
+    """Read-only, memory-mapped view of an opening tree artifact"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.node_count, self._strings_offset = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not an opening tree artifact (version {VERSION})")
+
+    @classmethod
+    def load(cls, path: Optional[str]) -> Optional['OpeningTree']:
+        """Open an artifact if it exists, returning None otherwise"""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            return cls(path)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning("Error loading opening tree %s: %s", path, e)
+            return None
+
+    def _node(self, index: int):
+        return NODE.unpack_from(self._map, HEADER.size + index * NODE.size)
+
+    def lookup(self, answers: Dict) -> Optional[str]:
+        """Get the precomputed next question for an answer history, or None outside the tree"""
+        if self.node_count == 0:
+            return None
+
+        node = self._node(0)
+        for question_id in range(1, len(answers) + 1):
+            if question_id not in answers:
+                return None
+            answer = answers[question_id]
+            if answer not in BRANCHES:
+                return None
+            child = node[2 + BRANCHES.index(answer)]
+            if child < 0:
+                return None
+            node = self._node(child)
+
+        text_offset, text_length = node[0], node[1]
+        if text_length == 0:
+            return None
+        start = self._strings_offset + text_offset
+        return self._map[start:start + text_length].decode('utf-8')
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def write_opening_tree(path: str, nodes: List[Dict]):
+    """Write nodes ({'question': str, 'children': {answer: index}}) as an artifact"""
+    strings = bytearray()
+    string_offsets = {}
+    records = []
+    for node in nodes:
+        text = (node.get('question') or '').encode('utf-8')[:0xFFFF]
+        if text not in string_offsets:
+            string_offsets[text] = len(strings)
+            strings.extend(text)
+        children = node.get('children', {})
+        records.append(NODE.pack(
+            string_offsets[text], len(text),
+            *(children.get(answer, -1) for answer in BRANCHES)
+        ))
+
+    strings_offset = HEADER.size + len(records) * NODE.size
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(records), strings_offset))
+        for record in records:
+            f.write(record)
+        f.write(strings)
+    os.replace(tmp_path, path)
+
+
+def build_opening_tree(llm_integration, depth: int, include_unsure: bool = False, workers: int = 4) -> List[Dict]:
+    """Explore the LLM's question tree breadth-first down to the given depth"""
+    branches = BRANCHES if include_unsure else BRANCHES[:2]
+    nodes = [{'answers': {}, 'texts': {}, 'question': None, 'children': {}}]
+    frontier = [0]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for level in range(depth + 1):
+            questions = list(executor.map(
+                lambda index: llm_integration.generate_smart_question(
+                    nodes[index]['answers'], set(nodes[index]['answers']), question_texts=nodes[index]['texts']
+                ),
+                frontier
+            ))
+
+            next_frontier = []
+            for index, question in zip(frontier, questions):
+                nodes[index]['question'] = question
+                if not question or level == depth:
+                    continue
+                question_id = len(nodes[index]['answers']) + 1
+                child_texts = {**nodes[index]['texts'], question_id: question}
+                for answer in branches:
+                    child_answers = dict(nodes[index]['answers'])
+                    child_answers[question_id] = answer
+                    nodes[index]['children'][answer] = len(nodes)
+                    next_frontier.append(len(nodes))
+                    nodes.append({'answers': child_answers, 'texts': child_texts, 'question': None, 'children': {}})
+            frontier = next_frontier
+            print(f"Level {level}: {len(questions)} questions generated")
+
+    return nodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the precomputed opening question tree")
+    parser.add_argument('--depth', type=int, default=4, help="number of answers to explore below the first question")
+    parser.add_argument('--output', default=os.getenv('OPENING_TREE_PATH', 'opening_tree.bin'))
+    parser.add_argument('--include-unsure', action='store_true', help="also explore unsure/don't know answers")
+    parser.add_argument('--workers', type=int, default=4, help="concurrent LLM requests")
+    args = parser.parse_args()
+
+    from llm_integration import LLMIntegration
+    llm_integration = LLMIntegration(background_discovery=False)
+    if llm_integration.current_llm == 'none':
+        parser.error("no LLM backend available to explore the question tree")
+
+    nodes = build_opening_tree(llm_integration, args.depth, args.include_unsure, args.workers)
+    write_opening_tree(args.output, nodes)
+    print(f"Wrote {len(nodes)} nodes to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
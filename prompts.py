@@ -0,0 +1,217 @@
+"""Prompt text, compact token-bounded answer rendering and token accounting
+
+Every task's prompt starts with the same preamble and answer list, so a
+backend that caches prompt prefixes (Ollama's KV cache, cloud prompt caching)
+can reuse them across the calls of one turn; only task-specific lines, the
+instruction and the output format follow.
+"""
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+
+from llm_cache import normalize_answer
+from question_dedup import normalize_question
+
+PREAMBLE = 'You are playing Akinator: the player thinks of a famous person and answers yes/no questions about them.'
+
+TURN_OUTPUT_FORMAT = 'Return ONLY a valid JSON object with: should_guess (true/false), confidence (0-1), person (object with name, description, image, confidence, or null), question (short yes/no question, max 10 words).'
+
+# (instruction, output format) per task, shared by every backend; both follow the answers
+TASK_PROMPTS = {
+    'question_generation': (
+        'Generate ONE short yes/no question to narrow down the person.',
+        'Return ONLY the question text.'
+    ),
+    'identification': (
+        'Identify the most likely person.',
+        'Return ONLY a valid JSON object with: name, description, image, confidence.'
+    ),
+    'analysis': (
+        'Should we make a guess now? Consider how specific the answers are and how many questions were asked.',
+        'Return ONLY a number between 0 and 1 representing confidence.'
+    ),
+    'turn': (
+        'Decide whether to guess now, name the most likely person so far, and give the next most informative '
+        'yes/no question in case we keep asking.',
+        TURN_OUTPUT_FORMAT
+    ),
+}
+
+# Local models follow the format more reliably with explicit rules and examples
+OLLAMA_OUTPUT_FORMATS = {
+    'question_generation': """RULES:
+- Question must be short (max 10 words)
+- Must be yes/no only
+- No explanations or emojis
+- Focus on distinctive traits
+
+Return ONLY the question text.""",
+    'identification': """Return ONLY a valid JSON object with: name, description, image, confidence.
+Example: {"name": "Albert Einstein", "description": "Famous physicist", "image": "https://...", "confidence": 0.9}""",
+    'turn': """Return ONLY a valid JSON object with: should_guess, confidence, person, question.
+Example: {"should_guess": false, "confidence": 0.4, "person": {"name": "Albert Einstein", "description": "Famous physicist", "image": "https://...", "confidence": 0.4}, "question": "Is this person a scientist?"}""",
+}
+
+# What to ask for when continuing a game's Ollama conversation with new answers only
+FOLLOWUP_INSTRUCTIONS = {
+    'question_generation': 'Generate the next most informative yes/no question, different from the ones you already asked.',
+    'identification': 'Identify the most likely person now.',
+    'analysis': 'Should we make a guess now?',
+    'turn': 'Questions asked so far: {asked}. Decide again whether to guess, name the most likely person and give the next question.',
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) for backends that report no usage"""
+    return (len(text) + 3) // 4
+
+
+def format_answer(answer) -> str:
+    answer = normalize_answer(answer)
+    if answer is None:
+        return 'unsure'
+    if isinstance(answer, bool):
+        return 'yes' if answer else 'no'
+    return str(answer)
+
+
+class PromptBuilder:
+    """Renders a game's answers as one compact line each, within a token budget
+
+    Over budget, answers older than the most recent recent_answers are folded
+    into one summary line of question keywords, and the oldest are dropped
+    from that summary if it is still too long.
+    """
+
+    def __init__(self, answer_tokens: int = 300, recent_answers: int = 10):
+        self.answer_tokens = answer_tokens
+        self.recent_answers = recent_answers
+
+    @classmethod
+    def from_env(cls) -> 'PromptBuilder':
+        return cls(
+            answer_tokens=int(os.getenv('PROMPT_ANSWER_TOKENS', '300')),
+            recent_answers=int(os.getenv('PROMPT_RECENT_ANSWERS', '10')),
+        )
+
+    def answer_lines(self, answers: Dict, question_texts: Optional[Dict] = None) -> str:
+        """Answer block within the token budget"""
+        question_texts = question_texts or {}
+        ordered = sorted(answers.items(), key=lambda item: str(item[0]).zfill(8))
+        lines = []
+        for question_id, answer in ordered:
+            text = question_texts.get(question_id)
+            lines.append(f"Q{question_id} {text} -> {format_answer(answer)}" if text
+                         else f"Q{question_id} -> {format_answer(answer)}")
+        if estimate_tokens('\n'.join(lines)) <= self.answer_tokens:
+            return '\n'.join(lines)
+
+        split = max(0, len(ordered) - self.recent_answers)
+        older, lines = ordered[:split], lines[split:]
+        summary = [
+            f"{' '.join(normalize_question(question_texts[question_id])) if question_texts.get(question_id) else f'Q{question_id}'}"
+            f"={format_answer(answer)}"
+            for question_id, answer in older
+        ]
+        omitted = 0
+        while True:
+            head = []
+            if summary:
+                head.append(f"Earlier: {'; '.join(summary)}")
+            if omitted:
+                head.append(f"({omitted} earlier answers omitted)")
+            block = '\n'.join(head + lines)
+            if estimate_tokens(block) <= self.answer_tokens or (not summary and len(lines) <= 1):
+                break
+            if summary:
+                summary.pop(0)
+            else:
+                lines.pop(0)
+            omitted += 1
+        return block
+
+    def context(self, task: str, answers: Dict, asked_questions: Optional[set] = None,
+                question_texts: Optional[Dict] = None, avoid: Iterable[str] = ()) -> str:
+        """Task context: the shared answer block, then the task's own lines"""
+        parts = [f"Answers:\n{self.answer_lines(answers, question_texts)}" if answers else 'Answers: none yet']
+        if task == 'turn':
+            parts.append(f"Questions asked so far: {len(asked_questions or ())}")
+        if task in ('question_generation', 'turn'):
+            parts.append(self._do_not_repeat(answers, question_texts, avoid))
+        return '\n'.join(part for part in parts if part)
+
+    def followup(self, task: str, new_answers: Dict, asked_questions: set,
+                 question_texts: Optional[Dict] = None) -> str:
+        """The answers given since the last reply in a continued Ollama conversation"""
+        new = f"New answers:\n{self.answer_lines(new_answers, question_texts)}" if new_answers else 'New answers: none'
+        return f"{new}\n\n{FOLLOWUP_INSTRUCTIONS[task].format(asked=len(asked_questions))}"
+
+    @staticmethod
+    def _do_not_repeat(answers: Dict, question_texts: Optional[Dict], avoid: Iterable[str]) -> str:
+        """Do-not-repeat instruction; answered questions are referred to rather than listed again"""
+        unanswered = [text for question_id, text in (question_texts or {}).items() if question_id not in answers]
+        texts = list(dict.fromkeys(unanswered + list(avoid)))
+        if answers and texts:
+            return f"Do not repeat or rephrase the questions above or these: {'; '.join(texts)}"
+        if answers:
+            return 'Do not repeat or rephrase the questions above.'
+        if texts:
+            return f"Already asked, do not repeat or rephrase: {'; '.join(texts)}"
+        return ''
+
+
+def request_prompt_text(body: Dict) -> str:
+    """All prompt text of an Ollama, OpenAI or Anthropic request body"""
+    if 'prompt' in body:
+        return body['prompt']
+    parts = [body.get('system', '')] + [str(message.get('content', '')) for message in body.get('messages', [])]
+    return '\n'.join(part for part in parts if part)
+
+
+def response_usage(backend: str, data: Optional[Dict]) -> Optional[Tuple[int, int]]:
+    """(prompt tokens, completion tokens) reported by a backend response, if any"""
+    if not data:
+        return None
+    if backend == 'local_ollama':
+        if 'prompt_eval_count' in data or 'eval_count' in data:
+            return int(data.get('prompt_eval_count', 0)), int(data.get('eval_count', 0))
+        return None
+    usage = data.get('usage')
+    if not usage:
+        return None
+    if backend == 'openai':
+        return int(usage.get('prompt_tokens', 0)), int(usage.get('completion_tokens', 0))
+    return int(usage.get('input_tokens', 0)), int(usage.get('output_tokens', 0))
+
+
+class TokenAccounting:
+    """Prompt and completion tokens per task, as reported by backends or estimated"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # task -> [calls, prompt tokens, completion tokens, estimated calls]
+        self._totals: Dict[str, list] = defaultdict(lambda: [0, 0, 0, 0])
+
+    def record(self, task: str, prompt_tokens: int, completion_tokens: int, estimated: bool = False):
+        with self._lock:
+            totals = self._totals[task]
+            totals[0] += 1
+            totals[1] += prompt_tokens
+            totals[2] += completion_tokens
+            totals[3] += int(estimated)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            totals = {task: list(values) for task, values in self._totals.items()}
+        return {
+            task: {
+                'calls': calls,
+                'prompt_tokens': prompt,
+                'completion_tokens': completion,
+                'avg_prompt_tokens': prompt / calls if calls else 0.0,
+                'avg_completion_tokens': completion / calls if calls else 0.0,
+                'estimated_calls': estimated,
+            }
+            for task, (calls, prompt, completion, estimated) in sorted(totals.items())
+        }
@@ -0,0 +1,132 @@
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import FrozenSet, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Leading "Is this person ..." frames carry no meaning of their own
+_FRAME = re.compile(
+    r'^(is|was|does|did|has|had|can|could|would|will|are|were)\s+'
+    r'(this|the|that|your|our)\s+(person|individual|character|celebrity|figure|man|woman)\b'
+)
+_WORD = re.compile(r'[a-z0-9]+')
+_DIGIT = re.compile(r'[0-9]')
+_STOPWORDS = {
+    'a', 'an', 'the', 'of', 'or', 'and', 'to', 'in', 'on', 'at', 'for', 'from', 'with', 'by', 'as',
+    'is', 'was', 'are', 'were', 'be', 'been', 'being', 'do', 'does', 'did', 'has', 'have', 'had',
+    'this', 'that', 'they', 'he', 'she', 'his', 'her', 'their', 'them', 'person', 'someone',
+    'any', 'ever', 'still', 'currently', 'known', 'well', 'famous', 'mainly', 'primarily', 'mostly',
+}
+
+
+def normalize_question(text: str) -> List[str]:
+    """Content words of a question, without the leading frame, stopwords and plural endings"""
+    text = _FRAME.sub('', text.lower().strip())
+    words = []
+    for word in _WORD.findall(text):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+class QuestionIndex:
+    """Near-duplicate detection for questions using hashed character n-gram vectors
+
+    Each question is reduced to its content words and embedded as a
+    normalised vector of hashed words and character n-grams, so rewordings
+    such as "Was this person American?" and "Is the person from America?"
+    land close together. A candidate is a duplicate when its cosine
+    similarity to any asked question reaches threshold. Numbers ("1900",
+    "20th") are only compared whole, and two questions that both contain
+    numbers never match unless the numbers are the same.
+    """
+
+    def __init__(self, dim: int = 2048, ngram: int = 3, threshold: float = 0.7, cache_size: int = 10000):
+        self.dim = dim
+        self.ngram = ngram
+        self.threshold = threshold
+        self.cache_size = cache_size
+        # text -> (vector, number tokens)
+        self._vectors: "OrderedDict[str, Tuple[np.ndarray, FrozenSet[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional['QuestionIndex']:
+        """Build an index from QUESTION_DEDUP_* environment variables, or None if disabled"""
+        if os.getenv('QUESTION_DEDUP_ENABLED', 'true').lower() != 'true':
+            return None
+        return cls(threshold=float(os.getenv('QUESTION_DEDUP_THRESHOLD', '0.7')))
+
+    def _embed(self, text: str) -> Tuple[np.ndarray, FrozenSet[str]]:
+        with self._lock:
+            embedded = self._vectors.get(text)
+        if embedded is not None:
+            return embedded
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        numbers = set()
+        for word in normalize_question(text):
+            vector[zlib.crc32(word.encode('utf-8')) % self.dim] += 1.0
+            if _DIGIT.search(word):
+                # 1900 and 1950 share n-grams but not meaning
+                numbers.add(word)
+                continue
+            # N-grams of the padded word match inflections such as American / America
+            padded = f' {word} '
+            for i in range(max(1, len(padded) - self.ngram + 1)):
+                vector[zlib.crc32(b'#' + padded[i:i + self.ngram].encode('utf-8')) % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+
+        embedded = (vector, frozenset(numbers))
+        with self._lock:
+            self._vectors[text] = embedded
+            if len(self._vectors) > self.cache_size:
+                self._vectors.popitem(last=False)
+        return embedded
+
+    def vector(self, text: str) -> np.ndarray:
+        """Unit-length hashed n-gram vector of a question"""
+        return self._embed(text)[0]
+
+    def _matrix(self, texts: Iterable[str]) -> Tuple[np.ndarray, List[FrozenSet[str]]]:
+        embedded = [self._embed(text) for text in texts]
+        if not embedded:
+            return np.zeros((0, self.dim), dtype=np.float32), []
+        return np.stack([vector for vector, _ in embedded]), [numbers for _, numbers in embedded]
+
+    def similarities(self, candidates: Iterable[str], asked: Iterable[str]) -> np.ndarray:
+        """Highest similarity of each candidate to any asked question"""
+        (candidates, candidate_numbers), (asked, asked_numbers) = self._matrix(candidates), self._matrix(asked)
+        if not len(candidates) or not len(asked):
+            return np.zeros(len(candidates), dtype=np.float32)
+        scores = candidates @ asked.T
+        for i, numbers in enumerate(candidate_numbers):
+            if not numbers:
+                continue
+            for j, other in enumerate(asked_numbers):
+                if other and other != numbers:
+                    scores[i, j] = 0.0
+        return scores.max(axis=1)
+
+    def duplicates(self, candidates: Iterable[str], asked: Iterable[str]) -> np.ndarray:
+        """Boolean mask of the candidates that repeat an asked question"""
+        return self.similarities(candidates, asked) >= self.threshold
+
+    def is_duplicate(self, text: str, asked: Iterable[str]) -> bool:
+        """Whether text repeats an asked question
+
+        >>> index = QuestionIndex()
+        >>> index.is_duplicate("Is the person from America?", ["Was this person American?"])
+        True
+        >>> index.is_duplicate("Was this person born before 1950?", ["Was this person born before 1900?"])
+        False
+        """
+        return bool(self.duplicates([text], asked)[0])
@@ -0,0 +1,182 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+def new_game_id() -> str:
+    """Collision-free game identifier"""
+    return uuid.uuid4().hex
+
+
+class MemorySessionStore:
+    """In-process session store with idle TTL, a session cap and byte accounting"""
+
+    def __init__(self, max_sessions: int = 10000, idle_ttl: float = 1800.0,
+                 sizeof: Optional[Callable[[Any], int]] = None):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.sizeof = sizeof or (lambda session: 0)
+
+        # game_id -> (last_access, size, session), least recently used first
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, game_id: str) -> Optional[Any]:
+        """Get a live session and refresh its idle timer"""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(game_id)
+            if entry is None:
+                return None
+            _, size, session = entry
+            self._sessions[game_id] = (now, size, session)
+            self._sessions.move_to_end(game_id)
+            return session
+
+    def put(self, game_id: str, session: Any):
+        """Store or replace a session, evicting the least recently used ones over the cap"""
+        size = self.sizeof(session)
+        now = time.time()
+        with self._lock:
+            if game_id in self._sessions:
+                self._remove(game_id)
+            self._sessions[game_id] = (now, size, session)
+            self.total_bytes += size
+            self._expire(now)
+            while len(self._sessions) > self.max_sessions:
+                self._remove(next(iter(self._sessions)))
+                self.evictions += 1
+
+    def delete(self, game_id: str):
+        with self._lock:
+            if game_id in self._sessions:
+                self._remove(game_id)
+
+    def _expire(self, now: float):
+        # Entries are ordered by last access, so expired ones are always at the front
+        while self._sessions:
+            game_id, (last_access, _, _) = next(iter(self._sessions.items()))
+            if now - last_access <= self.idle_ttl:
+                break
+            self._remove(game_id)
+            self.expirations += 1
+
+    def _remove(self, game_id: str):
+        _, size, _ = self._sessions.pop(game_id)
+        self.total_bytes -= size
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'active_sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'bytes': self.total_bytes,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class SQLiteSessionStore:
+    """Session store persisted to a local SQLite file, shared across worker processes"""
+
+    def __init__(self, path: str, serialize: Callable[[Any], Dict], deserialize: Callable[[Dict], Any],
+                 max_sessions: int = 10000, idle_ttl: float = 1800.0):
+        self.path = path
+        self.serialize = serialize
+        self.deserialize = deserialize
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.evictions = 0
+        self.expirations = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'game_id TEXT PRIMARY KEY, state TEXT NOT NULL, last_access REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)')
+
+    def get(self, game_id: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT state, last_access FROM sessions WHERE game_id = ?', (game_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.idle_ttl:
+                self._conn.execute('DELETE FROM sessions WHERE game_id = ?', (game_id,))
+                self.expirations += 1
+                return None
+            self._conn.execute('UPDATE sessions SET last_access = ? WHERE game_id = ?', (now, game_id))
+        return self.deserialize(json.loads(row[0]))
+
+    def put(self, game_id: str, session: Any):
+        state = json.dumps(self.serialize(session), separators=(',', ':'))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO sessions (game_id, state, last_access) VALUES (?, ?, ?)',
+                (game_id, state, now)
+            )
+            self.expirations += self._conn.execute(
+                'DELETE FROM sessions WHERE last_access < ?', (now - self.idle_ttl,)
+            ).rowcount
+            self.evictions += self._conn.execute(
+                'DELETE FROM sessions WHERE game_id IN ('
+                'SELECT game_id FROM sessions ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+                (self.max_sessions,)
+            ).rowcount
+
+    def delete(self, game_id: str):
+        with self._lock:
+            self._conn.execute('DELETE FROM sessions WHERE game_id = ?', (game_id,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            count, total_bytes = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(LENGTH(state)), 0) FROM sessions'
+            ).fetchone()
+        return {
+            'backend': 'sqlite',
+            'active_sessions': count,
+            'max_sessions': self.max_sessions,
+            'bytes': total_bytes,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+def create_session_store(serialize: Callable[[Any], Dict], deserialize: Callable[[Dict], Any]):
+    """Build the session store selected by SESSION_BACKEND (memory or sqlite)"""
+    max_sessions = int(os.getenv('SESSION_MAX', '10000'))
+    idle_ttl = float(os.getenv('SESSION_TTL', '1800'))
+
+    if os.getenv('SESSION_BACKEND', 'memory').lower() == 'sqlite':
+        return SQLiteSessionStore(
+            os.getenv('SESSION_DB_PATH', 'sessions.db'), serialize, deserialize,
+            max_sessions=max_sessions, idle_ttl=idle_ttl
+        )
+    return MemorySessionStore(
+        max_sessions=max_sessions, idle_ttl=idle_ttl,
+        sizeof=lambda session: len(json.dumps(serialize(session), separators=(',', ':')))
+    )
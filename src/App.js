@@ -13,6 +13,7 @@ function App() {
   const [result, setResult] = useState(null);
   const [progress, setProgress] = useState(0);
   const [error, setError] = useState(null);
+  const [feedbackSent, setFeedbackSent] = useState(false);
 
   console.log('Current gameState:', gameState);
   console.log('Current loading:', loading);
@@ -31,8 +32,7 @@ function App() {
       setCurrentQuestion(response.data.question);
       setGameData({
         game_id: response.data.game_id,
-        asked_questions: [],
-        answers: {}
+        ...response.data.game_state
       });
       setProgress(0);
       setGameState('playing');
@@ -53,6 +53,7 @@ function App() {
     try {
       console.log('Making API call to /api/answer...');
       const response = await axios.post('/api/answer', {
+        game_id: gameData.game_id,
         question_id: currentQuestion.id,
         answer: answer,
         game_state: gameData
@@ -77,8 +78,21 @@ function App() {
     }
   };
 
+  const sendFeedback = async (correct) => {
+    setFeedbackSent(true);
+    try {
+      await axios.post('/api/feedback', {
+        game_id: gameData.game_id,
+        correct: correct
+      });
+    } catch (error) {
+      console.error('Error sending feedback:', error);
+    }
+  };
+
   const resetGame = () => {
     console.log('Resetting game...');
+    setFeedbackSent(false);
     setGameState('welcome');
     setCurrentQuestion(null);
     setGameData({});
@@ -254,6 +268,30 @@ function App() {
                 Questions asked: {result.questions_asked}
               </p>
               
+              {feedbackSent ? (
+                <p style={{ color: '#666', marginBottom: '20px' }}>
+                  Thanks for the feedback!
+                </p>
+              ) : (
+                <div style={{ display: 'flex', gap: '15px', justifyContent: 'center', marginBottom: '20px' }}>
+                  <button
+                    className="btn btn-yes"
+                    onClick={() => sendFeedback(true)}
+                  >
+                    <Check size={20} />
+                    That's right
+                  </button>
+                  
+                  <button
+                    className="btn btn-no"
+                    onClick={() => sendFeedback(false)}
+                  >
+                    <X size={20} />
+                    Wrong
+                  </button>
+                </div>
+              )}
+              
               <div style={{ display: 'flex', gap: '15px', justifyContent: 'center' }}>
                 <button
                   className="btn btn-primary"